@@ -1,75 +1,257 @@
+import functools
 import logging
+import time
 from pymodbus.client import ModbusTcpClient
+from pymodbus.exceptions import ConnectionException, ModbusIOException
 from src.uilt.yaml_control.setup import get_base_url
 from src.uilt.logs_control.setup import com_logger
-import struct
+from src.com_control.plc_codec import RegisterCodec, RegisterMap
+from src.com_control.plc_capture import PLCRecorder, STATUS_OK, STATUS_MODBUS_ERROR, STATUS_LINK_ERROR
 import threading
 
 
+class PLCLinkDown(ConnectionError):
+    """Raised while the circuit breaker is open and the PLC link is being re-established"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=5.0):
+        """
+        Circuit breaker guarding the PLC link
+        :param failure_threshold: Consecutive link failures before the breaker opens
+        :param reset_timeout: Seconds the breaker stays open before a single probe request is let through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # 半开状态下只放行一个探测请求，其余请求在它有结果前直接拒绝
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a request may go out on the wire"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """The request let through ended without telling whether the link works, allow another probe"""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                com_logger.info("PLC circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.probe_in_flight = False
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    com_logger.warning(f"PLC circuit breaker opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
 
 
 class PLCConnection:
+    # Errors meaning the link itself is broken; Modbus exception responses are not included
+    LINK_ERRORS = (ConnectionException, ModbusIOException, OSError)
 
     @staticmethod
     def synchronized(func):
+        @functools.wraps(func)
         def wrapper(self, *args, **kwargs):
             with self.lock:
                 return func(self, *args, **kwargs)
         return wrapper  # 需要返回 wrapper 函数
 
     @staticmethod
-    def retry(max_attempts=3):
+    def retry(max_attempts=3, delay=0.2, backoff=2.0):
         def decorator(func):
+            @functools.wraps(func)
             def wrapper(self, *args, **kwargs):
                 attempts = 0
+                wait = delay
                 while attempts < max_attempts:
                     try:
                         return func(self, *args, **kwargs)
+                    except PLCLinkDown:
+                        # 断路器打开时直接失败，不再重试
+                        raise
                     except Exception as e:
                         attempts += 1
                         if attempts == max_attempts:
                             com_logger.error(f"Final attempt failed for {func.__name__}: {e}")
                             raise
                         com_logger.warning(f"Attempt {attempts} failed for {func.__name__}: {e}. Retrying...")
+                        time.sleep(wait)
+                        wait *= backoff
                 return None
             return wrapper
         return decorator
 
-    def __init__(self):
+    def __init__(self, host=None, port=502, unit=0, mock=False, backoff_initial=0.5, backoff_max=30.0,
+                 failure_threshold=3, reset_timeout=5.0):
         """
         PLC communication control
+        :param host: PLC address, defaults to `plc_com` in com_config.yaml (point it at PLCSimulator for offline runs)
+        :param port: Modbus TCP port
+        :param unit: Modbus unit (slave) ID sent with every request. The plant PLC has always been addressed
+                     as unit 0 (pymodbus ignored the old ``unit=1`` keyword), only change it after checking
+                     the ID the PLC actually answers to
         :param mock: Whether to enable Mock mode
+        :param backoff_initial: First reconnect delay in seconds, doubled after every failed attempt
+        :param backoff_max: Upper bound of the reconnect delay in seconds
+        :param failure_threshold: Consecutive link failures before requests fail fast
+        :param reset_timeout: Seconds before a fail-fast breaker lets a probe request through
         """
-        self.host = get_base_url("plc_com")
-        self.port = 502
-        self.mock = False
+        self.host = host or get_base_url("plc_com")
+        self.port = port
+        self.unit = unit
+        self.mock = mock
         self.client:ModbusTcpClient|None = None
         self.lock = threading.Lock()
+        self.codec = RegisterCodec(word_order="little")
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.link_lost = threading.Event()
+        self.running = False
+        self.supervisor_thread = None
+        self.recorder: PLCRecorder|None = None
 
         if not self.mock:
             print("Connecting to PLC controller...")
-            self._connect()
+            if not self._connect():
+                self.link_lost.set()
+            self._start_supervisor()
 
         com_logger.info(f"PLCConnection initialized on {self.host}:{self.port}")
 
     def _connect(self):
         """Initialize Modbus TCP connection"""
-        self.client = ModbusTcpClient(self.host, port=self.port)
+        if self.client is None:
+            self.client = ModbusTcpClient(self.host, port=self.port)
         if self.client.connect():
             print("Connected to PLC Server")
             com_logger.info("Connected to PLC Server")
-        else:
-            com_logger.error("Failed to connect to PLC Server")
+            return True
+        com_logger.error("Failed to connect to PLC Server")
+        return False
+
+    def _start_supervisor(self):
+        """Start the thread that re-establishes the link whenever it is lost"""
+        self.running = True
+        self.supervisor_thread = threading.Thread(target=self._supervise_loop, daemon=True)
+        self.supervisor_thread.start()
+
+    def _supervise_loop(self):
+        """Reconnect with exponential backoff each time a request reports the link as lost"""
+        while self.running:
+            if not self.link_lost.wait(timeout=1):
+                continue
+            wait = self.backoff_initial
+            while self.running:
+                with self.lock:
+                    try:
+                        self.client.close()
+                    except Exception:
+                        pass
+                    connected = self._connect()
+                if connected:
+                    self.link_lost.clear()
+                    self.breaker.record_success()
+                    break
+                com_logger.warning(f"PLC reconnect failed, next attempt in {wait:.1f}s")
+                time.sleep(wait)
+                wait = min(wait * 2, self.backoff_max)
+
+    @property
+    def connected(self):
+        """Whether the link is currently believed to be up"""
+        return self.mock or not self.link_lost.is_set()
+
+    def start_capture(self, path):
+        """Record every request and response with a monotonic timestamp to a binary capture file"""
+        self.stop_capture()
+        self.recorder = PLCRecorder(path)
+        com_logger.info(f"PLC capture started: {path}")
+
+    def stop_capture(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
 
+    def capture_mark(self, label):
+        """Tag the following transactions in the capture with a workflow step name"""
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.mark(label)
+
+    def _execute(self, request, *args, **kwargs):
+        """
+        Send one request through the circuit breaker
+        Link failures are counted and hand the link over to the supervisor; Modbus exception responses are returned as is.
+        """
+        if not self.breaker.allow():
+            raise PLCLinkDown(f"PLC link to {self.host}:{self.port} is down")
+        started = time.monotonic()
+        # stop_capture 可能在请求进行中把 recorder 置空
+        recorder = self.recorder
+        try:
+            result = request(*args, slave=self.unit, **kwargs)
+            if isinstance(result, ModbusIOException):
+                raise result
+        except self.LINK_ERRORS:
+            self.breaker.record_failure()
+            self.link_lost.set()
+            if recorder is not None:
+                recorder.record(request.__name__, args, None, STATUS_LINK_ERROR, started, time.monotonic() - started)
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        if recorder is not None:
+            status = STATUS_MODBUS_ERROR if result.isError() else STATUS_OK
+            recorder.record(request.__name__, args, result, status, started, time.monotonic() - started)
+        return result
+
+    @retry(max_attempts=3)
     @synchronized
+    def _read_holding_registers(self, address, count):
+        return self._execute(self.client.read_holding_registers, address, count)
+
+    @retry(max_attempts=3)
+    @synchronized
+    def _read_coils(self, address, count):
+        return self._execute(self.client.read_coils, address, count)
+
     def read_holding_registers(self, address, count):
-        """Read holding register values"""
+        """Read holding register values, retried on transient link errors"""
         if self.mock:
             com_logger.info(f"[Mock Mode] Reading {count} holding registers from address {address}")
             return [i for i in range(count)]
 
         try:
-            result = self.client.read_holding_registers(address, count)
+            result = self._read_holding_registers(address, count)
             if not result.isError():
                 com_logger.info(f"Read {count} holding registers from address {address}: {result.registers}")
                 return result.registers
@@ -88,7 +270,7 @@ class PLCConnection:
             return True
 
         try:
-            result = self.client.write_register(address, value)
+            result = self._execute(self.client.write_register, address, value)
             if not result.isError():
                 com_logger.info(f"Successfully wrote value {value} to holding register at address {address}")
                 return True
@@ -107,7 +289,7 @@ class PLCConnection:
             return True
 
         try:
-            result = self.client.write_registers(address, values)
+            result = self._execute(self.client.write_registers, address, values)
             if not result.isError():
                 com_logger.info(f"Successfully wrote values {values} to holding registers starting at address {address}")
                 return True
@@ -126,7 +308,7 @@ class PLCConnection:
             return True
 
         try:
-            result = self.client.write_coil(address, value)
+            result = self._execute(self.client.write_coil, address, value)
             if not result.isError():
                 com_logger.info(f"Successfully wrote coil {value} to address {address}")
                 return True
@@ -137,16 +319,15 @@ class PLCConnection:
             com_logger.error(f"Error in communication: {e}")
             return False
 
-    @synchronized
     def read_coils(self, address, count=1):
-        """Read coils (boolean)"""
+        """Read coils (boolean), retried on transient link errors"""
         if self.mock:
             mock_values = [True] * count
             com_logger.info(f"[Mock Mode] Reading {count} coils from address {address}: {mock_values}")
             return mock_values
 
         try:
-            result = self.client.read_coils(address, count)
+            result = self._read_coils(address, count)
             if not result.isError():
                 com_logger.info(f"Read {count} coils from address {address}: {result.bits}")
                 return result.bits
@@ -157,40 +338,57 @@ class PLCConnection:
             com_logger.error(f"Error in communication: {e}")
             return None
 
+    def read_coil(self, address):
+        """Read a single coil, False when the link is down instead of None"""
+        bits = self.read_coils(address, 1)
+        return bool(bits and bits[0])
+
     def close(self):
         """Close connection"""
+        self.running = False
+        self.stop_capture()
         if self.client:
             self.client.close()
             com_logger.info("PLC Connection closed")
 
     def float_to_registers(self, value):
-        # 使用 IEEE 754 将浮点数转换为 4 字节
-        packed = struct.pack(">f", value)
-        # 将 4 字节转换为两个 16 位整数
-        registers = struct.unpack(">HH", packed)
-        return registers
+        # IEEE 754 float32, high word first
+        return tuple(RegisterCodec("big").pack("float32", [value]))
 
     def split_dint(self,value):
         high = (value >> 16) & 0xFFFF
         low = value & 0xFFFF
         return high, low
 
-    @synchronized
-    def write_dint_register(self, address, value):
-        high, low = self.split_dint(value)
-        registers = [low, high]
+    def read_typed(self, address, dtype, count=1):
+        """
+        Read `count` values of `dtype` (int16/uint16/int32/uint32/float32/bits/string) in one block read
+        :return: List of values (str for "string"), None on communication failure
+        """
+        registers = self.read_holding_registers(address, self.codec.size(dtype, count))
+        if registers is None:
+            return None
+        return self.codec.unpack(dtype, registers, count)
 
-        if self.mock:
-            mock_values = registers
-            com_logger.info(f"[Mock Mode] Writing {registers} from address {address}: {mock_values}")
-            return mock_values
+    def write_typed(self, address, dtype, values):
+        """Encode an array of `dtype` values and write it in one block write"""
+        return self.write_registers(address, self.codec.pack(dtype, values))
 
-        response = self.client.write_registers(address=address, values=registers, unit=1)
+    def read_map(self, register_map: RegisterMap):
+        """Read every field of a RegisterMap with a single block read, None on communication failure"""
+        registers = self.read_holding_registers(register_map.start, register_map.count)
+        if registers is None:
+            return None
+        return register_map.decode(registers)
+
+    def write_dint_register(self, address, value):
+        """Write a 32-bit DINT as [low, high]"""
+        return self.write_typed(address, "int32", [value])
 
-        if response.isError():
-            print("Write failed:", response)
-        else:
-            print("Write successful!")
+    def read_dint_register(self, address):
+        """Read a 32-bit DINT stored as [low, high]"""
+        values = self.read_typed(address, "int32")
+        return values[0] if values else None
 
 if __name__ == '__main__':
     plc = PLCConnection(mock=False)
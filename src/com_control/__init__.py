@@ -1,2 +1,7 @@
 from src.com_control.PLC_com import PLCConnection
-plc = PLCConnection()
\ No newline at end of file
+from src.com_control.plc_registry import PLCRegistry
+plc_registry = PLCRegistry()
+plc = plc_registry.get("plc_com")
+from src.com_control.pump_bus import AsyncPumpBusRegistry, PumpBusRegistry
+pump_buses = PumpBusRegistry()
+async_pump_buses = AsyncPumpBusRegistry()
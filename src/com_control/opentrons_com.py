@@ -1,19 +1,25 @@
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 from src.uilt.yaml_control.setup import get_base_url
+from src.uilt.deadline_control import setup as deadline
 from src.uilt.logs_control.setup import com_logger
 
 
 class OpentronsConnection:
-    def __init__(self, mock=False):
+    def __init__(self, mock=False, pool_size=4):
         """
         Opentrons robot communication control
         :param mock: Whether to enable Mock mode
+        :param pool_size: Keep-alive connections kept open to the robot server, shared by all callers
         """
         self.host = get_base_url("robot_com")
         self.port = 31950
         self.mock = mock
         self.base_url = f"http://{self.host}:{self.port}"
+        # 复用 TCP 连接，避免每次请求重新建立连接
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
 
         com_logger.info(f"OpentronsConnection initialized on {self.base_url}")
 
@@ -23,19 +29,42 @@ class OpentronsConnection:
             com_logger.info(f"[Mock Mode] GET {endpoint} simulated response.")
             return {}
 
-        response = requests.get(f"{self.base_url}{endpoint}", headers={"Opentrons-Version": "4"})
+        response = self.session.get(f"{self.base_url}{endpoint}", headers={"Opentrons-Version": "4"},
+                                    timeout=deadline.bounded())
         if response.status_code == 200:
             return response.json()
         com_logger.error(f"GET request failed for {endpoint}: {response.json()}")
         return None
 
+    def get_conditional(self, endpoint, etag=None, params=None):
+        """
+        GET with If-None-Match
+        :return: (data, etag, changed); data is None and changed False when the server answered 304 Not Modified
+        """
+        if self.mock:
+            com_logger.info(f"[Mock Mode] GET {endpoint} simulated response.")
+            return {}, None, True
+
+        headers = {"Opentrons-Version": "4"}
+        if etag:
+            headers["If-None-Match"] = etag
+        response = self.session.get(f"{self.base_url}{endpoint}", headers=headers, params=params,
+                                    timeout=deadline.bounded())
+        if response.status_code == 304:
+            return None, etag, False
+        if response.status_code == 200:
+            return response.json(), response.headers.get("ETag"), True
+        com_logger.error(f"GET request failed for {endpoint}: {response.json()}")
+        return None, etag, False
+
     def post(self, endpoint, data):
         """Send POST request"""
         if self.mock:
             com_logger.info(f"[Mock Mode] POST {endpoint} with data {data} simulated response.")
             return {}
 
-        response = requests.post(f"{self.base_url}{endpoint}", headers={"Opentrons-Version": "4"}, json=data)
+        response = self.session.post(f"{self.base_url}{endpoint}", headers={"Opentrons-Version": "4"}, json=data,
+                                     timeout=deadline.bounded())
         if response.status_code in [200, 201]:
             return response.json()
         com_logger.error(f"POST request failed for {endpoint}: {response.json()}")
@@ -47,7 +76,8 @@ class OpentronsConnection:
             com_logger.info(f"[Mock Mode] DELETE {endpoint} simulated response.")
             return True
 
-        response = requests.delete(f"{self.base_url}{endpoint}", headers={"Opentrons-Version": "2"})
+        response = self.session.delete(f"{self.base_url}{endpoint}", headers={"Opentrons-Version": "2"},
+                                       timeout=deadline.bounded())
         if response.status_code == 200:
             return True
         com_logger.error(f"DELETE request failed for {endpoint}: {response.json()}")
@@ -55,6 +85,7 @@ class OpentronsConnection:
 
     def close(self):
         """Close connection"""
+        self.session.close()
         com_logger.info("Opentrons Connection closed.")
 
 
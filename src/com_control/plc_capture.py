@@ -0,0 +1,228 @@
+import struct
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import List
+
+from pymodbus.exceptions import ConnectionException
+
+from src.com_control.plc_codec import RegisterCodec
+from src.uilt.logs_control.setup import com_logger
+
+MAGIC = b"PLCCAP1\n"
+# monotonic time, duration, function code, status, address, item count, request words, response words
+RECORD = struct.Struct("<dfBBHHHH")
+
+FC_MARK = 0
+FC_READ_COILS = 1
+FC_READ_HOLDING_REGISTERS = 3
+FC_WRITE_COIL = 5
+FC_WRITE_REGISTER = 6
+FC_WRITE_REGISTERS = 16
+
+STATUS_OK = 0
+STATUS_MODBUS_ERROR = 1
+STATUS_LINK_ERROR = 2
+
+FUNCTION_CODES = {
+    "read_coils": FC_READ_COILS,
+    "read_holding_registers": FC_READ_HOLDING_REGISTERS,
+    "write_coil": FC_WRITE_COIL,
+    "write_register": FC_WRITE_REGISTER,
+    "write_registers": FC_WRITE_REGISTERS,
+}
+
+_codec = RegisterCodec()
+
+
+@dataclass
+class CaptureRecord:
+    timestamp: float
+    duration: float
+    function_code: int
+    status: int
+    address: int
+    count: int
+    request: List[int] = field(default_factory=list)
+    response: List[int] = field(default_factory=list)
+
+    @property
+    def label(self):
+        """Step label carried by a FC_MARK record, `count` UTF-8 bytes"""
+        raw = struct.pack(f">{len(self.request)}H", *self.request)[:self.count]
+        return raw.decode("utf-8", errors="replace")
+
+
+class PLCRecorder:
+    def __init__(self, path):
+        """
+        Append-only binary capture of Modbus transactions
+        :param path: Capture file, overwritten if it exists
+        """
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def record(self, function_name, args, result, status, started, duration):
+        """Record one client call as issued by PLCConnection._execute"""
+        fc = FUNCTION_CODES.get(function_name)
+        if fc is None:
+            return
+        address = args[0]
+        request = []
+        response = []
+        if fc == FC_READ_COILS:
+            count = args[1]
+            if status == STATUS_OK:
+                response = _codec.pack_bits(result.bits[:count])
+        elif fc == FC_READ_HOLDING_REGISTERS:
+            count = args[1]
+            if status == STATUS_OK:
+                response = list(result.registers)
+        elif fc == FC_WRITE_COIL:
+            count = 1
+            request = [int(bool(args[1]))]
+        elif fc == FC_WRITE_REGISTER:
+            count = 1
+            request = [args[1]]
+        else:
+            count = len(args[1])
+            request = list(args[1])
+        self._write(started, duration, fc, status, address, count, request, response)
+
+    def mark(self, label):
+        """Insert a step marker so transactions can be attributed to workflow steps"""
+        # 步骤名可能是中文，按 UTF-8 存储，count 为字节数
+        raw = label.encode("utf-8")[:0xFFFF]
+        padded = raw + b"\x00" * (len(raw) % 2)
+        words = list(struct.unpack(f">{len(padded) // 2}H", padded))
+        self._write(time.monotonic(), 0.0, FC_MARK, STATUS_OK, 0, len(raw), words, [])
+
+    def _write(self, started, duration, fc, status, address, count, request, response):
+        data = RECORD.pack(started, duration, fc, status, address, count, len(request), len(response))
+        data += struct.pack(f"<{len(request) + len(response)}H", *request, *response)
+        with self.lock:
+            # 停止抓包后才完成的请求不再写入
+            if self.file.closed:
+                return
+            self.file.write(data)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.close()
+        com_logger.info(f"PLC capture closed, {self.count} records written to {self.path}")
+
+
+def load_capture(path) -> List[CaptureRecord]:
+    """Read every record of a capture file"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"Not a PLC capture file: {path}")
+    records = []
+    offset = len(MAGIC)
+    while offset + RECORD.size <= len(data):
+        t, duration, fc, status, address, count, n_req, n_resp = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        words = list(struct.unpack_from(f"<{n_req + n_resp}H", data, offset))
+        offset += 2 * (n_req + n_resp)
+        records.append(CaptureRecord(t, duration, fc, status, address, count, words[:n_req], words[n_req:]))
+    return records
+
+
+def summarize(records: List[CaptureRecord]):
+    """
+    Transaction count and wire time per workflow step
+    :return: {step label: {"transactions": n, "busy_s": s, "elapsed_s": s, "by_function": {fc: n}}}
+    """
+    steps = defaultdict(lambda: {"transactions": 0, "busy_s": 0.0, "elapsed_s": 0.0, "by_function": defaultdict(int)})
+    label = "<start>"
+    step_start = records[0].timestamp if records else 0.0
+    for rec in records:
+        if rec.function_code == FC_MARK:
+            steps[label]["elapsed_s"] += rec.timestamp - step_start
+            label, step_start = rec.label, rec.timestamp
+            continue
+        step = steps[label]
+        step["transactions"] += 1
+        step["busy_s"] += rec.duration
+        step["by_function"][rec.function_code] += 1
+    if records:
+        steps[label]["elapsed_s"] += records[-1].timestamp + records[-1].duration - step_start
+    return {k: dict(v, by_function=dict(v["by_function"])) for k, v in steps.items()}
+
+
+class _ReplayResponse:
+    def __init__(self, record: CaptureRecord):
+        self.record = record
+        self.registers = record.response if record.function_code == FC_READ_HOLDING_REGISTERS else []
+        self.bits = _codec.unpack_bits(record.response) if record.function_code == FC_READ_COILS else []
+        if record.function_code == FC_READ_COILS:
+            # pymodbus pads bits to a multiple of 8
+            self.bits = self.bits[:(record.count + 7) // 8 * 8]
+
+    def isError(self):
+        return self.record.status != STATUS_OK
+
+
+class PLCReplayClient:
+    def __init__(self, path, realtime=False, strict=False):
+        """
+        Drop-in for ModbusTcpClient answering from a capture, assign it to `PLCConnection.client`
+        :param path: Capture file produced by PLCRecorder
+        :param realtime: Sleep for each recorded transaction duration and the idle gaps between them
+        :param strict: Raise instead of warning when a request does not match the recorded one
+        """
+        self.records = [r for r in load_capture(path) if r.function_code != FC_MARK]
+        self.realtime = realtime
+        self.strict = strict
+        self.position = 0
+        self.last_timestamp = None
+
+    def connect(self):
+        return True
+
+    def close(self):
+        pass
+
+    def _next(self, fc, address):
+        if self.position >= len(self.records):
+            raise ConnectionException("PLC capture exhausted")
+        rec = self.records[self.position]
+        self.position += 1
+        if rec.function_code != fc or rec.address != address:
+            msg = (f"Replay mismatch at record {self.position - 1}: expected fc {rec.function_code} "
+                   f"@ {rec.address}, got fc {fc} @ {address}")
+            if self.strict:
+                raise ValueError(msg)
+            com_logger.warning(msg)
+        if self.realtime:
+            if self.last_timestamp is not None:
+                time.sleep(max(0.0, rec.timestamp - self.last_timestamp))
+            else:
+                time.sleep(rec.duration)
+            self.last_timestamp = rec.timestamp
+        if rec.status == STATUS_LINK_ERROR:
+            raise ConnectionException("Recorded link error")
+        return _ReplayResponse(rec)
+
+    def read_coils(self, address, count=1, **kwargs):
+        return self._next(FC_READ_COILS, address)
+
+    def read_holding_registers(self, address, count=1, **kwargs):
+        return self._next(FC_READ_HOLDING_REGISTERS, address)
+
+    def write_coil(self, address, value, **kwargs):
+        return self._next(FC_WRITE_COIL, address)
+
+    def write_register(self, address, value, **kwargs):
+        return self._next(FC_WRITE_REGISTER, address)
+
+    def write_registers(self, address, values, **kwargs):
+        return self._next(FC_WRITE_REGISTERS, address)
@@ -0,0 +1,144 @@
+import struct
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+
+class RegisterCodec:
+    """
+    Pack and unpack typed values to and from 16-bit Modbus register blocks
+    Every value type is converted for a whole array in one struct call.
+    """
+    # dtype -> (struct format char, registers per value)
+    TYPES = {
+        "int16": ("h", 1),
+        "uint16": ("H", 1),
+        "int32": ("i", 2),
+        "uint32": ("I", 2),
+        "float32": ("f", 2),
+    }
+
+    def __init__(self, word_order="little"):
+        """
+        :param word_order: "little" puts the low word first (the PLC's DINT layout), "big" puts the high word first
+        """
+        if word_order not in ("little", "big"):
+            raise ValueError(f"Unsupported word order: {word_order}")
+        self.word_order = word_order
+
+    def size(self, dtype, count=1):
+        """Number of registers occupied by `count` values of `dtype`"""
+        if dtype == "bits":
+            return (count + 15) // 16
+        if dtype == "string":
+            return (count + 1) // 2
+        return self._type(dtype)[1] * count
+
+    def _type(self, dtype):
+        if dtype not in self.TYPES:
+            raise ValueError(f"Unsupported register type: {dtype}")
+        return self.TYPES[dtype]
+
+    def _swap_words(self, words: List[int]) -> List[int]:
+        """Swap each pair of words, used for both directions of a low-word-first layout"""
+        words[0::2], words[1::2] = words[1::2], words[0::2]
+        return words
+
+    def pack(self, dtype, values: Sequence) -> List[int]:
+        """Pack an array of values into register words"""
+        if dtype == "bits":
+            return self.pack_bits(values)
+        if dtype == "string":
+            return self.pack_string(values)
+        fmt, width = self._type(dtype)
+        raw = struct.pack(f">{len(values)}{fmt}", *values)
+        words = list(struct.unpack(f">{len(values) * width}H", raw))
+        if width == 2 and self.word_order == "little":
+            words = self._swap_words(words)
+        return words
+
+    def unpack(self, dtype, registers: Sequence[int], count=None) -> list:
+        """Unpack register words into an array of values"""
+        if dtype == "bits":
+            return self.unpack_bits(registers, count)
+        if dtype == "string":
+            return self.unpack_string(registers, count)
+        fmt, width = self._type(dtype)
+        words = list(registers[:len(registers) - len(registers) % width])
+        if width == 2 and self.word_order == "little":
+            words = self._swap_words(words)
+        raw = struct.pack(f">{len(words)}H", *words)
+        values = [v[0] for v in struct.iter_unpack(f">{fmt}", raw)]
+        return values if count is None else values[:count]
+
+    def pack_bits(self, bits: Sequence[bool]) -> List[int]:
+        """Pack booleans into registers, bit 0 of the first register first"""
+        words = [0] * self.size("bits", len(bits))
+        for i, bit in enumerate(bits):
+            if bit:
+                words[i // 16] |= 1 << (i % 16)
+        return words
+
+    def unpack_bits(self, registers: Sequence[int], count=None) -> List[bool]:
+        count = len(registers) * 16 if count is None else count
+        return [bool(registers[i // 16] >> (i % 16) & 1) for i in range(count)]
+
+    def pack_string(self, text: str) -> List[int]:
+        """Pack ASCII text two characters per register, padded with NUL"""
+        raw = text.encode("ascii")
+        if len(raw) % 2:
+            raw += b"\x00"
+        return list(struct.unpack(f">{len(raw) // 2}H", raw))
+
+    def unpack_string(self, registers: Sequence[int], count=None) -> str:
+        raw = struct.pack(f">{len(registers)}H", *registers)
+        if count is not None:
+            raw = raw[:count]
+        return raw.split(b"\x00", 1)[0].decode("ascii", errors="replace")
+
+
+@dataclass
+class RegisterField:
+    name: str
+    address: int
+    dtype: str
+    count: int = 1
+
+
+class RegisterMap:
+    def __init__(self, fields: Sequence[RegisterField], codec: RegisterCodec = None):
+        """
+        Typed view over a group of holding registers
+        :param fields: Fields to decode, they may leave gaps between each other
+        :param codec: Codec used for every field, defaults to low-word-first
+        """
+        self.fields = list(fields)
+        self.codec = codec or RegisterCodec()
+        self.start = min(f.address for f in self.fields)
+        self.end = max(f.address + self.codec.size(f.dtype, f.count) for f in self.fields)
+
+    @property
+    def count(self):
+        """Registers covered by one block read of the whole map"""
+        return self.end - self.start
+
+    def decode(self, registers: Sequence[int]) -> Dict[str, object]:
+        """Decode a block read starting at `self.start` into {field name: value}"""
+        values = {}
+        for f in self.fields:
+            offset = f.address - self.start
+            words = registers[offset:offset + self.codec.size(f.dtype, f.count)]
+            decoded = self.codec.unpack(f.dtype, words, f.count)
+            values[f.name] = decoded[0] if f.count == 1 and f.dtype not in ("bits", "string") else decoded
+        return values
+
+    def encode(self, values: Dict[str, object]) -> Dict[int, List[int]]:
+        """Encode {field name: value} into {start address: registers} for the given fields"""
+        blocks = {}
+        for f in self.fields:
+            if f.name not in values:
+                continue
+            value = values[f.name]
+            if f.dtype != "string" and not isinstance(value, (list, tuple)):
+                value = [value]
+            blocks[f.address] = self.codec.pack(f.dtype, value)
+        return blocks
@@ -0,0 +1,239 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Tuple
+
+from src.com_control.PLC_com import PLCConnection
+from src.uilt.deadline_control import setup as deadline
+from src.uilt.logs_control.setup import com_logger
+from src.uilt.yaml_control.setup import config, get_base_url
+
+
+class PeriodicJob:
+    def __init__(self, name, func, interval):
+        """
+        Job run on the scanner's worker threads every `interval` seconds
+        A run is skipped while the previous one is still going.
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.next_due = time.monotonic()
+        self.running = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class PLCScanner:
+    # 相距不超过该值的线圈合并为一次块读取
+    MAX_GAP = 64
+
+    def __init__(self, plc: PLCConnection, interval=0.2, workers=4):
+        """
+        Scan cycle of one PLC connection: watched coils are read in blocks once per cycle
+        :param plc: Connection scanned by this cycle
+        :param interval: Seconds between two scans
+        :param workers: Threads shared by the PLC jobs submitted to this connection
+        """
+        self.plc = plc
+        self.interval = interval
+        self.jobs = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"plc_{plc.host}")
+        self.lock = threading.Lock()
+        self.waiters: Dict[int, List[Tuple[bool, Future]]] = {}
+        self.snapshot: Dict[int, bool] = {}
+        self.scan_count = 0
+        self.wakeup = threading.Event()
+        self.periodic: List[PeriodicJob] = []
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def _ensure_thread(self):
+        # 调用方已持有 self.lock
+        if self.stopped.is_set():
+            raise RuntimeError(f"PLC scanner of {self.plc.host} is closed")
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._scan_loop, daemon=True)
+            self.thread.start()
+
+    def _blocks(self, addresses):
+        """Group sorted coil addresses into (start, count) block reads"""
+        blocks = []
+        for address in sorted(addresses):
+            if blocks and address - (blocks[-1][0] + blocks[-1][1]) < self.MAX_GAP:
+                blocks[-1][1] = address - blocks[-1][0] + 1
+            else:
+                blocks.append([address, 1])
+        return blocks
+
+    def watch_coil(self, address, value=True) -> Future:
+        """
+        Future resolved with the scan time (time.monotonic) once the coil reads `value`
+        Cancelling the future removes the watch.
+        """
+        future = Future()
+        with self.lock:
+            self.waiters.setdefault(address, []).append((bool(value), future))
+            self._ensure_thread()
+        self.wakeup.set()
+        return future
+
+    def every(self, interval, func, name=None) -> PeriodicJob:
+        """Run `func()` on the worker threads every `interval` seconds, e.g. link health checks"""
+        job = PeriodicJob(name or getattr(func, "__name__", "job"), func, interval)
+        with self.lock:
+            self.periodic.append(job)
+            self._ensure_thread()
+        self.wakeup.set()
+        return job
+
+    def _run_periodic(self):
+        now = time.monotonic()
+        with self.lock:
+            self.periodic = [job for job in self.periodic if not job.cancelled]
+            due = [job for job in self.periodic
+                   if job.next_due <= now and (job.running is None or job.running.done())]
+        for job in due:
+            job.next_due = now + job.interval
+            job.running = self.jobs.submit(self._run_job, job)
+
+    def _run_job(self, job):
+        try:
+            job.func()
+        except Exception as e:
+            com_logger.error(f"Periodic job '{job.name}' on {self.plc.host} failed: {e}")
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        """Run a PLC-bound job on the worker threads of this connection"""
+        return self.jobs.submit(deadline.propagate(func), *args, **kwargs)
+
+    def wait_coil(self, address, value=True, timeout=None):
+        """Block until the coil reads `value`, TimeoutError after `timeout` seconds or when the deadline ends"""
+        future = self.watch_coil(address, value)
+        try:
+            return deadline.wait_future(future, timeout)
+        except deadline.DeadlineExceeded:
+            future.cancel()
+            raise
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Coil {address} did not become {value} within {timeout}s")
+
+    def scan(self):
+        """Run one scan cycle"""
+        with self.lock:
+            for address in list(self.waiters):
+                self.waiters[address] = [(v, f) for v, f in self.waiters[address] if not f.done()]
+                if not self.waiters[address]:
+                    del self.waiters[address]
+            addresses = list(self.waiters)
+        now = time.monotonic()
+        # 只用本次读到的值判断等待条件，读取失败的块不能沿用上一轮的旧值
+        fresh = {}
+        for start, count in self._blocks(addresses):
+            bits = self.plc.read_coils(start, count)
+            if bits is None:
+                for address in range(start, start + count):
+                    self.snapshot.pop(address, None)
+                continue
+            for offset in range(count):
+                fresh[start + offset] = bool(bits[offset])
+        self.snapshot.update(fresh)
+        self.scan_count += 1
+        with self.lock:
+            for address, waiters in self.waiters.items():
+                if address not in fresh:
+                    continue
+                for value, future in waiters:
+                    if fresh[address] == value and not future.done():
+                        future.set_result(now)
+
+    def _scan_loop(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+            if self.periodic:
+                self._run_periodic()
+            if not self.waiters:
+                continue
+            try:
+                self.scan()
+            except Exception as e:
+                com_logger.error(f"PLC scan of {self.plc.host} failed: {e}")
+
+    def close(self, timeout=2):
+        """Stop the scan thread and the worker threads; coils still awaited fail with ConnectionError"""
+        self.stopped.set()
+        self.wakeup.set()
+        with self.lock:
+            waiters, self.waiters = self.waiters, {}
+            for job in self.periodic:
+                job.cancel()
+            self.periodic = []
+        for address, futures in waiters.items():
+            for _, future in futures:
+                if not future.done():
+                    future.set_exception(ConnectionError(f"PLC scanner of {self.plc.host} closed while waiting "
+                                                         f"for coil {address}"))
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        # 正在运行的任务执行完，排队的任务取消
+        self.jobs.shutdown(wait=False, cancel_futures=True)
+
+
+class PLCRegistry:
+    def __init__(self, settings=None):
+        """
+        Named PLC connections, each with its own socket, lock and scan cycle
+        :param settings: {name: {"base_url"/"host", "port", "unit", "scan_interval"}}, defaults to
+                         `plc_connections` in com_config.yaml
+        """
+        self.settings = settings if settings is not None else config.get("plc_connections", {})
+        self.connections: Dict[Tuple[str, bool], PLCConnection] = {}
+        self.scanners: Dict[Tuple[str, bool], PLCScanner] = {}
+        self.lock = threading.Lock()
+
+    def _create(self, name, mock):
+        options = self.settings.get(name, {})
+        host = options.get("host") or get_base_url(options.get("base_url", name))
+        plc = PLCConnection(
+            host=host,
+            port=options.get("port", 502),
+            unit=options.get("unit", 0),
+            mock=mock,
+        )
+        com_logger.info(f"Registered PLC connection '{name}' ({host}, unit {plc.unit}, mock={mock})")
+        return plc
+
+    def get(self, name="plc_com", mock=False) -> PLCConnection:
+        """
+        Connection registered under `name`; mock and real callers get separate instances, so one device in
+        Mock mode does not switch the others
+        """
+        key = (name, bool(mock))
+        with self.lock:
+            if key not in self.connections:
+                self.connections[key] = self._create(name, bool(mock))
+            return self.connections[key]
+
+    def scanner(self, name="plc_com", mock=False) -> PLCScanner:
+        """Scan cycle of the connection registered under `name`"""
+        plc = self.get(name, mock)
+        key = (name, bool(mock))
+        with self.lock:
+            if key not in self.scanners:
+                interval = self.settings.get(name, {}).get("scan_interval", 0.2)
+                self.scanners[key] = PLCScanner(plc, interval)
+            return self.scanners[key]
+
+    def close(self):
+        with self.lock:
+            for scanner in self.scanners.values():
+                scanner.close()
+            for plc in self.connections.values():
+                plc.close()
+            self.connections.clear()
+            self.scanners.clear()
@@ -0,0 +1,182 @@
+import threading
+import time
+
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusSlaveContext, ModbusServerContext
+from pymodbus.server import StartTcpServer, ServerStop
+
+from src.com_control.plc_codec import RegisterCodec
+from src.uilt.logs_control.setup import com_logger
+
+
+class _HookedBlock(ModbusSequentialDataBlock):
+    """Data block that reports every write from a client to the simulator"""
+
+    def __init__(self, size, on_write):
+        super().__init__(0, [0] * size)
+        self.on_write = on_write
+        self.internal = threading.local()
+
+    def setValues(self, address, values):
+        old = self.getValues(address, len(values))
+        super().setValues(address, values)
+        if not getattr(self.internal, "active", False):
+            self.on_write(address, old, list(values))
+
+    def set_internal(self, address, values):
+        """Write without triggering the hooks, used by the simulated PLC logic"""
+        self.internal.active = True
+        try:
+            self.setValues(address, values)
+        finally:
+            self.internal.active = False
+
+
+class PLCSimulator:
+    # 与各设备类中的地址保持一致
+    PERISTALTIC_START = 300
+    PERISTALTIC_STOP = 301
+    GEAR_START = 306
+    INJECT_HEIGHT = 307
+    PERISTALTIC_FINISH = 310
+    GEAR_FINISH = 316
+    WASHING_START = 320
+    WASTE_START = 321
+    XUANZHENG_WASTE_START = 323
+    WASHING_FINISH = 330
+    WASTE_FINISH = 331
+    XUANZHENG_WASTE_FINISH = 333
+    AUTO_SET = 500
+    AUTO_FINISH = 501
+    HEIGHT_ADDRESS = 502
+    GEAR_TIME_MS = 102
+    ROBOT_START = 1002
+    ROBOT_ERROR = 1004
+    ROBOT_FUN_NAME = 1100
+    ROBOT_FINISH = 1101
+    ROBOT_BUSY = 1111
+
+    DEFAULT_DELAYS = {
+        "peristaltic": 5.0,
+        "washing": 3.0,
+        "waste": 3.0,
+        "height": 2.0,
+        "robot": 5.0,
+        "robot_start": 0.5,
+    }
+
+    def __init__(self, host="127.0.0.1", port=5020, delays=None, time_scale=1.0):
+        """
+        Modbus TCP stand-in for the lab PLC, modelling the coils and registers used by the device classes
+        :param host: Listen address
+        :param port: Listen port
+        :param delays: Seconds before each finish bit rises, overrides DEFAULT_DELAYS per key
+        :param time_scale: Multiplier applied to every delay, including the gear-pump timer
+        """
+        self.host = host
+        self.port = port
+        self.delays = dict(self.DEFAULT_DELAYS, **(delays or {}))
+        self.time_scale = time_scale
+        self.codec = RegisterCodec(word_order="little")
+        self.coils = _HookedBlock(1200, self._on_coils)
+        self.registers = _HookedBlock(1200, self._on_registers)
+        store = ModbusSlaveContext(
+            di=ModbusSequentialDataBlock(0, [0] * 10),
+            co=self.coils,
+            hr=self.registers,
+            ir=ModbusSequentialDataBlock(0, [0] * 10),
+            zero_mode=True,
+        )
+        self.context = ModbusServerContext(slaves=store, single=True)
+        self.timers = []
+        self.server_thread = None
+        # 每次齿轮泵运行的编号，旧运行迟到的计时器不再置完成位
+        self.gear_run = 0
+        # coil -> (finish coil, delay key)
+        self.pulse_actions = {
+            self.PERISTALTIC_START: (self.PERISTALTIC_FINISH, "peristaltic"),
+            self.WASHING_START: (self.WASHING_FINISH, "washing"),
+            self.WASTE_START: (self.WASTE_FINISH, "waste"),
+            self.XUANZHENG_WASTE_START: (self.XUANZHENG_WASTE_FINISH, "waste"),
+            self.AUTO_SET: (self.AUTO_FINISH, "height"),
+        }
+
+    def _later(self, delay, func, *args):
+        timer = threading.Timer(delay * self.time_scale, func, args)
+        timer.daemon = True
+        self.timers = [t for t in self.timers if t.is_alive()]
+        self.timers.append(timer)
+        timer.start()
+
+    def _set_coil(self, address, value):
+        com_logger.debug(f"[PLC Simulator] coil {address} -> {value}")
+        self.coils.set_internal(address, [value])
+
+    def _on_coils(self, address, old, new):
+        for offset, value in enumerate(new):
+            coil = address + offset
+            if coil == self.GEAR_START and value:
+                # 启动位在上次运行后可能一直保持 1，每次写入都视为新的运行
+                self._set_coil(self.GEAR_FINISH, False)
+                continue
+            if not value or old[offset]:
+                continue  # 只响应上升沿
+            if coil in self.pulse_actions:
+                finish, key = self.pulse_actions[coil]
+                self._set_coil(finish, False)
+                self._later(self.delays[key], self._set_coil, finish, True)
+            elif coil == self.ROBOT_START:
+                self._start_robot_function()
+
+    def _on_registers(self, address, old, new):
+        written = range(address, address + len(new))
+        if self.GEAR_TIME_MS in written and self.coils.getValues(self.GEAR_START, 1)[0]:
+            time_ms = self.codec.unpack("int32", self.registers.getValues(self.GEAR_TIME_MS, 2))[0]
+            self.gear_run += 1
+            self._set_coil(self.GEAR_FINISH, False)
+            self._later(time_ms / 1000, self._gear_finished, self.gear_run)
+
+    def _gear_finished(self, run):
+        """Run timer expired: raise the finish bit and drop the start bit, like the PLC program"""
+        if run != self.gear_run:
+            return
+        self._set_coil(self.GEAR_START, False)
+        self._set_coil(self.GEAR_FINISH, True)
+
+    def _start_robot_function(self):
+        self._set_coil(self.ROBOT_FINISH, False)
+
+        def running():
+            self.registers.set_internal(self.ROBOT_BUSY, [1])
+            self._later(self.delays["robot"], finished)
+
+        def finished():
+            self.registers.set_internal(self.ROBOT_BUSY, [0])
+            self._set_coil(self.ROBOT_FINISH, True)
+
+        self._later(self.delays["robot_start"], running)
+
+    def start(self, background=True):
+        """Serve on host:port, in a daemon thread unless `background` is False"""
+        com_logger.info(f"PLC simulator listening on {self.host}:{self.port}")
+        if not background:
+            StartTcpServer(context=self.context, address=(self.host, self.port))
+            return
+        self.server_thread = threading.Thread(
+            target=StartTcpServer,
+            kwargs={"context": self.context, "address": (self.host, self.port)},
+            daemon=True,
+        )
+        self.server_thread.start()
+        time.sleep(0.5)  # 等待服务器开始监听
+
+    def stop(self):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers.clear()
+        ServerStop()
+        com_logger.info("PLC simulator stopped")
+
+
+if __name__ == '__main__':
+    simulator = PLCSimulator(host="0.0.0.0", port=5020)
+    simulator.start(background=False)
@@ -0,0 +1,298 @@
+import asyncio
+import socket
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Tuple
+
+from src.com_control.pump_protocol import FrameReader, PumpStatus, encode_command
+from src.uilt.deadline_control import setup as deadline
+from src.uilt.logs_control.setup import com_logger
+from src.uilt.yaml_control.setup import config
+
+
+class PumpBus:
+    def __init__(self, host, port, reply_timeout=5, connect_timeout=5, turnaround_s=0.005, pipeline=False,
+                 stale_window_s=0.05):
+        """
+        One RS485-over-TCP gateway shared by every pump address on its bus
+        Pumps answer with the master address '0', so a reply can only be matched to its request by order: the bus
+        keeps one request in flight and waits `turnaround_s` after each reply before the next frame. Programs still
+        run on several pumps at once, only the short command / status transactions take turns.
+        :param reply_timeout: Seconds to wait for one reply
+        :param turnaround_s: Pause after a reply before the next frame, lets the RS485 line switch direction
+        :param pipeline: Send all frames of a transaction in one payload while a single pump is attached; only for
+                         gateways that buffer frames and handle the line turnaround themselves
+        :param stale_window_s: How long to drain the socket for late replies after a timeout
+        """
+        self.host = host
+        self.port = port
+        self.reply_timeout = reply_timeout
+        self.connect_timeout = connect_timeout
+        self.turnaround_s = turnaround_s
+        self.pipeline = pipeline
+        self.stale_window_s = stale_window_s
+        self.sock = None
+        self.reader = FrameReader()
+        self.replies = deque()
+        # 超时后可能迟到的应答数，下次发送前清掉，避免被当成另一台泵的应答
+        self.stale = 0
+        self.addresses = set()
+        self.lock = threading.RLock()
+        self.last_reply_at = 0.0
+        self.transactions = 0
+
+    def attach(self, address):
+        """Register a pump address on this bus"""
+        with self.lock:
+            self.addresses.add(str(address))
+        com_logger.info(f"Pump {address} attached to bus {self.host}:{self.port} ({sorted(self.addresses)})")
+
+    @property
+    def pipelined(self):
+        """Whether several frames may be sent before the first reply: only when enabled and with a single pump"""
+        return self.pipeline and len(self.addresses) <= 1
+
+    def connect(self):
+        with self.lock:
+            if self.sock is not None:
+                return
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(self.connect_timeout)
+            sock.connect((self.host, self.port))
+            self.sock = sock
+            self.reader.clear()
+            self.replies.clear()
+            self.stale = 0
+            com_logger.info(f"Pump bus connected ({self.host}:{self.port})")
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                try:
+                    self.sock.close()
+                except OSError:
+                    pass
+                self.sock = None
+
+    def transact(self, address, commands: List[str]) -> List[PumpStatus]:
+        """Send `commands` to the pump at `address` and return one reply per command, in order"""
+        with self.lock:
+            deadline.check()
+            self.connect()
+            self._discard_stale()
+            batches = [commands] if self.pipelined else [[command] for command in commands]
+            replies = []
+            for batch in batches:
+                gap = self.turnaround_s - (time.monotonic() - self.last_reply_at)
+                if gap > 0:
+                    time.sleep(gap)
+                payload = b"".join(encode_command(address, command) for command in batch)
+                com_logger.info(f"Sending command: {payload.decode('utf-8').strip()}")
+                try:
+                    self.sock.sendall(payload)
+                except OSError:
+                    self.close()
+                    raise
+                for index in range(len(batch)):
+                    try:
+                        replies.append(self._read_response())
+                    except TimeoutError:
+                        self.stale += len(batch) - index
+                        raise
+                    except ConnectionError:
+                        self.close()
+                        raise
+                self.last_reply_at = time.monotonic()
+            self.transactions += len(batches)
+            return replies
+
+    def _discard_stale(self):
+        """Drop replies to earlier commands whose reader timed out, so they are not taken for new replies"""
+        if not self.stale:
+            return
+        self.sock.settimeout(self.stale_window_s)
+        try:
+            while self.sock.recv(256):
+                pass
+        except socket.timeout:
+            pass
+        dropped = len(self.replies) + len(self.reader.buffer)
+        self.replies.clear()
+        self.reader.clear()
+        com_logger.warning(f"Discarded {self.stale} late pump replies ({dropped} buffered)")
+        self.stale = 0
+
+    def _read_response(self) -> PumpStatus:
+        """Next framed reply, reading from the socket until one is complete"""
+        while not self.replies:
+            try:
+                # 读取超时不超过当前截止时间
+                self.sock.settimeout(deadline.bounded(self.reply_timeout))
+                data = self.sock.recv(256)
+            except socket.timeout:
+                deadline.check()
+                raise TimeoutError("Read timeout")
+            if not data:
+                raise ConnectionError("Empty response")
+            self.replies.extend(self.reader.feed(data))
+        return self.replies.popleft()
+
+
+class AsyncPumpBus:
+    def __init__(self, host, port, reply_timeout=5, connect_timeout=5, turnaround_s=0.005, pipeline=False,
+                 stale_window_s=0.05):
+        """
+        asyncio counterpart of PumpBus for one gateway, used by AsyncPumpSample
+        Same framing, ordering and pipelining rules; transactions take turns on an asyncio.Lock instead of a
+        thread lock.
+        """
+        self.host = host
+        self.port = port
+        self.reply_timeout = reply_timeout
+        self.connect_timeout = connect_timeout
+        self.turnaround_s = turnaround_s
+        self.pipeline = pipeline
+        self.stale_window_s = stale_window_s
+        self.stream_reader = None
+        self.stream_writer = None
+        self.reader = FrameReader()
+        self.replies = deque()
+        self.stale = 0
+        self.addresses = set()
+        self.lock = asyncio.Lock()
+        self.last_reply_at = 0.0
+        self.transactions = 0
+
+    def attach(self, address):
+        self.addresses.add(str(address))
+        com_logger.info(f"Pump {address} attached to async bus {self.host}:{self.port} ({sorted(self.addresses)})")
+
+    @property
+    def pipelined(self):
+        return self.pipeline and len(self.addresses) <= 1
+
+    async def connect(self):
+        if self.stream_writer is not None:
+            return
+        self.stream_reader, self.stream_writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.connect_timeout)
+        self.reader.clear()
+        self.replies.clear()
+        self.stale = 0
+        com_logger.info(f"Async pump bus connected ({self.host}:{self.port})")
+
+    async def close(self):
+        if self.stream_writer is not None:
+            self.stream_writer.close()
+            try:
+                await self.stream_writer.wait_closed()
+            except OSError:
+                pass
+            self.stream_reader = self.stream_writer = None
+
+    async def transact(self, address, commands: List[str]) -> List[PumpStatus]:
+        """Send `commands` to the pump at `address` and return one reply per command, in order"""
+        async with self.lock:
+            await self.connect()
+            await self._discard_stale()
+            batches = [commands] if self.pipelined else [[command] for command in commands]
+            replies = []
+            for batch in batches:
+                gap = self.turnaround_s - (time.monotonic() - self.last_reply_at)
+                if gap > 0:
+                    await asyncio.sleep(gap)
+                payload = b"".join(encode_command(address, command) for command in batch)
+                com_logger.info(f"Sending command: {payload.decode('utf-8').strip()}")
+                try:
+                    self.stream_writer.write(payload)
+                    await self.stream_writer.drain()
+                except OSError:
+                    await self.close()
+                    raise
+                for index in range(len(batch)):
+                    try:
+                        replies.append(await self._read_response())
+                    except TimeoutError:
+                        self.stale += len(batch) - index
+                        raise
+                    except ConnectionError:
+                        await self.close()
+                        raise
+                self.last_reply_at = time.monotonic()
+            self.transactions += len(batches)
+            return replies
+
+    async def _discard_stale(self):
+        if not self.stale:
+            return
+        try:
+            while await asyncio.wait_for(self.stream_reader.read(256), self.stale_window_s):
+                pass
+        except asyncio.TimeoutError:
+            pass
+        dropped = len(self.replies) + len(self.reader.buffer)
+        self.replies.clear()
+        self.reader.clear()
+        com_logger.warning(f"Discarded {self.stale} late pump replies ({dropped} buffered)")
+        self.stale = 0
+
+    async def _read_response(self) -> PumpStatus:
+        while not self.replies:
+            try:
+                data = await asyncio.wait_for(self.stream_reader.read(256), self.reply_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("Read timeout")
+            if not data:
+                raise ConnectionError("Empty response")
+            self.replies.extend(self.reader.feed(data))
+        return self.replies.popleft()
+
+
+class PumpBusRegistry:
+    def __init__(self, settings=None):
+        """
+        Pump buses by gateway address, so every pump on one gateway shares its connection
+        :param settings: PumpBus options, defaults to `pump_bus` in com_config.yaml
+        """
+        self.settings = settings if settings is not None else config.get("pump_bus", {})
+        self.buses: Dict[Tuple[str, int], PumpBus] = {}
+        self.lock = threading.Lock()
+
+    def get(self, host, port) -> PumpBus:
+        key = (host, int(port))
+        with self.lock:
+            if key not in self.buses:
+                self.buses[key] = PumpBus(host, int(port), **self.settings)
+            return self.buses[key]
+
+    def close(self):
+        with self.lock:
+            for bus in self.buses.values():
+                bus.close()
+            self.buses.clear()
+
+
+class AsyncPumpBusRegistry:
+    def __init__(self, settings=None):
+        """
+        AsyncPumpBus by gateway address, the asyncio counterpart of PumpBusRegistry
+        :param settings: AsyncPumpBus options, defaults to `pump_bus` in com_config.yaml
+        """
+        self.settings = settings if settings is not None else config.get("pump_bus", {})
+        self.buses: Dict[Tuple[str, int], AsyncPumpBus] = {}
+        self.lock = threading.Lock()
+
+    def get(self, host, port) -> AsyncPumpBus:
+        key = (host, int(port))
+        with self.lock:
+            if key not in self.buses:
+                self.buses[key] = AsyncPumpBus(host, int(port), **self.settings)
+            return self.buses[key]
+
+    async def close(self):
+        with self.lock:
+            buses = list(self.buses.values())
+            self.buses.clear()
+        for bus in buses:
+            await bus.close()
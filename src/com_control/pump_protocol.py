@@ -0,0 +1,191 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# 注射泵应答帧：[0xFF] '/' 地址 状态字节 数据... ETX(0x03) [CR LF]
+FRAME_START = b"/"
+FRAME_END = b"\x03"
+
+# 状态字节：bit5 置位表示空闲，低 4 位为错误码
+READY_BIT = 0x20
+ERROR_MASK = 0x0F
+
+ERROR_MESSAGES = {
+    1: "Initialization error",
+    2: "Invalid command",
+    3: "Invalid parameter in command",
+    6: "EEPROM failed",
+    7: "Pump was not initialized",
+    9: "Pump overload, please check pressure",
+    10: "Valve overload, please check valve",
+    11: "Pump moving not allowed, please check valve position",
+    12: "Unexpected error, please contact support",
+    14: "A/D transmitter error, please contact support",
+    15: "Command too long, please check command",
+}
+
+# 需要重新初始化的错误码
+REINIT_ERRORS = {7}
+
+
+def encode_command(address, command: str) -> bytes:
+    """'/1' + command + 'R\\r\\n'"""
+    return f"/{address}{command}R\r\n".encode("utf-8")
+
+
+@dataclass(frozen=True)
+class PumpStatus:
+    address: str
+    status_byte: int
+    data: str
+    raw: bytes
+
+    @property
+    def busy(self):
+        return not self.status_byte & READY_BIT
+
+    @property
+    def error_code(self):
+        return self.status_byte & ERROR_MASK
+
+    @property
+    def error(self) -> Optional[str]:
+        """Error message, None when the pump reports no error"""
+        if not self.error_code:
+            return None
+        return ERROR_MESSAGES.get(self.error_code, f"Unknown error {self.error_code}")
+
+    @property
+    def needs_init(self):
+        return self.error_code in REINIT_ERRORS
+
+
+def parse_frame(frame: bytes) -> PumpStatus:
+    """Parse one framed reply starting at '/' and ending with ETX"""
+    if len(frame) < 4 or not frame.startswith(FRAME_START) or not frame.endswith(FRAME_END):
+        raise ValueError(f"Malformed pump frame {frame!r}")
+    return PumpStatus(address=chr(frame[1]), status_byte=frame[2],
+                      data=frame[3:-1].decode("ascii", errors="replace"), raw=frame)
+
+
+class FrameReader:
+    def __init__(self, max_buffer=4096):
+        """
+        Reassembles pump replies from a TCP byte stream
+        Bytes of a partial frame stay buffered until the rest arrives; several coalesced frames are split.
+        :param max_buffer: Drop buffered bytes beyond this size when no frame start is found
+        """
+        self.buffer = bytearray()
+        self.max_buffer = max_buffer
+        self.discarded = 0
+
+    def feed(self, data: bytes) -> List[PumpStatus]:
+        """Add received bytes, returns the replies completed by them"""
+        self.buffer.extend(data)
+        frames = []
+        while True:
+            start = self.buffer.find(FRAME_START)
+            if start < 0:
+                # 没有帧头的数据（0xFF 前导、CR LF、噪声）直接丢弃
+                self.discarded += len(self.buffer)
+                self.buffer.clear()
+                break
+            if start:
+                self.discarded += start
+                del self.buffer[:start]
+            end = self.buffer.find(FRAME_END)
+            if end < 0:
+                if len(self.buffer) > self.max_buffer:
+                    self.discarded += len(self.buffer)
+                    self.buffer.clear()
+                break
+            frame = bytes(self.buffer[:end + 1])
+            del self.buffer[:end + 1]
+            try:
+                frames.append(parse_frame(frame))
+            except ValueError:
+                self.discarded += len(frame)
+        return frames
+
+    def clear(self):
+        self.buffer.clear()
+
+
+# 上电默认最高速度（脉冲/秒）与换阀时间
+DEFAULT_SPEED_PPS = 1400
+VALVE_SWITCH_S = 0.5
+INIT_S = 10.0
+
+VALVE_COMMANDS = set("IOBE")
+INIT_COMMANDS = set("ZYW")
+# 只设置参数或查询、不产生动作的指令
+NO_MOTION_COMMANDS = set("vcLSKkNhujQ?FUTR")
+
+_TOKEN = re.compile(r"([A-Za-z?])(\d*)")
+
+
+@dataclass
+class ProgramEstimate:
+    seconds: float = 0.0
+    position: int = 0
+    speed: int = DEFAULT_SPEED_PPS
+    unknown: List[str] = field(default_factory=list)
+
+
+def tokenize(command: str):
+    """'V1000A3000M500' -> [("V", 1000), ("A", 3000), ("M", 500)], operands are None when absent"""
+    return [(name, int(value) if value else None) for name, value in _TOKEN.findall(command)]
+
+
+def estimate_duration(command: str, position=0, speed=DEFAULT_SPEED_PPS,
+                      valve_switch_s=VALVE_SWITCH_S) -> ProgramEstimate:
+    """
+    Expected runtime of a pump program such as 'gV1000A11000M10000OV1000A0M10000G3I'
+    Plunger moves take |Δpulses| / V, M<n> waits n ms, valve moves `valve_switch_s`; g...G<n> runs n times.
+    Acceleration ramps are ignored, so real runs end slightly later than predicted.
+    :param position: Plunger position before the program, in pulses
+    :param speed: Top speed in effect before the program (V persists on the pump)
+    :return: Estimate with the plunger position and speed after the program; unparsed commands go to `unknown`
+    """
+    tokens = tokenize(command)
+    estimate = ProgramEstimate(position=position, speed=speed)
+    _run_tokens(tokens, estimate, valve_switch_s)
+    return estimate
+
+
+def _run_tokens(tokens, estimate: ProgramEstimate, valve_switch_s):
+    index = 0
+    while index < len(tokens):
+        name, value = tokens[index]
+        if name == "g":
+            # 找到配对的 G，循环体执行 n 次
+            depth, end = 1, index + 1
+            while end < len(tokens) and depth:
+                depth += {"g": 1, "G": -1}.get(tokens[end][0], 0)
+                end += 1
+            body = tokens[index + 1:end - 1]
+            repeat = tokens[end - 1][1] if depth == 0 else 1
+            if not repeat:
+                # G0 为无限循环，只能按一次估计
+                estimate.unknown.append("G0")
+                repeat = 1
+            for _ in range(repeat):
+                _run_tokens(body, estimate, valve_switch_s)
+            index = end
+            continue
+        if name == "V" and value:
+            estimate.speed = value
+        elif name in "APD" and value is not None:
+            target = {"A": value, "P": estimate.position + value, "D": estimate.position - value}[name]
+            estimate.seconds += abs(target - estimate.position) / max(estimate.speed, 1)
+            estimate.position = target
+        elif name == "M" and value is not None:
+            estimate.seconds += value / 1000
+        elif name in VALVE_COMMANDS:
+            estimate.seconds += valve_switch_s
+        elif name in INIT_COMMANDS:
+            estimate.seconds += INIT_S
+            estimate.position = 0
+        elif name not in NO_MOTION_COMMANDS and name != "G":
+            estimate.unknown.append(name)
+        index += 1
@@ -0,0 +1,265 @@
+import socket
+import socketserver
+import threading
+import time
+
+from src.com_control.pump_protocol import (ERROR_MASK, FRAME_END, INIT_COMMANDS, NO_MOTION_COMMANDS, READY_BIT,
+                                           VALVE_COMMANDS, tokenize)
+from src.uilt.logs_control.setup import com_logger
+
+# 状态字节基值 0x40，空闲时置 READY_BIT
+STATUS_BASE = 0x40
+
+ERR_INVALID_COMMAND = 2
+ERR_INVALID_OPERAND = 3
+ERR_NOT_INITIALIZED = 7
+ERR_COMMAND_OVERFLOW = 15
+
+
+class _ReusableTCPServer(socketserver.ThreadingTCPServer):
+    # 只对模拟器自己的 server 生效，不改标准库类上的默认值
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _Abort(Exception):
+    pass
+
+
+class SimulatedPump:
+    def __init__(self, address, max_position=11000, speed=1400, valve_switch_s=0.5, init_s=3.0, accel_s=0.1,
+                 time_scale=1.0, initialized=False, max_length=255):
+        """
+        State of one emulated syringe pump: plunger, valve, speed, error code and the running program
+        :param accel_s: Extra time per plunger move for the speed ramps the duration estimator ignores
+        :param initialized: False starts like after power-up, moves fail with error 7 until Z
+        """
+        self.address = str(address)
+        self.max_position = max_position
+        self.speed = speed
+        self.valve_switch_s = valve_switch_s
+        self.init_s = init_s
+        self.accel_s = accel_s
+        self.time_scale = time_scale
+        self.initialized = initialized
+        self.max_length = max_length
+        self.valve = "I"
+        self.error = ERR_NOT_INITIALIZED if not initialized else 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.abort = threading.Event()
+        self.programs = []
+        # 当前柱塞运动，用于查询时插值位置
+        self.move = (0.0, 0, 0, 0.0)
+        self.pending_error = None
+
+    @property
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def position(self):
+        started, start, target, end = self.move
+        now = time.monotonic()
+        if now >= end or end <= started:
+            return target
+        return round(start + (target - start) * (now - started) / (end - started))
+
+    def status_byte(self):
+        return STATUS_BASE | (0 if self.busy else READY_BIT) | (self.error & ERROR_MASK)
+
+    def handle(self, command):
+        """Reply data for one received command (without the trailing R), None to stay silent"""
+        execute = command.endswith("R")
+        body = command[:-1] if execute else command
+        if body == "Q":
+            return ""
+        if body == "?":
+            return str(self.position)
+        if body == "?6":
+            return self.valve
+        if body == "T":
+            self.abort.set()
+            return ""
+        with self.lock:
+            if self.busy:
+                self.error = ERR_COMMAND_OVERFLOW
+                return ""
+            if len(body) > self.max_length:
+                self.error = ERR_COMMAND_OVERFLOW
+                return ""
+            tokens = tokenize(body)
+            unknown = [name for name, _ in tokens
+                       if name not in "APDMVgG" and name not in VALVE_COMMANDS and name not in INIT_COMMANDS
+                       and name not in NO_MOTION_COMMANDS]
+            if unknown:
+                self.error = ERR_INVALID_COMMAND
+                return ""
+            if not execute:
+                return ""
+            # 错误码保持到下一条程序；未初始化错误只有 Z 才能清除
+            if self.error != ERR_NOT_INITIALIZED or any(name in INIT_COMMANDS for name, _ in tokens):
+                self.error = 0
+            self.programs.append((time.time(), body))
+            self.abort.clear()
+            self.thread = threading.Thread(target=self._run, args=(tokens,), daemon=True)
+            self.thread.start()
+        return ""
+
+    def _sleep(self, seconds):
+        if self.abort.wait(seconds * self.time_scale):
+            raise _Abort()
+
+    def _run(self, tokens):
+        try:
+            self._execute(tokens)
+        except _Abort:
+            com_logger.info(f"[Pump Simulator] pump {self.address} program terminated")
+        except ValueError as e:
+            com_logger.warning(f"[Pump Simulator] pump {self.address} error: {e}")
+        finally:
+            # 中断时柱塞停在当前位置
+            position = self.position
+            self.move = (0.0, position, position, 0.0)
+
+    def fail(self, code, message):
+        self.error = code
+        raise ValueError(message)
+
+    def _execute(self, tokens):
+        index = 0
+        while index < len(tokens):
+            name, value = tokens[index]
+            if self.pending_error is not None:
+                code, self.pending_error = self.pending_error, None
+                self.fail(code, f"injected error {code}")
+            if name == "g":
+                depth, end = 1, index + 1
+                while end < len(tokens) and depth:
+                    depth += {"g": 1, "G": -1}.get(tokens[end][0], 0)
+                    end += 1
+                body = tokens[index + 1:end - 1]
+                repeat = tokens[end - 1][1] if depth == 0 else 1
+                count = 0
+                while not repeat or count < repeat:
+                    self._execute(body)
+                    count += 1
+                index = end
+                continue
+            if name in INIT_COMMANDS:
+                self._sleep(self.init_s)
+                self.initialized = True
+                self.error = 0
+                self.move = (0.0, 0, 0, 0.0)
+            elif name == "V" and value:
+                self.speed = value
+            elif name in VALVE_COMMANDS:
+                self._sleep(self.valve_switch_s)
+                self.valve = name
+            elif name == "M" and value is not None:
+                self._sleep(value / 1000)
+            elif name in "APD" and value is not None:
+                if not self.initialized:
+                    self.fail(ERR_NOT_INITIALIZED, "pump not initialized")
+                start = self.position
+                target = {"A": value, "P": start + value, "D": start - value}[name]
+                if not 0 <= target <= self.max_position:
+                    self.fail(ERR_INVALID_OPERAND, f"{name}{value} outside 0..{self.max_position}")
+                seconds = abs(target - start) / max(self.speed, 1) + self.accel_s
+                now = time.monotonic()
+                self.move = (now, start, target, now + seconds * self.time_scale)
+                self._sleep(seconds)
+                self.move = (0.0, target, target, 0.0)
+            index += 1
+
+
+class PumpSimulator:
+    def __init__(self, host="127.0.0.1", port=4196, addresses=(1,), reply_delay_s=0.01, **pump_options):
+        """
+        TCP stand-in for the RS485 gateway with syringe pumps behind it, speaking the '/<addr><cmd>R' protocol
+        Replies are framed like the real pump (0xFF '/0' status data ETX CR LF); busy and error codes follow the
+        pump's status byte, so PumpSample timing and re-init recovery can be benchmarked offline.
+        :param addresses: Pump addresses on the emulated bus; frames to other addresses get no reply
+        :param reply_delay_s: Delay before each reply, like the serial round trip through the gateway
+        :param pump_options: Passed to every SimulatedPump, e.g. time_scale, accel_s, initialized; keep time_scale at
+                             1 when benchmarking sync, the driver's duration prediction assumes real time
+        """
+        self.host = host
+        self.port = port
+        self.reply_delay_s = reply_delay_s
+        self.pumps = {str(address): SimulatedPump(address, **pump_options) for address in addresses}
+        self.frames = 0
+        self.server = None
+        self.server_thread = None
+
+    def inject_error(self, address, code):
+        """Fail the next executed step of pump `address` with error `code`"""
+        self.pumps[str(address)].pending_error = code
+
+    def power_cycle(self, address):
+        """Forget the initialization of pump `address`, its next moves fail with error 7"""
+        pump = self.pumps[str(address)]
+        pump.initialized = False
+        pump.error = ERR_NOT_INITIALIZED
+
+    def reply_for(self, line: str):
+        """Framed reply bytes for one request line, None when no pump answers"""
+        if not line.startswith("/") or len(line) < 3:
+            return None
+        pump = self.pumps.get(line[1])
+        if pump is None:
+            return None
+        data = pump.handle(line[2:])
+        if data is None:
+            return None
+        return b"\xff/0" + bytes([pump.status_byte()]) + data.encode("ascii") + FRAME_END + b"\r\n"
+
+    def _serve_client(self, conn: socket.socket):
+        buffer = b""
+        try:
+            while True:
+                data = conn.recv(1024)
+                if not data:
+                    break
+                buffer += data
+                lines = buffer.split(b"\r\n")
+                buffer = lines[-1]
+                for line in lines[:-1]:
+                    self.frames += 1
+                    reply = self.reply_for(line.decode("ascii", errors="replace").strip())
+                    if reply is None:
+                        continue
+                    time.sleep(self.reply_delay_s)
+                    conn.sendall(reply)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def start(self, background=True):
+        simulator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                com_logger.info(f"[Pump Simulator] client connected: {self.client_address}")
+                simulator._serve_client(self.request)
+
+        self.server = _ReusableTCPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        com_logger.info(f"Pump simulator listening on {self.host}:{self.port}, pumps {sorted(self.pumps)}")
+        if not background:
+            self.server.serve_forever()
+            return
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            com_logger.info("Pump simulator stopped")
+
+
+if __name__ == '__main__':
+    simulator = PumpSimulator(host="0.0.0.0", port=4196)
+    simulator.start(background=False)
@@ -3,104 +3,181 @@ import socket
 import threading
 import time
 import functools
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from src.com_control import plc_registry
+from src.com_control.robot_fault_policy import FaultPolicy, LinkLost, ResponseTimeout
+from src.uilt.deadline_control import setup as deadline
+from src.uilt.logs_control.setup import com_logger
+from src.uilt.yaml_control.setup import config
 
 def scenario_exception_handler(func):
+    """Apply the connection's fault policy to a failed command instead of asking on the console"""
     @functools.wraps(func)
     def wrapper(self, cmd_full, *args, **kwargs):
-        retry_count = 3
-        while True:
-            try:
-                return func(self, cmd_full, *args, **kwargs)
-            except TimeoutError as e:
-                err_msg = str(e)
-                if err_msg.startswith("❌ Timeout waiting for response:"):
-                    if hasattr(self.connect, "is_connected") and not self.is_connected():
-                        print("⚠️ Detected disconnection, attempting to reconnect...")
-                        for _ in range(retry_count):
-                            try:
-                                self.connect()
-                                print("✅ Reconnection successful")
-                            except Exception as re:
-                                print(f"Reconnection failed: {re}")
-                                time.sleep(1)
-                        print("❌ Failed to reconnect after 3 attempts, raising exception")
-                        raise
-                    print("Please select: 1. Continue (skip) 2. Retry 3. End experiment")
-                    choice = input("Enter choice (1/2/3): ").strip()
-                    if choice == "1":
-                        print("⏭️ Skipping this method")
-                        return False
-                    elif choice == "2":
-                        print("🔄 Retrying this method")
-                        return func(self, cmd_full, *args, **kwargs)
-                    else:
-                        print("🛑 Ending experiment, raising exception")
-                        raise
-                else:
-                    raise
+        return self.fault_policy.execute(cmd_full, lambda: func(self, cmd_full, *args, **kwargs),
+                                         recover=self.reconnect)
     return wrapper
 
 
-
 class RobotConnection:
-    def __init__(self, ip="192.168.1.91", port=2000, mock=False):
+    # 未被等待的消息最多保留条数
+    MAX_UNCLAIMED = 256
+    # 不带换行的残留数据等待后续数据的时间（秒）
+    FRAGMENT_TIMEOUT = 0.05
+
+    def __init__(self, ip="192.168.1.91", port=2000, mock=False, fault_policy=None, scheduler=None):
+        """
+        Line protocol connection to the ABB controller
+        :param fault_policy: FaultPolicy deciding retry/skip/abort on failures, built from robot.fault_policy by default
+        :param scheduler: PLCScanner whose cycle runs the link check, defaults to the robot_plc connection
+        Keepalive and ping settings come from the `robot` section of com_config.yaml.
+        """
+        robot_config = config.get("robot", {})
         self.ip = ip
         self.port = port
         self.mock = mock
         self.sock = None
         self.recv_msg = ""
         self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.messages = deque()
+        self.pending = {}
+        self.fault_policy = fault_policy or FaultPolicy.from_config(robot_config.get("fault_policy"))
+        self.keepalive = (robot_config.get("keepalive_idle_s", 2), robot_config.get("keepalive_interval_s", 1),
+                          robot_config.get("keepalive_count", 3))
+        self.connect_timeout_s = robot_config.get("connect_timeout_s", 5)
+        self.ping_command = robot_config.get("ping_command")
+        self.ping_interval_s = robot_config.get("ping_interval_s", 2)
+        self.ping_timeout_s = robot_config.get("ping_timeout_s", 2)
+        self.link_lost = threading.Event()
+        self.reconnect_lock = threading.Lock()
+        self.last_rx = time.monotonic()
+        self.ping_job = None
         print("mock:", self.mock)
 
         if not self.mock:
             print("Connecting to ABB controller...")
             self.connect()
+            scheduler = scheduler or plc_registry.scanner("robot_plc", mock=mock)
+            self.ping_job = scheduler.every(min(self.ping_interval_s, 1), self.ping, name=f"robot_ping_{ip}")
+
+    def _configure_socket(self, sock):
+        """TCP keepalive so a silently dead controller or cable is noticed within seconds"""
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        idle, interval, count = self.keepalive
+        if hasattr(socket, "SIO_KEEPALIVE_VALS"):
+            # Windows
+            sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, int(idle * 1000), int(interval * 1000)))
+        elif hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, max(1, int(idle)))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, int(interval)))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+        if hasattr(socket, "TCP_USER_TIMEOUT"):
+            # 发送数据迟迟得不到确认时同样按断链处理
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int((idle + interval * count) * 1000))
 
     def connect(self):
         while True:
             try:
-                self.sock = socket.socket()
-                self.sock.connect((self.ip, self.port))
+                sock = socket.socket()
+                self._configure_socket(sock)
+                sock.settimeout(self.connect_timeout_s)
+                sock.connect((self.ip, self.port))
+                sock.settimeout(None)
+                # 旧连接上没人认领的消息不属于新连接上发送的指令
+                self.clear_messages()
+                self.sock = sock
+                self.last_rx = time.monotonic()
+                self.link_lost.clear()
                 print(f"✅ Connected to ABB controller ({self.ip}:{self.port})")
-                threading.Thread(target=self.recv_thread, daemon=True).start()
+                # 每个 socket 只有一个接收线程，旧 socket 的线程发现 socket 已被替换后自行退出
+                threading.Thread(target=self.recv_thread, args=(sock,), daemon=True).start()
                 return
             except Exception as e:
                 print(f"❌ Robot connection failed: {e}, retrying...")
                 time.sleep(2)
 
-    def recv_thread(self):
+    def reconnect(self):
+        """Reconnect when the link is gone; concurrent callers wait for the same reconnection"""
+        if self.mock:
+            return
+        with self.reconnect_lock:
+            if self.is_connected():
+                return
+            print("⚠️ Detected disconnection, attempting to reconnect...")
+            self.connect()
+
+    def _on_link_lost(self, sock, reason):
+        """Mark the link down, fail every waiter at once and start reconnecting in the background"""
+        with self.cond:
+            if sock is not self.sock or self.link_lost.is_set():
+                return
+            self.link_lost.set()
+            pending, self.pending = self.pending, {}
+            self.cond.notify_all()
+        com_logger.error(f"Robot link to {self.ip}:{self.port} lost: {reason}")
+        print(f"⚠️ Robot link lost: {reason}")
+        try:
+            sock.close()
+        except OSError:
+            pass
+        for expect, futures in pending.items():
+            for future in futures:
+                future.set_exception(LinkLost(expect, f"❌ Robot link lost while waiting for {expect}: {reason}"))
+        threading.Thread(target=self.reconnect, daemon=True).start()
+
+    def ping(self):
+        """
+        Liveness check run on the shared scheduler
+        While idle, sends `ping_command` (when configured) and expects `<ping_command>ok`. During a motion the
+        controller program may not read the socket, so there keepalive alone guards the link.
+        """
+        if self.mock or self.sock is None or self.link_lost.is_set():
+            return
+        idle_s = time.monotonic() - self.last_rx
+        if not self.ping_command or self.pending or idle_s < self.ping_interval_s:
+            return
+        sock = self.sock
+        future = self.expect(self.ping_command + "ok")
+        try:
+            sock.sendall((self.ping_command + "\n").encode())
+            future.result(self.ping_timeout_s)
+        except FutureTimeoutError:
+            self._drop_waiter(future, self.ping_command + "ok")
+            self._on_link_lost(sock, f"no reply to {self.ping_command} within {self.ping_timeout_s}s")
+        except (LinkLost, OSError) as e:
+            self._on_link_lost(sock, e)
+
+    def recv_thread(self, sock):
         buffer = ""
-        retry_count = 3
-        while True:
+        while sock is self.sock:
             try:
-                data = self.sock.recv(1024)
-                if data:
-                    buffer += data.decode()
-                    if "\n" in buffer:
-                        lines = buffer.split("\n")
-                        buffer = lines[-1]
-                        for line in lines[:-1]:
-                            msg = line.strip()
-                            if msg:
-                                with self.lock:
-                                    self.recv_msg = msg
-                    else:
-                        with self.lock:
-                            self.recv_msg = data.decode()
-            except (ConnectionAbortedError, ConnectionResetError, OSError) as e:
+                # 控制器偶尔发送不带换行的消息：残留数据短时间内没有后续时整块作为一条处理
+                sock.settimeout(self.FRAGMENT_TIMEOUT if buffer else None)
+                try:
+                    data = sock.recv(1024)
+                except socket.timeout:
+                    self._dispatch(buffer.strip())
+                    buffer = ""
+                    continue
+                if not data:
+                    # 对端关闭连接
+                    self._on_link_lost(sock, "connection closed by controller")
+                    return
+                self.last_rx = time.monotonic()
+                buffer += data.decode()
+                lines = buffer.split("\n")
+                buffer = lines[-1]
+                for line in lines[:-1]:
+                    msg = line.strip()
+                    if msg:
+                        self._dispatch(msg)
+            except OSError as e:
                 print(f"⚠️ Receive thread error: {e}")
-                for i in range(retry_count):
-                    print(f"🔄 Attempt {i+1} to reconnect...")
-                    try:
-                        self.connect()
-                        print("✅ Receive thread reconnection successful")
-                        break
-                    except Exception as re:
-                        print(f"❌ Receive thread reconnection failed: {re}")
-                        time.sleep(1)
-                else:
-                    print("❌ Receive thread failed to reconnect after 3 attempts, raising exception")
-                    raise
+                self._on_link_lost(sock, e)
+                return
             except Exception as e:
                 print(f"⚠️ Receive thread other exception: {e}")
                 raise
@@ -119,9 +196,10 @@ class RobotConnection:
                 return
             except (ConnectionAbortedError, ConnectionResetError, OSError) as e:
                 print(f"⚠️ Send command error: {e}")
+                self._on_link_lost(self.sock, e)
                 print(f"🔄 Attempt {i+1} to reconnect...")
                 try:
-                    self.connect()
+                    self.reconnect()
                     print("✅ Send command reconnection successful")
                 except Exception as re:
                     print(f"❌ Send command reconnection failed: {re}")
@@ -132,40 +210,113 @@ class RobotConnection:
         print("❌ Failed to reconnect after 3 attempts, raising exception")
         raise ConnectionError("Failed to send command after 3 reconnection attempts")
 
-    def wait_for_response(self, expect, timeout_s=50):
+    def _match(self, expect, msg):
+        """Whole-message match; a fragment carrying several messages matches one of its whitespace-separated
+        tokens, never a substring, so `task_a(1)ok` cannot satisfy `task_a(11)ok`"""
+        return expect == msg or expect in msg.split()
+
+    def _dispatch(self, msg):
+        """Hand a received line to the oldest waiter expecting it, otherwise queue it"""
+        if not msg:
+            return
+        with self.cond:
+            self.recv_msg = msg
+            for expect, futures in self.pending.items():
+                if self._match(expect, msg):
+                    futures.pop(0).set_result(msg)
+                    if not futures:
+                        del self.pending[expect]
+                    break
+            else:
+                if len(self.messages) >= self.MAX_UNCLAIMED:
+                    logging.warning(f"Robot message queue full, discarding oldest: {self.messages[0]}")
+                    self.messages.popleft()
+                self.messages.append(msg)
+                print(f"message: {msg}")
+            self.cond.notify_all()
+
+    def expect(self, expect) -> Future:
+        """
+        Register interest in a message before the command that triggers it is sent
+        A matching message that is already queued resolves the future immediately.
+        """
+        future = Future()
+        if self.mock:
+            future.set_result(expect)
+            return future
+        with self.cond:
+            for msg in self.messages:
+                if self._match(expect, msg):
+                    self.messages.remove(msg)
+                    future.set_result(msg)
+                    return future
+            self.pending.setdefault(expect, []).append(future)
+        return future
+
+    def discard(self, cmd_full):
+        """
+        Drop unclaimed `ok` / `_finish` lines left by earlier sends of `cmd_full`
+        Called before registering the waiters of a new send, so a late reply to an abandoned attempt cannot
+        complete the new one immediately.
+        """
+        stale = (cmd_full + "ok", cmd_full + "_finish")
+        with self.cond:
+            kept = deque(msg for msg in self.messages if not any(self._match(expect, msg) for expect in stale))
+            dropped = len(self.messages) - len(kept)
+            self.messages = kept
+        if dropped:
+            com_logger.warning(f"Discarded {dropped} stale robot message(s) of earlier {cmd_full}")
+        return dropped
+
+    def _drop_waiter(self, future, expect):
+        with self.cond:
+            futures = self.pending.get(expect, [])
+            if future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self.pending[expect]
+
+    def wait_future(self, future: Future, expect, timeout_s=50):
+        """Wait for a future returned by `expect`"""
         if self.mock:
             print(f"[MOCK] wait_for_response: {expect}")
             return
-        timeout = time.time() + timeout_s
-        while time.time() < timeout:
-            with self.lock:
-                if expect in self.recv_msg:
-                    print(f"✅ Received acknowledgement: {expect}")
-                    if expect != self.recv_msg:
-                        logging.error('!!!!!!!!!!!!!!!! WRONG MESSAGE !!!!!!!!!!!!!!!!!!')
-                        logging.error(f'Expected: {expect}, Received: {self.recv_msg}')
-                    self.recv_msg = ''
-                    return True
-                elif self.recv_msg:
-                    print(f"message: {self.recv_msg}")
-            time.sleep(0.1)
-        raise TimeoutError(f"❌ Timeout waiting for response: {expect}")
+        try:
+            msg = deadline.wait_future(future, timeout_s)
+        except deadline.DeadlineExceeded:
+            self._drop_waiter(future, expect)
+            raise
+        except FutureTimeoutError:
+            self._drop_waiter(future, expect)
+            raise ResponseTimeout(expect, f"❌ Timeout waiting for response: {expect}")
+        print(f"✅ Received acknowledgement: {expect}")
+        if expect != msg:
+            logging.error('!!!!!!!!!!!!!!!! WRONG MESSAGE !!!!!!!!!!!!!!!!!!')
+            logging.error(f'Expected: {expect}, Received: {msg}')
+        return True
+
+    def wait_for_response(self, expect, timeout_s=50):
+        return self.wait_future(self.expect(expect), expect, timeout_s)
+
+    def clear_messages(self):
+        """Drop queued messages nobody has asked for"""
+        with self.cond:
+            self.messages.clear()
 
     def close(self):
-        if self.sock:
-            self.sock.close()
+        if self.ping_job:
+            self.ping_job.cancel()
+        # 先置空，接收线程不会把主动关闭当成断链去重连
+        sock, self.sock = self.sock, None
+        if sock:
+            sock.close()
             print("✅ Robot connection closed")
         else:
             print("⚠️ Robot connection not initialized or already closed")
 
     def is_connected(self):
-        try:
-            if self.sock is None:
-                return False
-            self.sock.send(b'')
-            return True
-        except Exception:
-            return False
+        """False once the receive thread, keepalive, a failed send or a missed ping reported the link down"""
+        return self.sock is not None and not self.link_lost.is_set()
 
     def __del__(self):
         self.close()
\ No newline at end of file
@@ -0,0 +1,232 @@
+import fnmatch
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Callable, List, Optional
+
+from src.uilt.deadline_control import setup as deadline
+from src.uilt.logs_control.setup import com_logger
+
+
+class FaultAction(Enum):
+    RETRY = "retry"
+    SKIP = "skip"
+    ABORT = "abort"
+    # 不安全的情况：通知后等待人工决定
+    HOLD = "hold"
+
+
+class ResponseTimeout(TimeoutError):
+    def __init__(self, expect, message):
+        """
+        Expected robot message did not arrive in time
+        :param expect: The awaited message, `<cmd>ok` or `<cmd>_finish`
+        """
+        super().__init__(message)
+        self.expect = expect
+
+
+class LinkLost(ConnectionError):
+    def __init__(self, expect, message):
+        """
+        Link to the controller dropped while a message was awaited
+        :param expect: The awaited message, `<cmd>ok` or `<cmd>_finish`
+        """
+        super().__init__(message)
+        self.expect = expect
+
+
+def classify(exc):
+    """Failure type of an exception raised while executing a robot command"""
+    if isinstance(exc, deadline.DeadlineExceeded):
+        # TimeoutError 属于 OSError，先于断链判断：调用方的截止时间到了，链路本身没有问题
+        return "deadline"
+    if isinstance(exc, ResponseTimeout):
+        return "finish_timeout" if exc.expect.endswith("_finish") else "ack_timeout"
+    if isinstance(exc, LinkLost) and exc.expect.endswith("_finish"):
+        # 动作已开始，结果未知，按没收到 _finish 处理，不能直接重发
+        return "finish_timeout"
+    if isinstance(exc, (ConnectionError, OSError)):
+        return "link_down"
+    return "error"
+
+
+@dataclass
+class FaultRule:
+    command: str = "*"
+    failure: str = "*"
+    action: FaultAction = FaultAction.ABORT
+    max_retries: int = 0
+    retry_delay_s: float = 1.0
+
+    def matches(self, command, failure):
+        name = command.split("(", 1)[0].strip()
+        return fnmatch.fnmatchcase(name, self.command) and fnmatch.fnmatchcase(failure, self.failure)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["action"] = FaultAction(data.get("action", "abort"))
+        return cls(**data)
+
+
+@dataclass
+class FaultIncident:
+    id: int
+    command: str
+    failure: str
+    error: Exception
+    attempt: int
+    action: FaultAction
+    rule: FaultRule
+    time: float = field(default_factory=time.time)
+    decision: Optional[FaultAction] = None
+    resolved: threading.Event = field(default_factory=threading.Event, repr=False)
+
+
+DEFAULT_RULES = [
+    # ok 没收到：控制器没有接受指令，可以重发
+    FaultRule("*", "ack_timeout", FaultAction.RETRY, max_retries=1, retry_delay_s=2),
+    FaultRule("*", "link_down", FaultAction.RETRY, max_retries=3, retry_delay_s=2),
+    FaultRule("task_shake_the_flask_py", "finish_timeout", FaultAction.SKIP),
+    # 已开始动作却没有 _finish：机器人可能停在半路或夹着瓶子，需要人工确认
+    FaultRule("*", "finish_timeout", FaultAction.HOLD),
+    FaultRule("*", "*", FaultAction.ABORT),
+]
+
+
+class FaultPolicy:
+    def __init__(self, rules: List[FaultRule] = None, hold_timeout_s=None):
+        """
+        Decides retry / skip / abort for failed robot commands without blocking on the console
+        :param rules: Rules checked in order, the first one matching command name and failure type wins
+        :param hold_timeout_s: How long a HOLD waits for `resolve` before aborting, None waits indefinitely
+        """
+        self.rules = list(rules) if rules is not None else list(DEFAULT_RULES)
+        self.hold_timeout_s = hold_timeout_s
+        self.listeners: List[Callable[[FaultIncident], None]] = []
+        self.held = {}
+        self.incidents = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, settings=None):
+        """Build from the `robot.fault_policy` section of com_config.yaml"""
+        settings = settings or {}
+        rules = settings.get("rules")
+        return cls(rules=[FaultRule.from_dict(r) for r in rules] if rules else None,
+                   hold_timeout_s=settings.get("hold_timeout_s"))
+
+    def add_listener(self, callback: Callable[[FaultIncident], None]):
+        """Call `callback(incident)` for every failure and again once it is resolved, e.g. to page an operator"""
+        self.listeners.append(callback)
+
+    def _notify(self, incident):
+        for callback in self.listeners:
+            try:
+                callback(incident)
+            except Exception as e:
+                com_logger.error(f"Robot fault listener failed: {e}")
+
+    def rule_for(self, command, failure):
+        for rule in self.rules:
+            if rule.matches(command, failure):
+                return rule
+        return FaultRule()
+
+    def decide(self, command, error, attempt=1, allow_retry=True):
+        """
+        Action for one failure, after any human decision a HOLD asked for
+        :param command: Command as sent
+        :param error: Exception raised by the command
+        :param attempt: How many times this failure type has now occurred for the command
+        :param allow_retry: False when resending could reorder motions, RETRY then escalates to HOLD
+        :return: FaultIncident whose `decision` is RETRY, SKIP or ABORT
+        """
+        failure = classify(error)
+        rule = self.rule_for(command, failure)
+        action = rule.action
+        if action == FaultAction.RETRY and not allow_retry:
+            action = FaultAction.HOLD
+        elif action == FaultAction.RETRY and attempt > rule.max_retries:
+            com_logger.warning(f"Robot command {command}: {failure} retries exhausted ({rule.max_retries})")
+            action = FaultAction.ABORT
+        incident = FaultIncident(next(self.ids), command, failure, error, attempt, action, rule)
+        with self.lock:
+            self.incidents.append(incident)
+        com_logger.warning(f"Robot fault #{incident.id} {command} [{failure}, attempt {attempt}]: "
+                           f"{error} -> {action.value}")
+        if action == FaultAction.HOLD:
+            self._hold(incident)
+        else:
+            incident.decision = action
+            incident.resolved.set()
+            self._notify(incident)
+        return incident
+
+    def _hold(self, incident):
+        with self.lock:
+            self.held[incident.id] = incident
+        print(f"🛑 机器人指令 {incident.command} 需要人工处理（事件 #{incident.id}），"
+              f"等待 resolve({incident.id}, 'retry'/'skip'/'abort')")
+        self._notify(incident)
+        # 调用方的截止时间也限制人工处理的等待时间
+        timeout = self.hold_timeout_s
+        current = deadline.current()
+        if current is not None and current.remaining() is not None:
+            timeout = current.remaining() if timeout is None else min(timeout, current.remaining())
+        if not incident.resolved.wait(timeout):
+            com_logger.error(f"Robot fault #{incident.id} not resolved within {timeout}s, aborting")
+            incident.decision = FaultAction.ABORT
+        with self.lock:
+            self.held.pop(incident.id, None)
+        self._notify(incident)
+
+    def resolve(self, incident_id, action):
+        """Human decision for a held incident, from any thread (UI, HTTP endpoint...)"""
+        action = FaultAction(action)
+        if action == FaultAction.HOLD:
+            raise ValueError("A held incident must be resolved with retry, skip or abort")
+        with self.lock:
+            incident = self.held.get(incident_id)
+        if incident is None:
+            raise KeyError(f"No held robot fault #{incident_id}")
+        com_logger.info(f"Robot fault #{incident_id} resolved by operator: {action.value}")
+        incident.decision = action
+        incident.resolved.set()
+
+    def execute(self, command, func, recover=None):
+        """
+        Run `func()` under the policy
+        :param command: Command the call executes, used for rule matching
+        :param func: Callable performing the command
+        :param recover: Called before retrying a link_down failure, e.g. reconnecting
+        :return: Result of `func`, False when the command was skipped
+        """
+        attempts = {}
+        while True:
+            try:
+                return func()
+            except deadline.DeadlineExceeded:
+                # 截止时间由调用方决定，不重试也不挂起
+                raise
+            except Exception as e:
+                # 内层已经按策略处理过的异常不再重复处理
+                if getattr(e, "fault_incident", None) is not None:
+                    raise
+                failure = classify(e)
+                attempts[failure] = attempts.get(failure, 0) + 1
+                incident = self.decide(command, e, attempts[failure])
+                if incident.decision == FaultAction.SKIP:
+                    print(f"⏭️ 跳过指令 {command}")
+                    return False
+                if incident.decision == FaultAction.ABORT:
+                    e.fault_incident = incident
+                    raise
+                print(f"🔄 重新执行指令 {command}")
+                deadline.sleep(incident.rule.retry_delay_s)
+                if failure == "link_down" and recover is not None:
+                    recover()
@@ -0,0 +1,180 @@
+import queue
+import random
+import socket
+import socketserver
+import threading
+import time
+
+from src.uilt.logs_control.setup import com_logger
+
+
+class _ReusableTCPServer(socketserver.ThreadingTCPServer):
+    # 只对模拟器自己的 server 生效，不改标准库类上的默认值
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def _split_command(cmd_full):
+    """'task_flask_move_py(15,1)' -> 'task_flask_move_py'"""
+    return cmd_full.split("(", 1)[0].strip()
+
+
+class RobotSimulator:
+    DEFAULT_DURATION_S = 5.0
+
+    def __init__(self, host="127.0.0.1", port=2001, durations=None, default_duration_s=DEFAULT_DURATION_S,
+                 ack_delay_s=0.05, time_scale=1.0, timing_db=None, faults=None, fault_rates=None, seed=None,
+                 ping_command="ping"):
+        """
+        TCP stand-in for the ABB controller speaking the task_* line protocol
+        Each line is acknowledged with `<cmd>ok`, commands run one after another and end with `<cmd>_finish`.
+        :param host: Listen address
+        :param port: Listen port
+        :param durations: {command name or full command: seconds}, full commands take precedence
+        :param default_duration_s: Duration of commands not listed in `durations` and without recorded timings
+        :param ack_delay_s: Delay before `ok`
+        :param time_scale: Multiplier applied to every delay
+        :param timing_db: RobotTimingDB to sample ok->finish durations from when a command is not in `durations`
+        :param faults: {command name or full command: "drop_ack" | "drop_finish" | "drop_command" | "disconnect"},
+                       applied once each; "drop_command" loses the line, the command neither acks nor runs
+        :param fault_rates: {"drop_ack" | "drop_finish" | "drop_command" | "disconnect": probability per command}
+        :param seed: Random seed for duration sampling and fault rates
+        :param ping_command: Line answered with `<ping_command>ok` right away, without running or finishing
+        """
+        self.host = host
+        self.port = port
+        self.durations = durations or {}
+        self.default_duration_s = default_duration_s
+        self.ack_delay_s = ack_delay_s
+        self.time_scale = time_scale
+        self.timing_db = timing_db
+        self.faults = dict(faults or {})
+        self.fault_rates = fault_rates or {}
+        self.random = random.Random(seed)
+        self.ping_command = ping_command
+        self.samples = {}
+        self.history = []
+        self.server = None
+        self.server_thread = None
+
+    def duration_for(self, cmd_full):
+        """Seconds the command takes from `ok` to `_finish`"""
+        if cmd_full in self.durations:
+            return self.durations[cmd_full]
+        name = _split_command(cmd_full)
+        if name in self.durations:
+            return self.durations[name]
+        if self.timing_db is not None:
+            if cmd_full not in self.samples:
+                self.samples[cmd_full] = (self.timing_db.durations(cmd_full, phase="ok_finish")
+                                          or self.timing_db.durations(name, phase="ok_finish"))
+            if self.samples[cmd_full]:
+                return self.random.choice(self.samples[cmd_full])
+        return self.default_duration_s
+
+    def _fault_for(self, cmd_full):
+        for key in (cmd_full, _split_command(cmd_full)):
+            if key in self.faults:
+                return self.faults.pop(key)
+        for fault, rate in self.fault_rates.items():
+            if self.random.random() < rate:
+                return fault
+        return None
+
+    def _serve_client(self, conn: socket.socket):
+        """Handle one controller session: read lines, ack them and run them in order"""
+        jobs = queue.Queue()
+        send_lock = threading.Lock()
+        closed = threading.Event()
+
+        def send(text):
+            with send_lock:
+                if not closed.is_set():
+                    conn.sendall((text + "\n").encode())
+
+        def disconnect():
+            closed.set()
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+        def runner():
+            while not closed.is_set():
+                try:
+                    cmd_full, fault = jobs.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                duration = self.duration_for(cmd_full)
+                time.sleep(duration * self.time_scale)
+                self.history.append((time.time(), cmd_full, duration, fault))
+                if fault == "drop_finish":
+                    com_logger.warning(f"[Robot Simulator] dropping {cmd_full}_finish")
+                    continue
+                send(cmd_full + "_finish")
+
+        threading.Thread(target=runner, daemon=True).start()
+        buffer = ""
+        try:
+            while not closed.is_set():
+                data = conn.recv(1024)
+                if not data:
+                    break
+                buffer += data.decode()
+                lines = buffer.split("\n")
+                buffer = lines[-1]
+                for line in lines[:-1]:
+                    cmd_full = line.strip()
+                    if not cmd_full:
+                        continue
+                    if cmd_full == self.ping_command:
+                        send(cmd_full + "ok")
+                        continue
+                    fault = self._fault_for(cmd_full)
+                    if fault == "disconnect":
+                        com_logger.warning(f"[Robot Simulator] disconnecting on {cmd_full}")
+                        disconnect()
+                        return
+                    if fault == "drop_command":
+                        com_logger.warning(f"[Robot Simulator] dropping command {cmd_full}")
+                        continue
+                    time.sleep(self.ack_delay_s * self.time_scale)
+                    if fault == "drop_ack":
+                        com_logger.warning(f"[Robot Simulator] dropping {cmd_full}ok")
+                    else:
+                        send(cmd_full + "ok")
+                    jobs.put((cmd_full, fault))
+        except OSError:
+            pass
+        finally:
+            if not closed.is_set():
+                disconnect()
+
+    def start(self, background=True):
+        simulator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                com_logger.info(f"[Robot Simulator] client connected: {self.client_address}")
+                simulator._serve_client(self.request)
+
+        self.server = _ReusableTCPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        com_logger.info(f"Robot simulator listening on {self.host}:{self.port}")
+        if not background:
+            self.server.serve_forever()
+            return
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            com_logger.info("Robot simulator stopped")
+
+
+if __name__ == '__main__':
+    simulator = RobotSimulator(host="0.0.0.0", port=2001)
+    simulator.start(background=False)
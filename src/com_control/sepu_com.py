@@ -2,6 +2,7 @@ import requests
 import json
 from datetime import datetime
 import time
+from src.uilt.deadline_control import setup as deadline
 from src.uilt.yaml_control.setup import get_base_url
 
 
@@ -28,7 +29,7 @@ class SepuCom:
         dict: Response data from request
         """
         url = f"{self.base_url}{endpoint}"
-        response = requests.post(url, json=payload)
+        response = requests.post(url, json=payload, timeout=deadline.bounded())
 
         if response.status_code == 200:
             return response.json()
@@ -55,7 +56,7 @@ class SepuCom:
         dict: Response data from request
         """
         url = f"{self.base_url}{endpoint}"
-        response = requests.get(url)
+        response = requests.get(url, timeout=deadline.bounded())
 
         if response.status_code == 200:
             return response.json()
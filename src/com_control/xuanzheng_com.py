@@ -4,6 +4,7 @@ import json
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 
+from src.uilt.deadline_control import setup as deadline
 from src.uilt.logs_control.setup import com_logger
 from src.uilt.yaml_control.setup import get_base_url
 import threading
@@ -188,6 +189,7 @@ class ConnectionController:
 
         if method == 'GET':
             for attempt in range(3):
+                deadline.check()
                 try:
                     self.driver.get(get_url)
                     body = self.driver.find_element("tag name", "body")
@@ -196,7 +198,7 @@ class ConnectionController:
                     return page_text
                 except (StaleElementReferenceException, NoSuchElementException) as e:
                     print(f"Attempt {attempt + 1} failed: {e}, retrying...")
-                    time.sleep(1)
+                    deadline.sleep(1)
 
             raise RuntimeError("Failed to retrieve page content after multiple retries")
 
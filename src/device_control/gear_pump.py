@@ -1,7 +1,10 @@
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from src.com_control import plc
+from src.com_control import plc_registry
+from src.device_control.pump_calibration import DoseFuture, PumpCalibration
+from src.uilt.deadline_control import setup as deadline
 from src.uilt.logs_control.setup import device_control_logger
 
 
@@ -12,28 +15,62 @@ class GearPump:
         :param mock: Whether to enable Mock mode
         """
         self.mock = mock
-        self.plc = plc
-        self.plc.mock = mock
+        self.plc = plc_registry.get("plc_com", mock=mock)
 
         self.REG_START_START = 306
         self.REG_TIME_S = 102
         self.PUMP_FINISH = 316
 
-    def start_pump(self,time_s):
-        time_ms = time_s * 1000
+        self.calibration = PumpCalibration("gear_pump")
+        self.scanner = plc_registry.scanner("plc_com", mock=mock)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gear_pump")
+
+    def _start_timer(self, time_s):
+        """Start the pump with a PLC run timer of `time_s` seconds"""
+        time_ms = int(time_s * 1000)
         self.plc.write_coil(self.REG_START_START, True)
-        time.sleep(1)
+        deadline.sleep(1)
         self.plc.write_dint_register(self.REG_TIME_S, time_ms)
+        deadline.sleep(2)
 
-        time.sleep(2)
+    def start_pump(self,time_s):
+        self._start_timer(time_s)
         self.pump_finish_async()
 
+    def dose(self, volume_ml) -> DoseFuture:
+        """
+        Pump `volume_ml` using the calibration table, without blocking the caller; PumpNotCalibrated without one
+        :return: DoseFuture carrying expected_finish, resolved when the finish coil rises
+        """
+        run_s = self.calibration.run_time(volume_ml)
+        future = DoseFuture(volume_ml, run_s, self.calibration.expected_duration(volume_ml))
+        device_control_logger.info(f"Gear pump dose {volume_ml} mL: run {run_s:.1f}s, expected {future.expected_s:.1f}s")
+        # 调用方的截止时间随任务传到执行线程
+        self.executor.submit(deadline.propagate(self._run_dose), future)
+        return future
+
+    def _run_dose(self, future: DoseFuture):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            started = time.monotonic()
+            self._start_timer(future.run_s)
+            finished = self.scanner.wait_coil(self.PUMP_FINISH, True, timeout=future.expected_s * 2 + 60)
+            actual_s = finished - started
+            if not self.mock:
+                self.calibration.record(future.volume_ml, future.run_s, future.expected_s, actual_s)
+            future.set_result({"volume_ml": future.volume_ml, "run_s": future.run_s,
+                               "expected_s": future.expected_s, "actual_s": actual_s})
+        except Exception as e:
+            device_control_logger.error(f"Gear pump dose {future.volume_ml} mL failed: {e}")
+            future.set_exception(e)
+
     def pump_finish_async(self):
         while True:
-            done = self.plc.read_coils(self.PUMP_FINISH)[0]
+            done = self.plc.read_coil(self.PUMP_FINISH)
             if done:
                 return True
-            time.sleep(1)
+            deadline.sleep(1)
 
 
 
@@ -1,7 +1,7 @@
 import logging
-import time
 
-from src.com_control import plc
+from src.com_control import plc_registry
+from src.uilt.deadline_control import setup as deadline
 from src.uilt.logs_control.setup import device_control_logger
 
 
@@ -12,21 +12,20 @@ class InjectHeight:
         :param mock: Whether to enable Mock mode
         """
         self.mock = mock
-        self.plc = plc
-        self.plc.mock = mock
+        self.plc = plc_registry.get("plc_com", mock=mock)
 
         self.REG_START_START = 307
 
     def down_height(self):
         print("Lowering needle down_height")
         self.plc.write_coil(self.REG_START_START, True)
-        time.sleep(1)
+        deadline.sleep(1)
 
     def up_height(self):
         print("Raising needle up_height")
 
         self.plc.write_coil(self.REG_START_START, False)
-        time.sleep(1)
+        deadline.sleep(1)
 
 
 
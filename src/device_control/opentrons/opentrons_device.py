@@ -1,5 +1,6 @@
 import time
 from src.com_control.opentrons_com import OpentronsConnection
+from src.device_control.opentrons.opentrons_runs import RunCache, RunFollower
 from src.uilt.logs_control.setup import device_control_logger
 
 class OpentronsDevice:
@@ -12,6 +13,8 @@ class OpentronsDevice:
         self.ot_com = OpentronsConnection(mock=mock)
         self.run_id = None
         self.protocol_id = None
+        # 按 run id 与 protocol id 建索引的运行缓存
+        self.runs = RunCache()
 
     def get_protocols(self):
         """ 查找现有所有的实验协议
@@ -118,13 +121,36 @@ class OpentronsDevice:
         response = self.ot_com.get("/runs")
         if response and "data" in response:
             runs = response["data"]
-            for run in runs:
-                if run.get("protocolId") == self.protocol_id:
-                    self.run_id = run.get("id")
-                    break  # 找到匹配的 run_id 后退出循环
+            self.runs.replace(runs)
+            matching = self.runs.runs_for(self.protocol_id)
+            if matching:
+                self.run_id = matching[0].get("id")
             return runs  # 返回所有运行的列表
         return []
 
+    def get_run(self, run_id=None, refresh=False):
+        """ 查询单个运行；已结束的运行直接使用缓存 """
+        run_id = run_id or self.run_id
+        if not refresh and self.runs.is_terminal(run_id):
+            return self.runs.get(run_id)
+        response = self.ot_com.get(f"/runs/{run_id}")
+        if response and "data" in response:
+            self.runs.update(response["data"])
+            return response["data"]
+        return self.runs.get(run_id)
+
+    def follow_run(self, run_id=None, on_update=None, on_command=None, timeout=None, **options):
+        """
+        等待运行结束，期间按变化情况自适应轮询
+        :param on_update: 运行状态变化时回调 on_update(run)
+        :param on_command: 每条执行完的指令回调一次 on_command(command)
+        :param timeout: 超时秒数，超时抛出 TimeoutError
+        :param options: RunFollower 参数，如 min_interval_s / max_interval_s
+        :return: 运行结束时的数据
+        """
+        follower = RunFollower(self.ot_com, run_id or self.run_id, cache=self.runs, **options)
+        return follower.follow(on_update=on_update, on_command=on_command, timeout=timeout)
+
     def start_run(self, protocol_id, labware_offsets=None, runtime_params=None, runtime_files=None):
         """ 运行指定的实验协议 """
         self.protocol_id = protocol_id
@@ -140,6 +166,7 @@ class OpentronsDevice:
         if response:
             run_id = response.get("data", {}).get("id")
             if run_id:
+                self.runs.update(response["data"])
                 device_control_logger.info(f"Run started with ID: {run_id}")
                 return run_id
         device_control_logger.error("Failed to start run")
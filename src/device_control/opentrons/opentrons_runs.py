@@ -0,0 +1,132 @@
+import threading
+from typing import Callable, Dict, List, Optional
+
+from src.uilt.deadline_control import setup as deadline
+from src.uilt.logs_control.setup import device_control_logger
+
+# 结束后不再变化的运行状态
+TERMINAL_STATUSES = {"succeeded", "failed", "stopped"}
+
+
+class RunCache:
+    def __init__(self):
+        """Runs indexed by id and by protocol id, so lookups do not scan the run list"""
+        self.runs: Dict[str, dict] = {}
+        self.by_protocol: Dict[str, List[str]] = {}
+        self.lock = threading.Lock()
+
+    def update(self, run: dict):
+        """Add or refresh one run"""
+        run_id = run.get("id")
+        if not run_id:
+            return
+        with self.lock:
+            known = run_id in self.runs
+            self.runs[run_id] = run
+            protocol_id = run.get("protocolId")
+            if not known and protocol_id:
+                self.by_protocol.setdefault(protocol_id, []).append(run_id)
+
+    def replace(self, runs: List[dict]):
+        """Rebuild the index from a full /runs listing, keeping its order"""
+        with self.lock:
+            self.runs.clear()
+            self.by_protocol.clear()
+        for run in runs:
+            self.update(run)
+
+    def get(self, run_id) -> Optional[dict]:
+        return self.runs.get(run_id)
+
+    def runs_for(self, protocol_id) -> List[dict]:
+        """Runs of `protocol_id` in listing order"""
+        with self.lock:
+            return [self.runs[run_id] for run_id in self.by_protocol.get(protocol_id, [])]
+
+    def is_terminal(self, run_id):
+        run = self.runs.get(run_id)
+        return run is not None and run.get("status") in TERMINAL_STATUSES
+
+
+class RunFollower:
+    def __init__(self, ot_com, run_id, cache: RunCache = None, min_interval_s=0.5, max_interval_s=5.0,
+                 backoff=1.5, page_length=100):
+        """
+        Follows one run until it ends, polling /runs/{id} with If-None-Match and backing off while nothing changes
+        New commands are read incrementally from /runs/{id}/commands with a cursor, so each poll only transfers
+        what happened since the previous one.
+        :param ot_com: OpentronsConnection
+        :param cache: RunCache updated with every run snapshot
+        :param min_interval_s: Poll interval right after a change
+        :param max_interval_s: Longest poll interval while the run is unchanged
+        :param backoff: Interval growth factor per unchanged poll
+        """
+        self.ot_com = ot_com
+        self.run_id = run_id
+        self.cache = cache
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max_interval_s
+        self.backoff = backoff
+        self.page_length = page_length
+        self.etag = None
+        self.run = None
+        self.command_cursor = 0
+        self.polls = 0
+
+    def poll_run(self):
+        """Fetch the run if it changed, returns True on change"""
+        data, self.etag, changed = self.ot_com.get_conditional(f"/runs/{self.run_id}", self.etag)
+        self.polls += 1
+        if not changed or not data:
+            return False
+        run = data.get("data", data)
+        # 服务端不返回 ETag 时按内容判断是否变化
+        if self.etag is None and run == self.run:
+            return False
+        self.run = run
+        if self.cache is not None:
+            self.cache.update(run)
+        return True
+
+    def poll_commands(self) -> List[dict]:
+        """Commands added since the previous call"""
+        data = self.ot_com.get(f"/runs/{self.run_id}/commands?cursor={self.command_cursor}"
+                               f"&pageLength={self.page_length}")
+        finished = []
+        # 未结束的指令下次从它开始重新读取，以拿到最终状态
+        for command in (data or {}).get("data", []):
+            if command.get("status") in ("queued", "running"):
+                break
+            finished.append(command)
+        self.command_cursor += len(finished)
+        return finished
+
+    def follow(self, on_update: Callable[[dict], None] = None, on_command: Callable[[dict], None] = None,
+               timeout=None) -> Optional[dict]:
+        """
+        Block until the run reaches a terminal status
+        :param on_update: Called with the run whenever it changed
+        :param on_command: Called once per finished command, in order; enables the command stream
+        :param timeout: Seconds before TimeoutError, also bounded by the current deadline
+        :return: Final run data
+        """
+        if self.ot_com.mock:
+            device_control_logger.info(f"[Mock Mode] follow run {self.run_id} simulated.")
+            return None
+        with deadline.Deadline(timeout, name=f"Opentrons run {self.run_id}"):
+            interval = self.min_interval_s
+            while True:
+                changed = self.poll_run()
+                if changed and on_update is not None:
+                    on_update(self.run)
+                if on_command is not None:
+                    commands = self.poll_commands()
+                    for command in commands:
+                        on_command(command)
+                    changed = changed or bool(commands)
+                if self.run is not None and self.run.get("status") in TERMINAL_STATUSES:
+                    device_control_logger.info(f"Run {self.run_id} ended with status {self.run.get('status')} "
+                                               f"after {self.polls} polls")
+                    return self.run
+                interval = self.min_interval_s if changed else min(interval * self.backoff, self.max_interval_s)
+                deadline.sleep(interval)
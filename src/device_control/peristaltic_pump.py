@@ -1,7 +1,10 @@
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from src.com_control import plc
+from src.com_control import plc_registry
+from src.device_control.pump_calibration import DoseFuture, PumpCalibration
+from src.uilt.deadline_control import setup as deadline
 from src.uilt.logs_control.setup import device_control_logger
 
 
@@ -12,8 +15,7 @@ class PeristalticPump:
         :param mock: Whether to enable Mock mode
         """
         self.mock = mock
-        self.plc = plc
-        self.plc.mock = mock
+        self.plc = plc_registry.get("plc_com", mock=mock)
         self.REG_START_START = 300
         self.REG_START_STOP = 301
         self.PUMP_FINISH = 310
@@ -22,58 +24,101 @@ class PeristalticPump:
         self.WASTE_LIQUID_START = 321
         self.WASTE_LIQUID_STOP = 331
 
-    def start_pump(self):
-        """Start peristaltic pump"""
+        self.calibration = PumpCalibration("peristaltic_pump")
+        self.scanner = plc_registry.scanner("plc_com", mock=mock)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="peristaltic_pump")
 
+    def _start(self):
         self.plc.write_coil(self.REG_START_START, False)
-        time.sleep(1)
+        deadline.sleep(1)
         self.plc.write_coil(self.REG_START_START, True)
         # time.sleep(1)
         # self.plc.write_coil(self.REG_START_START, False)
-        time.sleep(2)
+        deadline.sleep(2)
+
+    def start_pump(self):
+        """Start peristaltic pump"""
+        self._start()
         self.transfer_finish_async()
 
+    def dose(self, volume_ml) -> DoseFuture:
+        """
+        Pump `volume_ml` using the calibration table, without blocking the caller; PumpNotCalibrated without one
+        The PLC recipe is started and stopped once the calibrated run time has elapsed, unless it finishes first.
+        :return: DoseFuture carrying expected_finish, resolved when the pump has stopped
+        """
+        run_s = self.calibration.run_time(volume_ml)
+        future = DoseFuture(volume_ml, run_s, self.calibration.expected_duration(volume_ml))
+        device_control_logger.info(
+            f"Peristaltic pump dose {volume_ml} mL: run {run_s:.1f}s, expected {future.expected_s:.1f}s")
+        # 调用方的截止时间随任务传到执行线程
+        self.executor.submit(deadline.propagate(self._run_dose), future)
+        return future
+
+    def _run_dose(self, future: DoseFuture):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            started = time.monotonic()
+            self._start()
+            try:
+                finished = self.scanner.wait_coil(self.PUMP_FINISH, True, timeout=max(future.run_s - 2, 0))
+            except deadline.DeadlineExceeded:
+                self.stop_pump()
+                raise
+            except TimeoutError:
+                self.stop_pump()
+                finished = time.monotonic()
+            actual_s = finished - started
+            if not self.mock:
+                self.calibration.record(future.volume_ml, future.run_s, future.expected_s, actual_s)
+            future.set_result({"volume_ml": future.volume_ml, "run_s": future.run_s,
+                               "expected_s": future.expected_s, "actual_s": actual_s})
+        except Exception as e:
+            device_control_logger.error(f"Peristaltic pump dose {future.volume_ml} mL failed: {e}")
+            future.set_exception(e)
+
     def transfer_finish_async(self):
         while True:
-            done = self.plc.read_coils(self.PUMP_FINISH)[0]
+            done = self.plc.read_coil(self.PUMP_FINISH)
             if done:
                 return True
-            time.sleep(2)
+            deadline.sleep(2)
     def stop_pump(self):
         """Stop peristaltic pump"""
         self.plc.write_coil(self.REG_START_STOP, False)
-        time.sleep(1)
+        deadline.sleep(1)
         self.plc.write_coil(self.REG_START_STOP, True)
-        time.sleep(1)
+        deadline.sleep(1)
         self.plc.write_coil(self.REG_START_STOP, False)
 
     def start_washing_liquid(self):
         self.plc.write_coil(self.WASHING_LIQUID_START, True)
-        time.sleep(1)
+        deadline.sleep(1)
         self.plc.write_coil(self.WASHING_LIQUID_START, False)
-        time.sleep(2)
+        deadline.sleep(2)
         self.washing_liquid_finish_async()
 
     def washing_liquid_finish_async(self):
         while True:
-            done = self.plc.read_coils(self.WASHING_LIQUID_STOP)[0]
+            done = self.plc.read_coil(self.WASHING_LIQUID_STOP)
             if done:
                 return True
-            time.sleep(2)
+            deadline.sleep(2)
 
     def start_waste_liquid(self):
         self.plc.write_coil(self.WASTE_LIQUID_START, True)
-        time.sleep(1)
+        deadline.sleep(1)
         self.plc.write_coil(self.WASTE_LIQUID_START, False)
-        time.sleep(2)
+        deadline.sleep(2)
         # self.waste_liquid_finish_async()
 
     def waste_liquid_finish_async(self):
         while True:
-            done = self.plc.read_coils(self.WASTE_LIQUID_STOP)[0]
+            done = self.plc.read_coil(self.WASTE_LIQUID_STOP)
             if done:
                 return True
-            time.sleep(2)
+            deadline.sleep(2)
 
 if __name__ == '__main__':
     pump = PeristalticPump(mock=False)
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from src.uilt.logs_control.setup import device_control_logger
+
+CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pump_calibration.json")
+# 运行中测得的额外耗时与剂量记录，不纳入版本管理
+MEASUREMENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pump_calibration_measurements.json")
+# 多个泵共用同一个记录文件
+_file_lock = threading.Lock()
+
+
+class PumpNotCalibrated(RuntimeError):
+    """No measured volume -> run time points for the pump, dosing would dispense an unknown volume"""
+
+
+class DoseFuture(Future):
+    def __init__(self, volume_ml, run_s, expected_s):
+        """
+        Future of one dose, resolved with {"volume_ml", "run_s", "expected_s", "actual_s"}
+        :param volume_ml: Requested volume
+        :param run_s: Pump run time commanded to the PLC
+        :param expected_s: Predicted time from submission to the finish signal
+        """
+        super().__init__()
+        self.volume_ml = volume_ml
+        self.run_s = run_s
+        self.expected_s = expected_s
+        self.submitted_at = time.time()
+        self.expected_finish = self.submitted_at + expected_s
+
+
+class PumpCalibration:
+    # 观测值对额外耗时估计的权重
+    SMOOTHING = 0.3
+    MAX_HISTORY = 200
+
+    def __init__(self, name, path=CALIBRATION_PATH, measurements_path=MEASUREMENTS_PATH):
+        """
+        Volume -> run time table of one pump, plus the measured overhead between command and finish signal
+        :param name: Key of the pump in the calibration file
+        :param path: JSON calibration table, only read; a pump without measured points cannot dose
+        :param measurements_path: JSON file the observed doses and the refined overhead are written to
+        """
+        self.name = name
+        self.path = path
+        self.measurements_path = measurements_path
+        self.lock = threading.Lock()
+        data = self._load(path).get(name, {})
+        # 没有实测标定点时不提供默认表，dose 直接报错
+        points = [tuple(p) for p in data.get("points") or []]
+        self.points = self._validate(points) if points else None
+        measured = self._load(measurements_path).get(name, {}) if os.path.exists(measurements_path) else {}
+        self.overhead_s = measured.get("overhead_s", data.get("overhead_s", 0.0))
+        self.history = measured.get("history", [])
+
+    def _validate(self, points):
+        """At least two (volume, run time) points with strictly increasing volumes"""
+        if len(points) < 2:
+            raise ValueError(f"Pump calibration '{self.name}' in {self.path} needs at least 2 points, got {points}")
+        for (v0, _), (v1, _) in zip(points, points[1:]):
+            if v1 <= v0:
+                raise ValueError(f"Pump calibration '{self.name}' in {self.path}: volumes must increase, "
+                                 f"{v1} follows {v0}")
+        return points
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            device_control_logger.error(f"Failed to load pump calibration {path}: {e}")
+            return {}
+
+    @property
+    def calibrated(self):
+        return self.points is not None
+
+    def run_time(self, volume_ml):
+        """Run time in seconds for `volume_ml`, linear between table points and extrapolated past the ends"""
+        if not self.calibrated:
+            raise PumpNotCalibrated(f"Pump '{self.name}' is not calibrated: add measured [volume_ml, run_s] points "
+                                    f"to {self.path}")
+        if volume_ml < 0:
+            raise ValueError(f"Volume must not be negative: {volume_ml}")
+        points = self.points
+        for (v0, t0), (v1, t1) in zip(points, points[1:]):
+            if volume_ml <= v1:
+                break
+        return t0 + (t1 - t0) * (volume_ml - v0) / (v1 - v0)
+
+    def expected_duration(self, volume_ml):
+        """Predicted time from command to finish signal"""
+        return self.run_time(volume_ml) + self.overhead_s
+
+    def record(self, volume_ml, run_s, expected_s, actual_s):
+        """Store one observed dose and refine the overhead estimate"""
+        with self.lock:
+            self.history.append({
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "volume_ml": volume_ml,
+                "run_s": round(run_s, 3),
+                "expected_s": round(expected_s, 3),
+                "actual_s": round(actual_s, 3),
+            })
+            del self.history[:-self.MAX_HISTORY]
+            self.overhead_s += self.SMOOTHING * ((actual_s - run_s) - self.overhead_s)
+            self.save()
+        device_control_logger.info(
+            f"[{self.name}] dose {volume_ml} mL: expected {expected_s:.1f}s, actual {actual_s:.1f}s, "
+            f"overhead now {self.overhead_s:.2f}s")
+
+    def save(self):
+        """Write the measurements; the calibration table itself is never rewritten"""
+        with _file_lock:
+            path = self.measurements_path
+            data = self._load(path) if os.path.exists(path) else {}
+            data[self.name] = {
+                "overhead_s": round(self.overhead_s, 3),
+                "history": self.history,
+            }
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,191 @@
+import functools
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from src.com_control.pump_protocol import DEFAULT_SPEED_PPS, VALVE_COMMANDS, estimate_duration
+
+
+class PumpProgramError(ValueError):
+    """Program rejected offline, before the pump would answer with an invalid parameter / too long error"""
+
+
+@dataclass(frozen=True)
+class Valve:
+    port: str
+
+
+@dataclass(frozen=True)
+class MoveTo:
+    position: int
+    speed: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Aspirate:
+    pulses: int
+    speed: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Dispense:
+    pulses: int
+    speed: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Wait:
+    ms: int
+
+
+@dataclass(frozen=True)
+class Repeat:
+    steps: Tuple
+    times: int
+
+
+@dataclass(frozen=True)
+class PumpLimits:
+    max_position: int = 11000
+    min_speed: int = 5
+    max_speed: int = 6000
+    max_wait_ms: int = 30000
+    max_repeat: int = 30000
+    max_loop_depth: int = 10
+    # 指令体长度上限，不含地址前缀与结尾的 R\r\n
+    max_length: int = 240
+
+
+@dataclass(frozen=True)
+class PumpProgram:
+    segments: Tuple[str, ...]
+    seconds: float
+    end_position: int
+
+    @property
+    def text(self):
+        return "".join(self.segments)
+
+
+@dataclass
+class _Unit:
+    """Compiled top-level step, the smallest piece a program may be split at"""
+    text: str
+    steps: Tuple
+    children: List["_Unit"] = field(default_factory=list)
+
+
+class _Compiler:
+    def __init__(self, limits: PumpLimits, start_position):
+        self.limits = limits
+        self.position = start_position
+
+    def fail(self, message):
+        raise PumpProgramError(message)
+
+    def check_speed(self, speed):
+        if speed is None:
+            return ""
+        if not self.limits.min_speed <= speed <= self.limits.max_speed:
+            self.fail(f"Speed V{speed} outside {self.limits.min_speed}..{self.limits.max_speed}")
+        return f"V{speed}"
+
+    def move(self, target, label):
+        if not 0 <= target <= self.limits.max_position:
+            self.fail(f"{label} moves the plunger to {target}, outside 0..{self.limits.max_position}")
+        self.position = target
+
+    def step(self, step, depth) -> _Unit:
+        if isinstance(step, Valve):
+            if step.port not in VALVE_COMMANDS:
+                self.fail(f"Unknown valve port {step.port!r}, expected one of {sorted(VALVE_COMMANDS)}")
+            return _Unit(step.port, (step,))
+        if isinstance(step, MoveTo):
+            speed = self.check_speed(step.speed)
+            self.move(step.position, f"MoveTo({step.position})")
+            return _Unit(f"{speed}A{step.position}", (step,))
+        if isinstance(step, (Aspirate, Dispense)):
+            if step.pulses < 0:
+                self.fail(f"{type(step).__name__} pulses must not be negative: {step.pulses}")
+            speed = self.check_speed(step.speed)
+            sign, letter = (1, "P") if isinstance(step, Aspirate) else (-1, "D")
+            self.move(self.position + sign * step.pulses, f"{type(step).__name__}({step.pulses})")
+            return _Unit(f"{speed}{letter}{step.pulses}", (step,))
+        if isinstance(step, Wait):
+            if step.ms < 0:
+                self.fail(f"Wait must not be negative: {step.ms}")
+            # 超过单条 M 上限的等待拆成多条
+            parts, remaining = [], step.ms
+            while remaining > self.limits.max_wait_ms:
+                parts.append(f"M{self.limits.max_wait_ms}")
+                remaining -= self.limits.max_wait_ms
+            parts.append(f"M{remaining}")
+            return _Unit("".join(parts), (step,))
+        if isinstance(step, Repeat):
+            if not 1 <= step.times <= self.limits.max_repeat:
+                self.fail(f"Repeat count {step.times} outside 1..{self.limits.max_repeat}")
+            if depth >= self.limits.max_loop_depth:
+                self.fail(f"Loops nested deeper than {self.limits.max_loop_depth}")
+            start = self.position
+            children = [self.step(s, depth + 1) for s in step.steps]
+            # 一轮后柱塞回到起点时每轮相同；否则逐轮模拟，保证每一轮都在行程内
+            if self.position != start:
+                for _ in range(step.times - 1):
+                    for s in step.steps:
+                        self.step(s, depth + 1)
+            body = "".join(u.text for u in children)
+            return _Unit(f"g{body}G{step.times}", (step,), children)
+        self.fail(f"Unknown pump program step {step!r}")
+
+
+def _pack(units: List[_Unit], max_length) -> List[str]:
+    """Greedily pack units into segments no longer than `max_length`, unrolling loops that do not fit"""
+    segments, current = [], ""
+    for unit in units:
+        pieces = [unit.text]
+        if len(unit.text) > max_length:
+            if not unit.children:
+                raise PumpProgramError(f"Step {unit.text[:20]}... alone exceeds {max_length} characters")
+            # 循环体过长时展开为多段，每轮循环体单独打包
+            times = unit.steps[0].times
+            pieces = _pack(unit.children * times, max_length)
+        for piece in pieces:
+            if current and len(current) + len(piece) > max_length:
+                segments.append(current)
+                current = ""
+            current += piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(steps: Tuple, limits: PumpLimits, start_position: int) -> PumpProgram:
+    compiler = _Compiler(limits, start_position)
+    units = [compiler.step(step, 0) for step in steps]
+    segments = tuple(_pack(units, limits.max_length))
+    seconds, position, speed = 0.0, start_position, DEFAULT_SPEED_PPS
+    for segment in segments:
+        estimate = estimate_duration(segment, position, speed)
+        seconds, position, speed = seconds + estimate.seconds, estimate.position, estimate.speed
+    return PumpProgram(segments, seconds, compiler.position)
+
+
+def compile_program(steps, limits: PumpLimits = PumpLimits(), start_position=0) -> PumpProgram:
+    """
+    Compile high-level steps to pump command strings
+    Usage:
+        compile_program([Valve("I"), MoveTo(11000, speed=1000), Wait(10000), Valve("O"), MoveTo(0, speed=1000)])
+    Limits are checked offline and raise PumpProgramError; programs longer than limits.max_length are split at
+    step boundaries into segments the caller sends one after another. Results are cached by steps and limits.
+    :param start_position: Plunger position before the program, needed to check relative moves
+    """
+    return _compile(_freeze(steps), limits, start_position)
+
+
+def _freeze(steps) -> Tuple:
+    frozen = []
+    for step in steps:
+        if isinstance(step, Repeat):
+            step = Repeat(_freeze(step.steps), step.times)
+        frozen.append(step)
+    return tuple(frozen)
@@ -1,20 +1,27 @@
-import socket
-import time
 import logging
+import time
+from typing import List
+
+from src.com_control import pump_buses
+from src.com_control.pump_protocol import DEFAULT_SPEED_PPS, PumpStatus, estimate_duration
+from src.device_control.pump_program import MoveTo, PumpLimits, PumpProgram, Repeat, Valve, Wait, compile_program
+from src.uilt.deadline_control import setup as deadline
 
 logger = logging.getLogger("PUMP")
 
 class PumpSample:
-    def  __init__(self, host='192.168.1.207', port=4196, baud_rate=9600, timeout=3, mock=False):
+    def  __init__(self, host='192.168.1.207', port=4196, baud_rate=9600, timeout=3, mock=False, address=1, bus=None):
         """
         Pump control class supporting real and Mock modes
         :param port: Serial port number
         :param baud_rate: Baud rate
         :param timeout: Timeout value
         :param mock: Whether to enable Mock mode
+        :param address: Pump address on the RS485 bus
+        :param bus: PumpBus to use, defaults to the one shared by all pumps on host:port
         """
         self.mock = mock
-        self.ID = 1
+        self.ID = address
         self.SAMPLE_INLET_1 = "I"
         self.SAMPLE_OUTLET_3 = "O"
         self.SHORT_PORT = "I"
@@ -28,16 +35,27 @@ class PumpSample:
         self.AIR_GAP_PULSE = 2000
         self.LIQUID_PULSE = 2000
         self.WAITING_TIME = 10000
+        self.limits = PumpLimits(max_position=self.MAX_PULSE)
         self.busy_flag = True
         self.host = host
         self.port = port
+        self.bus = None
+        self.last_status = None
+        # 按指令字符串预测的运行时间，sync 先睡到预计结束前再密集查询
+        self.position = 0
+        self.speed = DEFAULT_SPEED_PPS
+        self.program_started = None
+        self.predicted_end = 0.0
+        self.poll_interval_s = 0.2
+        self.sync_margin_s = 0.5
 
         if not self.mock:
             try:
                 print(f"--------------{self.mock}------------------")
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.sock.settimeout(5)
-                self.sock.connect((self.host, self.port))
+                # 同一网关上的多台泵共用一条连接
+                self.bus = bus or pump_buses.get(self.host, self.port)
+                self.bus.attach(self.ID)
+                self.bus.connect()
 
                 logger.info("Syringe pump serial connection successful")
                 print(f"Syringe pump serial connection successful")
@@ -56,28 +74,40 @@ class PumpSample:
         :param command: Command to send
         :return: Device response
         """
-        formatted_command = f"/{self.ID}" + command + "R\r\n"
-
-        logger.info(f"Sending command: {formatted_command.strip()}")
-
         if self.mock:
+            logger.info(f"Sending command: /{self.ID}{command}R")
             response = f"[Mock Response] {command} OK".encode("utf-8")
             logger.info(f"Mock mode return: {response}")
             return response
+        self._predict(command)
+        return self.query(command).raw
+
+    def _predict(self, command):
+        estimate = estimate_duration(command, self.position, self.speed)
+        self.position, self.speed = estimate.position, estimate.speed
+        if estimate.unknown:
+            logger.debug(f"No duration known for {estimate.unknown} in {command}")
+        if estimate.seconds > 0:
+            self.program_started = time.monotonic()
+            self.predicted_end = self.program_started + estimate.seconds
+            logger.info(f"Pump program expected to take {estimate.seconds:.1f}s")
+
+    def query(self, command: str) -> PumpStatus:
+        """Send a command and return its parsed reply"""
+        return self.query_many([command])[0]
+
+    def query_many(self, commands: List[str]) -> List[PumpStatus]:
+        """
+        Several queries in one bus transaction, one reply per command in order
+        Meant for status reports (Q, ?, ?4...) that the pump answers without executing a move. Frames go out one at
+        a time with the bus turnaround in between, unless the bus has `pipeline` enabled and only this pump on it.
+        """
+        if self.mock:
+            for command in commands:
+                logger.info(f"Sending command: /{self.ID}{command}R")
+            return [PumpStatus(address="0", status_byte=0x60, data="", raw=b"/0`\x03") for _ in commands]
 
-        self.sock.sendall(formatted_command.encode("utf-8"))
-        response = self._read_response()
-        return response
-
-    def _read_response(self, timeout=1):
-        """Read response with timeout"""
-        try:
-            response = self.sock.recv(16)
-            if not response:
-                raise ConnectionError("Empty response")
-            return response
-        except socket.timeout:
-            raise TimeoutError("Read timeout")
+        return self.bus.transact(self.ID, commands)
 
     def initialization(self):
         """Initialize pump"""
@@ -90,118 +120,124 @@ class PumpSample:
         """Calculate required pulses based on calibration curve"""
         return round(self.CALIBRATION_CURVE["k"] * ml + self.CALIBRATION_CURVE["b"])
 
-    def inject(self, volume: float, in_port: int, out_port: int):
+    def transfer_steps(self, pulse, inlet=None, in_speed=1000, out_speed=1000):
         """
-        Perform liquid injection
-        :param volume: Volume (mL)
-        :param in_port: Inlet port number
-        :param out_port: Outlet port number
+        Steps moving `pulse` through the pump in full strokes plus a last partial stroke, with an air gap
+        :param inlet: Valve port to aspirate from, None to aspirate through the current port (washing)
         """
-        pulse = self.ml_to_pulse(volume)
         max_pulse_per_injection = self.MAX_PULSE - self.AIR_GAP_PULSE
         inject_cycles = pulse // max_pulse_per_injection
         last_time_pulse = pulse % max_pulse_per_injection
-
-        in_speed = 1000
-        out_speed = 1000
+        select_inlet = (Valve(inlet),) if inlet else ()
 
         if inject_cycles > 0:
-            # inject_cycles -= 1
-            command = (
-            f'{self.SAMPLE_INLET_1}gV{in_speed}A{self.MAX_PULSE}'
-            f'M{self.WAITING_TIME}{self.SAMPLE_OUTLET_3}V{out_speed}A0M{self.WAITING_TIME}'
-            f'{self.SAMPLE_INLET_1}G{inject_cycles}'
-            f'V{in_speed}A{last_time_pulse + self.AIR_GAP_PULSE}M{self.WAITING_TIME}'
-            f'{self.SAMPLE_OUTLET_3}V{out_speed}A{self.AIR_GAP_PULSE}M{self.WAITING_TIME}{self.SHORT_PORT}'
-            )
-        else:
-            command = (
-                f'{self.SAMPLE_INLET_1}V{in_speed}A{last_time_pulse + self.AIR_GAP_PULSE}'
-                f'M{self.WAITING_TIME}{self.SAMPLE_OUTLET_3}V{out_speed}A0M{self.WAITING_TIME}{self.SHORT_PORT}'
+            stroke = (MoveTo(self.MAX_PULSE, in_speed), Wait(self.WAITING_TIME),
+                      MoveTo(0, out_speed), Wait(self.WAITING_TIME))
+            if inlet:
+                stroke = stroke[:2] + (Valve(self.SAMPLE_OUTLET_3),) + stroke[2:] + (Valve(inlet),)
+            return select_inlet + (
+                Repeat(stroke, inject_cycles),
+                MoveTo(last_time_pulse + self.AIR_GAP_PULSE, in_speed), Wait(self.WAITING_TIME),
+                Valve(self.SAMPLE_OUTLET_3), MoveTo(self.AIR_GAP_PULSE, out_speed), Wait(self.WAITING_TIME),
+                Valve(self.SHORT_PORT),
             )
+        return select_inlet + (
+            MoveTo(last_time_pulse + self.AIR_GAP_PULSE, in_speed), Wait(self.WAITING_TIME),
+            Valve(self.SAMPLE_OUTLET_3), MoveTo(0, out_speed), Wait(self.WAITING_TIME),
+            Valve(self.SHORT_PORT),
+        )
+
+    def run_program(self, program: PumpProgram):
+        """Send a compiled program; each further segment waits until the pump finished the previous one"""
+        response = None
+        for index, segment in enumerate(program.segments):
+            if index:
+                self.wait_idle()
+            response = self.send_command(segment)
+        return response
 
-
-        return self.send_command(command)
+    def inject(self, volume: float, in_port: int, out_port: int):
+        """
+        Perform liquid injection
+        :param volume: Volume (mL)
+        :param in_port: Inlet port number
+        :param out_port: Outlet port number
+        """
+        steps = self.transfer_steps(self.ml_to_pulse(volume), inlet=self.SAMPLE_INLET_1)
+        return self.run_program(compile_program(steps, self.limits))
 
     def wash(self, volume: float):
         """
         Perform liquid washing
         :param volume: Volume (mL)
         """
-        pulse = self.ml_to_pulse(volume)
-        max_pulse_per_injection = self.MAX_PULSE - self.AIR_GAP_PULSE
-        inject_cycles = pulse // max_pulse_per_injection
-        last_time_pulse = pulse % max_pulse_per_injection
-
-        in_speed = 1000
-        out_speed = 1000
-
-        if inject_cycles > 0:
-            # inject_cycles -= 1
-            command = (
-            f'gV{in_speed}A{self.MAX_PULSE}'
-            f'M{self.WAITING_TIME}V{out_speed}A0M{self.WAITING_TIME}'
-            f'G{inject_cycles}'
-            f'V{in_speed}A{last_time_pulse + self.AIR_GAP_PULSE}M{self.WAITING_TIME}'
-            f'{self.SAMPLE_OUTLET_3}V{out_speed}A{self.AIR_GAP_PULSE}M{self.WAITING_TIME}{self.SHORT_PORT}'
-            )
-        else:
-            command = (
-                f'V{in_speed}A{last_time_pulse + self.AIR_GAP_PULSE}'
-                f'M{self.WAITING_TIME}{self.SAMPLE_OUTLET_3}V{out_speed}A0M{self.WAITING_TIME}{self.SHORT_PORT}'
-            )
-
+        steps = self.transfer_steps(self.ml_to_pulse(volume))
+        return self.run_program(compile_program(steps, self.limits))
 
-        return self.send_command(command)
-
-    def check_state(self):
+    def check_state(self) -> PumpStatus:
         """ 查看泵的状态，并更新 busy_flag """
-        re = self.send_command("Q")
-        re_lst = list(re)
-        # print("re_lst",re_lst)
-
-        if len(re_lst) < 4:
-            logger.error("Unexpected response format")
-            return
-
-        status_code = re_lst[3]
-        if status_code in range(64, 80):
-            self.busy_flag = True
-        elif status_code in range(96, 112):
-            self.busy_flag = False
-        else:
-            logger.error(f"Unexpected status, received {re_lst}, flag is {status_code}")
-
-        error_messages = {
-            66: "Invalid command",
-            67: "Invalid parameter in command",
-            70: "EEPROM failed",
-            71: "Pump was not initialized",
-            73: "Pump overload, please check pressure",
-            74: "Valve overload, please check valve",
-            75: "Pump moving not allowed, please check valve position",
-            76: "Unexpected error, please contact support",
-            78: "A/D transmitter error, please contact support",
-            79: "Command too long, please check command",
-        }
-
-        if status_code in error_messages:
-            logger.error(f"[PUMP{self.ID}] {error_messages[status_code]}, received {re_lst}")
-
-        if status_code in [71, 103]:  # 需要重新初始化
+        status = self._apply_status(self.query("Q"))
+        if status.needs_init:  # 需要重新初始化
             self.initialization()
             self.sync()
+        return status
+
+    def _apply_status(self, status: PumpStatus) -> PumpStatus:
+        self.last_status = status
+        self.busy_flag = status.busy
+        if status.error:
+            logger.error(f"[PUMP{self.ID}] {status.error}, received {status.raw!r}")
+        return status
 
     def sync(self):
         """ 等待泵空闲 """
         if self.mock:
             return
+        self.wait_idle()
+        self.send_command('I')
+        self.wait_idle()
+
+    def wait_idle(self):
+        """Sleep until shortly before the predicted end of the running program, then poll tightly"""
+        presleep = self._presleep_s()
+        if presleep > 0:
+            deadline.sleep(presleep)
+        polls = 1
         self.check_state()
         while self.busy_flag:
-            time.sleep(0.5)
+            deadline.sleep(self._poll_interval_s())
             self.check_state()
-        self.send_command('I')
-        time.sleep(1)
+            polls += 1
+        if self._program_finished(polls):
+            self._resync_position()
+
+    def _presleep_s(self):
+        """Time that can be slept before polling starts"""
+        remaining = self.predicted_end - time.monotonic()
+        margin = self.sync_margin_s + 0.05 * max(remaining, 0)
+        return remaining - margin if remaining > margin else 0.0
+
+    def _poll_interval_s(self):
+        # 超过预计结束 2 秒仍未完成时，恢复原来的 0.5 秒查询间隔
+        late = time.monotonic() - self.predicted_end > 2
+        return 0.5 if late else self.poll_interval_s
+
+    def _program_finished(self, polls):
+        """Log actual vs predicted duration; False when no program was being timed"""
+        if self.program_started is None:
+            return False
+        actual = time.monotonic() - self.program_started
+        logger.info(f"Pump program finished in {actual:.1f}s "
+                    f"(predicted {self.predicted_end - self.program_started:.1f}s, {polls} polls)")
+        self.program_started = None
+        return True
+
+    def _resync_position(self):
+        """Read back the plunger position so the next prediction starts from the real one"""
+        try:
+            self.position = int(self.query("?").data)
+        except (ValueError, TimeoutError) as e:
+            logger.warning(f"Unable to read plunger position: {e}")
 
 if __name__ == '__main__':
     ps = PumpSample(mock=False)  # 启用 Mock 模式
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from typing import List, Union
+
+from src.com_control import async_pump_buses
+from src.com_control.pump_bus import AsyncPumpBus
+from src.com_control.pump_protocol import PumpStatus
+from src.device_control.pump_program import PumpProgram, compile_program
+from src.device_control.pump_sample import PumpSample
+
+logger = logging.getLogger("PUMP")
+
+
+class AsyncPumpSample(PumpSample):
+    def __init__(self, host='192.168.1.207', port=4196, mock=False, address=1, bus: AsyncPumpBus = None):
+        """
+        asyncio variant of PumpSample: every pump I/O method is a coroutine, so the orchestrator can overlap pump
+        work with robot and chromatography steps on one event loop
+        Usage:
+            pump = AsyncPumpSample()
+            await pump.connect()
+            await pump.initialization()
+            await pump.inject(2, 1, 3, wait=True)
+        Programs, calibration and duration prediction are shared with PumpSample.
+        :param bus: AsyncPumpBus to use, defaults to the one shared by all pumps on host:port
+        """
+        # 父类只负责参数与预测状态，不建立同步连接
+        super().__init__(host=host, port=port, mock=True, address=address)
+        self.mock = mock
+        if not mock:
+            self.bus = bus or async_pump_buses.get(host, port)
+            self.bus.attach(self.ID)
+
+    async def connect(self):
+        if self.mock:
+            logger.info("Mock mode enabled, no serial connection")
+            return
+        try:
+            await self.bus.connect()
+            logger.info("Syringe pump serial connection successful")
+        except Exception as e:
+            logger.error(f"Unable to connect to syringe pump serial: {e}")
+            raise
+
+    async def send(self, command: str) -> PumpStatus:
+        """Send a command and return its parsed reply"""
+        if self.mock:
+            logger.info(f"Sending command: /{self.ID}{command}R")
+        else:
+            self._predict(command)
+        return (await self.query_many([command]))[0]
+
+    async def send_command(self, command: str) -> bytes:
+        return (await self.send(command)).raw
+
+    async def query(self, command: str) -> PumpStatus:
+        return (await self.query_many([command]))[0]
+
+    async def query_many(self, commands: List[str]) -> List[PumpStatus]:
+        if self.mock:
+            return [PumpStatus(address="0", status_byte=0x60, data="", raw=b"/0`\x03") for _ in commands]
+        return await self.bus.transact(self.ID, commands)
+
+    async def query_state(self) -> PumpStatus:
+        """ 查看泵的状态，并更新 busy_flag """
+        status = self._apply_status(await self.query("Q"))
+        if status.needs_init:  # 需要重新初始化
+            await self.initialization()
+            await self.sync()
+        return status
+
+    check_state = query_state
+
+    async def wait_idle(self):
+        """Sleep until shortly before the predicted end of the running program, then poll tightly"""
+        if self.mock:
+            return
+        presleep = self._presleep_s()
+        if presleep > 0:
+            await asyncio.sleep(presleep)
+        polls = 1
+        await self.query_state()
+        while self.busy_flag:
+            await asyncio.sleep(self._poll_interval_s())
+            await self.query_state()
+            polls += 1
+        if self._program_finished(polls):
+            await self._resync_position()
+
+    async def _resync_position(self):
+        try:
+            self.position = int((await self.query("?")).data)
+        except (ValueError, TimeoutError) as e:
+            logger.warning(f"Unable to read plunger position: {e}")
+
+    async def sync(self):
+        """ 等待泵空闲 """
+        if self.mock:
+            return
+        await self.wait_idle()
+        await self.send('I')
+        await self.wait_idle()
+
+    async def initialization(self):
+        """Initialize pump"""
+        await self.send("Z")
+        await self.sync()
+        await self.send(self.SHORT_PORT)
+
+    async def run_program(self, program: Union[PumpProgram, list, tuple], wait=False) -> PumpStatus:
+        """
+        Send a compiled program, or steps to compile; each further segment waits for the previous one
+        :param wait: Also wait until the last segment has finished
+        """
+        if not isinstance(program, PumpProgram):
+            program = compile_program(program, self.limits, self.position)
+        status = None
+        for index, segment in enumerate(program.segments):
+            if index:
+                await self.wait_idle()
+            status = await self.send(segment)
+        if wait:
+            await self.wait_idle()
+        return status
+
+    async def inject(self, volume: float, in_port: int, out_port: int, wait=False):
+        """
+        Perform liquid injection
+        :param volume: Volume (mL)
+        :param wait: Return only once the pump is idle again
+        """
+        steps = self.transfer_steps(self.ml_to_pulse(volume), inlet=self.SAMPLE_INLET_1)
+        return await self.run_program(compile_program(steps, self.limits), wait=wait)
+
+    async def wash(self, volume: float, wait=False):
+        """
+        Perform liquid washing
+        :param volume: Volume (mL)
+        :param wait: Return only once the pump is idle again
+        """
+        steps = self.transfer_steps(self.ml_to_pulse(volume))
+        return await self.run_program(compile_program(steps, self.limits), wait=wait)
+
+    async def close(self):
+        if self.bus is not None:
+            await self.bus.close()
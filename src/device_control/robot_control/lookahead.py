@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+from src.uilt.logs_control.setup import device_control_logger
+from src.uilt.yaml_control.setup import config
+
+
+class RemainingTimeEstimator:
+    # 用于拟合趋势的最近采样数
+    WINDOW = 10
+
+    def __init__(self, expected_s=None):
+        """
+        Predicts how long a device wait still has to run
+        :param expected_s: Typical total duration, used when the device reports no measurable value
+        """
+        self.expected_s = expected_s
+        self.started_at = time.monotonic()
+        self.samples = deque(maxlen=self.WINDOW)
+        self.remaining_s = None
+
+    def update(self, value=None, target=None, running=None, done=None, remaining_s=None):
+        """Feed one progress report, returns the predicted remaining seconds or None when unknown"""
+        now = time.monotonic()
+        if done:
+            self.remaining_s = 0.0
+        elif remaining_s is not None:
+            self.remaining_s = remaining_s
+        elif value is not None and target is not None and value > 0 and target > 0:
+            # 抽真空时压力近似指数下降：对 log(p) 做线性拟合，外推到达目标值的时间
+            self.samples.append((now, math.log(value)))
+            self.remaining_s = self._extrapolate(math.log(target))
+        elif self.expected_s is not None and running is not False:
+            self.remaining_s = max(self.expected_s - (now - self.started_at), 0.0)
+        return self.remaining_s
+
+    def _extrapolate(self, target):
+        if len(self.samples) < 3:
+            return None
+        n = len(self.samples)
+        mean_t = sum(t for t, _ in self.samples) / n
+        mean_y = sum(y for _, y in self.samples) / n
+        var = sum((t - mean_t) ** 2 for t, _ in self.samples)
+        if var == 0:
+            return None
+        slope = sum((t - mean_t) * (y - mean_y) for t, y in self.samples) / var
+        last_t, last_y = self.samples[-1]
+        if slope == 0:
+            return None
+        if (target - last_y) * slope <= 0:
+            # 已越过目标值时剩余为 0，否则趋势背离目标，无法预测
+            return 0.0 if (last_y - target) * slope >= 0 else None
+        return (target - last_y) / slope
+
+
+class StationWatch:
+    def __init__(self, lookahead, station, staging, travel_s, interlocks, estimator):
+        """
+        One device wait watched by RobotLookahead, callable as the device's on_progress hook
+        :param station: Name of the next robot station in robot.lookahead.stations
+        :param staging: Command moving the robot to the safe staging pose, None disables speculation
+        :param travel_s: Predicted robot travel time to the staging pose
+        :param interlocks: Interlock names that must all pass before moving
+        """
+        self.lookahead = lookahead
+        self.station = station
+        self.staging = staging
+        self.travel_s = travel_s
+        self.interlocks = interlocks
+        self.estimator = estimator
+        self.thread = None
+        self.moved = False
+        self.result = None
+        self.blocked_by = None
+
+    def __call__(self, **progress):
+        remaining = self.estimator.update(**progress)
+        if self.moved or self.staging is None or remaining is None:
+            return
+        if self.thread is not None and self.thread.is_alive():
+            return
+        if remaining > self.travel_s + self.lookahead.margin_s:
+            return
+        # 先粗查一次，真正移动前在占用机械臂的情况下再查
+        if self._blocked(self.lookahead.check_interlocks(self.interlocks)):
+            return
+        self.thread = threading.Thread(target=self._move, args=(remaining,), daemon=True)
+        self.thread.start()
+
+    def _blocked(self, failed):
+        if failed and failed != self.blocked_by:
+            device_control_logger.info(f"Lookahead {self.station}: staging held by interlock {failed}")
+        self.blocked_by = failed
+        return bool(failed)
+
+    def _move(self, remaining):
+        controller = self.lookahead.controller
+        # 流程线程正在执行指令时不等待，下一次进度回调再试
+        if not controller.command_lock.acquire(blocking=False):
+            self._blocked("robot_idle")
+            return
+        try:
+            if self._blocked(self.lookahead.check_interlocks(self.interlocks)):
+                return
+            self.moved = True
+            device_control_logger.info(f"Lookahead {self.station}: ~{remaining:.1f}s left, robot travel "
+                                       f"{self.travel_s:.1f}s, moving to staging pose {self.staging}")
+            print(f"🤖 预先移动到 {self.station} 附近的等待位 ({self.staging})")
+            self.result = controller._execute_scenario(self.staging, self.staging + "_finish")
+        except Exception as e:
+            self.result = e
+            device_control_logger.error(f"Lookahead staging move {self.staging} failed: {e}")
+        finally:
+            controller.command_lock.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 设备等待结束后，先等预动作完成再执行下一步机械臂动作
+        if self.thread is not None:
+            self.thread.join()
+        return False
+
+
+class RobotLookahead:
+    def __init__(self, controller, settings=None):
+        """
+        Sends the robot to a staging pose near the next station while a device is still finishing
+        :param controller: RobotController; its RobotTimingDB supplies travel times
+        :param settings: Defaults to robot.lookahead in com_config.yaml:
+            enabled, margin_s, default_travel_s, stations: {name: {staging, travel_s, interlocks}}
+        Speculation only happens for stations that declare a staging command, and only while every declared
+        interlock passes; unknown interlock names count as failed.
+        """
+        self.controller = controller
+        settings = settings if settings is not None else config.get("robot", {}).get("lookahead", {})
+        self.enabled = settings.get("enabled", False)
+        self.margin_s = settings.get("margin_s", 2.0)
+        self.default_travel_s = settings.get("default_travel_s", 10.0)
+        self.stations = settings.get("stations", {}) or {}
+        self.interlocks: Dict[str, Callable[[], bool]] = {
+            # 上一条指令已收到 _finish 且之后 1 秒内没有新指令；预动作在持有 controller.command_lock 时再次检查
+            "robot_idle": lambda: bool(controller.connection.mock or (
+                controller.ready and time.monotonic() - controller.last_finish_at >= 1.0)),
+            "robot_link": lambda: bool(controller.connection.mock or controller.connection.is_connected()),
+            "no_held_fault": lambda: not controller.fault_policy.held,
+        }
+
+    def add_interlock(self, name, check: Callable[[], bool]):
+        """Register a named interlock usable in the stations config"""
+        self.interlocks[name] = check
+
+    def check_interlocks(self, names):
+        """Name of the first failing interlock, None when all pass"""
+        for name in names:
+            check = self.interlocks.get(name)
+            try:
+                if check is None or not check():
+                    return name
+            except Exception as e:
+                device_control_logger.error(f"Interlock {name} raised {e}")
+                return name
+        return None
+
+    def travel_time(self, command, default=None):
+        timing = getattr(self.controller, "timing", None)
+        value = timing.expected_duration(command) if timing is not None else None
+        return value if value is not None else (default if default is not None else self.default_travel_s)
+
+    def watch(self, station, expected_s=None) -> StationWatch:
+        """
+        Watch a device wait whose result the robot picks up at `station`
+        Usage:
+            with robot_lookahead.watch("xuanzheng") as progress:
+                xuanzheng_controller.xuanzheng_sync(timeout_min, on_progress=progress)
+            robot_controller.get_xuanzheng()
+        :param expected_s: Typical duration of the wait when the device reports no measurable value
+        """
+        options = self.stations.get(station, {}) if self.enabled else {}
+        staging = options.get("staging")
+        travel_s = self.travel_time(staging, options.get("travel_s")) if staging else 0.0
+        interlocks = options.get("interlocks", ["robot_idle", "robot_link", "no_held_fault"])
+        return StationWatch(self, station, staging, travel_s, interlocks, RemainingTimeEstimator(expected_s))
@@ -0,0 +1,224 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from src.uilt.logs_control.setup import device_control_logger
+
+TRANSITIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "motion_transitions.json")
+
+
+def _fixed(*commands):
+    return lambda: list(commands)
+
+
+# RobotController 方法 -> 该方法发送的指令，与 robot_device_new.py 保持一致
+# 返回 None 表示参数超出范围、真实方法会提示人工处理，这一步不参与规划，按原方法执行
+COMMAND_TABLE: Dict[str, Callable[..., Optional[List[str]]]] = {
+    "transfer_to_collect": lambda position_id, sample_id: [f"task_flask_move_py({position_id},1)",
+                                                           "task_flask_move_py(17,0)"],
+    "collect_to_start": lambda position_id: ["task_flask_move_py(17,1)", f"task_flask_move_py({position_id},0)"],
+    "into_smaple": lambda sample_id: ["task_scara_get_tool()", f"task_scara_sample_py({sample_id},1)"],
+    "to_clean_needle": _fixed("sample_ok", "task_scara_clean_py(1)"),
+    "task_scara_put_tool": _fixed("clean_ok", "task_scara_put_tool(1)"),
+    "collect_to_xuanzheng": lambda bottle_id: ["task_flask_move_py(17,1)", "task_Rotary_Evaporator_put_py()"],
+    "robot_to_home": _fixed("Vacuum_ok"),
+    "transfer_to_clean": _fixed("task_flask_move_py(15,0)"),
+    "task_shake_the_flask_py": _fixed("task_shake_the_flask_py()"),
+    "get_penlin_needle": _fixed("task_abb_clean_py()"),
+    "abb_clean_ok": _fixed("abb_clean_ok"),
+    "clean_to_home": _fixed("task_flask_move_py(15,1)"),
+    "get_transfer_needle": _fixed("task_transfer_flask_liquid_py()"),
+    "transfer_finish_flag": _fixed("Liquid_transfer_ok"),
+    "scara_to_home": _fixed("task_scara_filling_liquid_ok()"),
+    "clean_to_xuanzheng": _fixed("task_flask_move_py(16,1)", "task_Rotary_Evaporator_put_py()"),
+    "xuanzheng_to_warehouse": lambda position_id: ([f"task_flask_move_py({position_id},0)"]
+                                                   if position_id <= 14 else None),
+    "get_xuanzheng": _fixed("task_Rotary_Evaporator_get_py()"),
+    "get_big_bottle": lambda position_id: ["task_flask_move_py(15,1)", f"task_flask_move_py({position_id},0)"],
+    "small_big_to_clean": lambda position_id: ([f"task_flask_move_py({position_id},1)", "task_flask_move_py(16,0)"]
+                                               if position_id <= 6 else None),
+    "small_put_clean": _fixed("task_flask_move_py(16,0)"),
+    "clean_to_collect": _fixed("task_flask_move_py(15,1)", "task_flask_move_py(17,0)"),
+}
+
+
+def _pattern(template):
+    """'task_flask_move_py({p},0)' -> regex with a named group per placeholder"""
+    parts = re.split(r"\{(\w+)\}", template)
+    regex = ""
+    for i, part in enumerate(parts):
+        regex += re.escape(part) if i % 2 == 0 else f"(?P<{part}>[^,()]+)"
+    return re.compile(f"^{regex}$")
+
+
+@dataclass
+class PlannedMove:
+    methods: List[str]
+    commands: List[str]
+    # 不在指令表中的调用：原样执行 RobotController 的方法
+    call: Optional[tuple] = None
+
+
+@dataclass
+class MotionPlan:
+    moves: List[PlannedMove]
+    original_commands: List[str]
+    removed: List[str] = field(default_factory=list)
+    merges: int = 0
+    saved_s: float = 0.0
+    unknown: List[str] = field(default_factory=list)
+    unplanned: List[str] = field(default_factory=list)
+
+    def report(self):
+        lines = [f"Motion plan: {len(self.original_commands)} -> {sum(len(m.commands) for m in self.moves)} "
+                 f"commands, {len(self.moves)} moves, {self.merges} merges"]
+        for command in self.removed:
+            lines.append(f"  removed {command}")
+        lines.append(f"  estimated time saved: {self.saved_s:.1f}s")
+        if self.unknown:
+            lines.append(f"  no recorded duration for: {', '.join(sorted(set(self.unknown)))}")
+        if self.unplanned:
+            lines.append(f"  run as-is: {', '.join(self.unplanned)}")
+        return "\n".join(lines)
+
+
+class MotionPlanner:
+    def __init__(self, controller, transitions_path=TRANSITIONS_PATH):
+        """
+        Rewrites a sequence of RobotController calls using a declared table of compatible transitions
+        :param controller: RobotController executing the plan; its RobotTimingDB supplies duration estimates
+        :param transitions_path: JSON table with
+            merge:  [[method A, method B], ...] calls whose commands may be pipelined back to back
+            skip:   [{"move": method, "after": [...], "before": [...]}] calls that are redundant between the
+                    listed neighbours (an empty list matches any neighbour)
+            cancel: [[command template, command template], ...] adjacent command pairs that undo each other;
+                    {name} placeholders must match. Only list pairs with no side effect in between: a put/pick of
+                    a flask is not one, the flask may have to reach that position for an interlock or a device
+        Commands come from COMMAND_TABLE; calls missing from it, or whose arguments need an operator prompt, are
+        kept as separate moves and run through the controller method itself.
+        """
+        self.controller = controller
+        with open(transitions_path, "r", encoding="utf-8") as f:
+            table = json.load(f)
+        self.merge_pairs = {tuple(pair) for pair in table.get("merge", [])}
+        self.skip_rules = table.get("skip", [])
+        self.cancel_rules = [(_pattern(a), _pattern(b)) for a, b in table.get("cancel", [])]
+
+    @staticmethod
+    def commands_for(method, *args, **kwargs) -> Optional[List[str]]:
+        """Commands a RobotController method sends, None when the call cannot be planned"""
+        build = COMMAND_TABLE.get(method)
+        return build(*args, **kwargs) if build is not None else None
+
+    def _skippable(self, steps, index):
+        method = steps[index][0]
+        before = steps[index - 1][0] if index > 0 else None
+        after = steps[index + 1][0] if index + 1 < len(steps) else None
+        for rule in self.skip_rules:
+            if rule["move"] != method:
+                continue
+            if rule.get("after") and before not in rule["after"]:
+                continue
+            if rule.get("before") and after not in rule["before"]:
+                continue
+            return True
+        return False
+
+    def _cancels(self, first, second):
+        for pattern_a, pattern_b in self.cancel_rules:
+            match_a, match_b = pattern_a.match(first), pattern_b.match(second)
+            if match_a and match_b and match_a.groupdict() == match_b.groupdict():
+                return True
+        return False
+
+    def _expected(self, command, phase, plan: MotionPlan):
+        timing = getattr(self.controller, "timing", None)
+        value = timing.expected_duration(command, phase=phase) if timing is not None else None
+        if value is None:
+            plan.unknown.append(command)
+            return 0.0
+        return value
+
+    def plan(self, steps) -> MotionPlan:
+        """
+        :param steps: [("method", *args), ...] in workflow order, e.g. [("abb_clean_ok",), ("clean_to_home",)]
+        """
+        steps = [tuple(step) if isinstance(step, (tuple, list)) else (step,) for step in steps]
+        step_commands = [self.commands_for(*step) for step in steps]
+        kept = []
+        removed_steps = []
+        for index, step in enumerate(steps):
+            # 无法规划的调用不跳过
+            if step_commands[index] is not None and self._skippable(steps, index):
+                removed_steps.append(index)
+            else:
+                kept.append(index)
+
+        # 相邻且允许合并的调用合成一条流水线宏指令
+        moves: List[PlannedMove] = []
+        original = [command for commands in step_commands if commands for command in commands]
+        unplanned = []
+        merges = 0
+        merge_heads = []
+        for index in kept:
+            method = steps[index][0]
+            commands = step_commands[index]
+            if commands is None:
+                unplanned.append(method)
+                moves.append(PlannedMove([method], [], call=steps[index]))
+            elif (moves and commands and moves[-1].call is None
+                  and (moves[-1].methods[-1], method) in self.merge_pairs):
+                moves[-1].methods.append(method)
+                merge_heads.append((len(moves) - 1, len(moves[-1].commands)))
+                moves[-1].commands.extend(commands)
+                merges += 1
+            else:
+                moves.append(PlannedMove([method], list(commands)))
+
+        plan = MotionPlan(moves, original, merges=merges, unplanned=unplanned)
+        for index in removed_steps:
+            plan.removed.extend(step_commands[index])
+
+        # 合并处省去一次空闲间隔，后一条指令的 send->ok 与前一条的执行重叠；未开启流水线时宏指令逐条执行，不节省时间
+        gap = getattr(self.controller, "min_command_gap_s", 0.0)
+        pipelined = getattr(self.controller, "pipeline_depth", 1) > 1
+        heads = {(i, moves[i].commands[j]) for i, j in merge_heads} if pipelined else set()
+
+        # 合并后的宏指令内部去掉互相抵消的相邻指令
+        for i, move in enumerate(moves):
+            commands = []
+            for command in move.commands:
+                if commands and self._cancels(commands[-1], command):
+                    plan.removed.extend([commands.pop(), command])
+                else:
+                    commands.append(command)
+            move.commands = commands
+            for command in commands:
+                if (i, command) in heads:
+                    plan.saved_s += gap + self._expected(command, "send_ok", plan)
+        plan.moves = [m for m in moves if m.commands or m.call is not None]
+
+        for command in plan.removed:
+            plan.saved_s += self._expected(command, "total", plan) + gap
+        return plan
+
+    def run(self, plan: MotionPlan):
+        """Execute the planned moves in order"""
+        device_control_logger.info(plan.report())
+        print(plan.report())
+        for move in plan.moves:
+            if move.call is not None:
+                getattr(self.controller, move.call[0])(*move.call[1:])
+            elif len(move.commands) == 1:
+                command = move.commands[0]
+                self.controller._execute_scenario(command, command + "_finish")
+            else:
+                self.controller.run_macro(move.commands)
+
+    def execute(self, steps) -> MotionPlan:
+        """Plan and run `steps`, returning the plan"""
+        plan = self.plan(steps)
+        self.run(plan)
+        return plan
@@ -1,5 +1,9 @@
 from src.com_control.robot_com import RobotConnection
+from src.com_control.robot_fault_policy import FaultAction, classify
+from src.uilt.deadline_control import setup as deadline
 from src.uilt.logs_control.setup import device_control_logger
+from src.uilt.yaml_control.setup import config, get_base_url
+from src.device_control.sqlite.robot_timing import RobotTimingDB
 import threading
 import time
 import socket
@@ -7,55 +11,74 @@ import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import functools
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import Future
 
 def scenario_exception_handler(func):
+    """超时/断链时按 fault_policy 决定重试、跳过或终止，不再等待控制台输入"""
     @functools.wraps(func)
     def wrapper(self, cmd_full, expected_response, *args, **kwargs):
-        retry_count = 3
-        while True:
-            try:
-                return func(self, cmd_full, expected_response, *args, **kwargs)
-            except TimeoutError as e:
-                err_msg = str(e)
-                # 只处理特定超时
-                if f"超时未收到" in err_msg:
-                    # 检查是否断链
-                    if hasattr(self.connection, "is_connected") and not self.connection.is_connected():
-                        print("⚠️ 检测到断链，正在尝试重连...")
-                        for _ in range(retry_count):
-                            try:
-                                self.connection.connect()
-                                print("✅ 重连成功")
-                            except Exception as re:
-                                print(f"重连失败: {re}")
-                                time.sleep(1)
-                        print("❌ 重连3次失败，抛出异常")
-                        raise
-                    # 没断链，用户选择
-                    print(f"❌ 超时未收到：{expected_response}")
-                    print("请选择：1.继续（跳过此步） 2.重新执行 3.结束实验")
-                    choice = input("输入选项（1/2/3）：").strip()
-                    if choice == "1":
-                        print("⏭️ 跳过此方法")
-                        return False
-                    elif choice == "2":
-                        print("🔄 重新执行此方法")
-                        return func(self, cmd_full, expected_response, *args, **kwargs)
-                    else:
-                        print("🛑 结束实验，抛出异常")
-                        raise
-                else:
-                    raise
+        # 重试也在同一次占用内完成，其它线程的指令不会插在中间
+        with self.command_lock:
+            return self.fault_policy.execute(cmd_full,
+                                             lambda: func(self, cmd_full, expected_response, *args, **kwargs),
+                                             recover=self.connection.reconnect)
     return wrapper
 
+@dataclass
+class PendingCommand:
+    cmd_full: str
+    finish: Future
+    sent_at: float
+    ok_at: float
+    # 发送时前面还有指令在执行，ok->finish 含前一条的剩余时间
+    pipelined: bool = False
+
+
 class RobotController:
-    def __init__(self, mock):
+    def __init__(self, mock, fallback_delay_s=None, min_command_gap_s=None, ip=None, port=None, timing=None):
         """
             机器人设备控制
             :param mock: 是否启用 Mock 模式
+            :param ip: 控制器地址，默认取 com_config.yaml 的 robot_com（离线测试时指向 RobotSimulator）
+            :param port: 控制器端口，默认取配置 robot.port
+            :param fallback_delay_s: 无法确认控制器空闲时（首条指令、上一条指令未收到 _finish）发送前的等待时间
+            :param min_command_gap_s: 上一条指令正常结束后到下一条指令的最小间隔
+            :param timing: 指令耗时记录库 RobotTimingDB，默认使用 sqlite/RobotTiming.sqlite（Mock 模式不记录）
+            失败处理策略取配置 robot.fault_policy，可通过 fault_policy.add_listener 接收通知、resolve 处理人工事件
+            宏指令的流水线深度取配置 robot.pipeline_depth，默认 1：取瓶/放瓶等多条指令逐条等待 _finish，
+            只有确认控制器会缓存指令后才应调大
             1 是抬起来  0是放下
         """
-        self.connection = RobotConnection(mock=mock)
+        robot_config = config.get("robot", {})
+        self.connection = RobotConnection(ip=ip or get_base_url("robot_com"),
+                                          port=port or robot_config.get("port", 2000), mock=mock)
+        self.fallback_delay_s = robot_config.get("fallback_delay_s", 3) if fallback_delay_s is None else fallback_delay_s
+        self.min_command_gap_s = (robot_config.get("min_command_gap_s", 0.2)
+                                  if min_command_gap_s is None else min_command_gap_s)
+        self.pipeline_depth = robot_config.get("pipeline_depth", 1)
+        # 失败处理策略（重试/跳过/终止/等待人工），与连接共用
+        self.fault_policy = self.connection.fault_policy
+        # 每条指令的 send->ok、ok->finish 耗时，adaptive_timeouts 打开时据此计算超时
+        self.timing = timing if timing is not None else (RobotTimingDB() if not mock else None)
+        self.adaptive_timeouts = robot_config.get("adaptive_timeouts", False)
+        # 上一条指令已收到 _finish 时控制器处于空闲状态
+        self.ready = False
+        self.last_finish_at = 0.0
+        # 一条指令或一个宏指令执行期间独占连接与消息队列；流程线程、并行线程与预动作线程都先取得它
+        self.command_lock = threading.RLock()
+
+    def _wait_until_ready(self):
+        """Wait before sending: only a short gap after a clean _finish, the fallback delay otherwise"""
+        if self.connection.mock:
+            return
+        if self.ready:
+            delay = self.min_command_gap_s - (time.monotonic() - self.last_finish_at)
+        else:
+            delay = self.fallback_delay_s
+        if delay > 0:
+            deadline.sleep(delay)
 
     @scenario_exception_handler
     def _execute_scenario(self, cmd_full, expected_response):
@@ -65,13 +88,139 @@ class RobotController:
         :param expected_response: 期望的响应内容
         :return: 布尔值（操作是否成功）
         """
-        time.sleep(3)
-        # 发送指令并记录操作
-        self.connection.send_command(cmd_full)
-        print(f"📤 Command Sent: {cmd_full}")
-        self.connection.wait_for_response(cmd_full + "ok", 20)
+        self._wait_until_ready()
+        self.ready = False
+        pending = self._send_and_ack(cmd_full)
         print("开始执行------")
-        self.connection.wait_for_response(cmd_full + "_finish", 120)
+        self._wait_finish(pending)
+
+    def _timeout(self, cmd_full, phase, default):
+        if not self.adaptive_timeouts or self.timing is None:
+            return default
+        return self.timing.suggest_timeout(cmd_full, phase, default)
+
+    def _record_timing(self, cmd_full, send_ok_s, ok_finish_s, status):
+        if self.timing is None or self.connection.mock:
+            return
+        try:
+            self.timing.record(cmd_full, send_ok_s, ok_finish_s, status)
+        except Exception as e:
+            device_control_logger.error(f"Failed to record robot timing for {cmd_full}: {e}")
+
+    def _ack_timeout(self, cmd_full, ahead=()):
+        """
+        ok timeout of one send
+        :param ahead: Commands of the macro still running; the controller may only ack once they have finished,
+                      so the timeout also covers their remaining ok->finish timeouts
+        """
+        timeout = self._timeout(cmd_full, "send_ok", 20)
+        now = time.monotonic()
+        for pending in ahead:
+            timeout += max(0.0, self._timeout(pending.cmd_full, "ok_finish", 120) - (now - pending.ok_at))
+        return timeout
+
+    def _send_and_ack(self, cmd_full, ahead=()):
+        """
+        Send one command and wait for its ok; returns the pending command awaiting _finish
+        :param ahead: In-flight commands the controller runs before this one
+        """
+        # 发送前先登记期望的应答，避免 ok 与 _finish 连续到达时丢失；之前放弃的同名指令迟到的应答先清掉
+        self.connection.discard(cmd_full)
+        ack = self.connection.expect(cmd_full + "ok")
+        finish = self.connection.expect(cmd_full + "_finish")
+        # 发送指令并记录操作
+        sent_at = time.monotonic()
+        try:
+            self.connection.send_command(cmd_full)
+            print(f"📤 Command Sent: {cmd_full}")
+            self.connection.wait_future(ack, cmd_full + "ok", self._ack_timeout(cmd_full, ahead))
+        except BaseException as e:
+            # 失败的这次发送不再等待 _finish：残留的等待者会抢走重试指令的 _finish，也会让 ping 一直停用
+            self.connection._drop_waiter(ack, cmd_full + "ok")
+            self.connection._drop_waiter(finish, cmd_full + "_finish")
+            if isinstance(e, TimeoutError):
+                self._record_timing(cmd_full, None, None, "ack_timeout")
+            raise
+        return PendingCommand(cmd_full, finish, sent_at, time.monotonic(), pipelined=bool(ahead))
+
+    def _wait_finish(self, pending):
+        cmd_full = pending.cmd_full
+        try:
+            self.connection.wait_future(pending.finish, cmd_full + "_finish",
+                                        self._timeout(cmd_full, "ok_finish", 120))
+        except TimeoutError:
+            self._record_timing(cmd_full, pending.ok_at - pending.sent_at, None, "finish_timeout")
+            raise
+        self.last_finish_at = time.monotonic()
+        # 流水线中的耗时含前面指令的执行时间，单独标记，不参与超时与规划统计
+        self._record_timing(cmd_full, pending.ok_at - pending.sent_at, self.last_finish_at - pending.ok_at,
+                            "pipelined" if pending.pipelined else "ok")
+        self.ready = True
+
+    def run_macro(self, commands, depth=None):
+        """
+        按顺序执行一组指令，控制器回复 ok（已缓存指令）后立即发送下一条
+        :param commands: 指令列表
+        :param depth: 同时在执行中的指令数上限，1 表示逐条等待 _finish，默认取配置 pipeline_depth
+        """
+        with self.command_lock:
+            self._run_macro(commands, self.pipeline_depth if depth is None else depth)
+
+    def _run_macro(self, commands, depth):
+        if depth <= 1 or self.connection.mock:
+            for command in commands:
+                self._execute_scenario(command, command + "_finish")
+            return
+        self._wait_until_ready()
+        self.ready = False
+        in_flight = deque()
+        for index, command in enumerate(commands):
+            while len(in_flight) >= depth:
+                self._drain_one(in_flight)
+                self.ready = False
+            pipelined = bool(in_flight)
+            try:
+                in_flight.append(self._send_and_ack(command, in_flight))
+            except deadline.DeadlineExceeded:
+                # 截止时间由调用方决定，不交给失败处理策略
+                raise
+            except Exception as e:
+                if getattr(e, "fault_incident", None) is not None:
+                    raise
+                # 这条没收到 ok，后面的指令还没发送：先等前面的指令结束，再按策略逐条执行剩余指令
+                while in_flight:
+                    self._drain_one(in_flight)
+                # 前一条执行中发出的指令可能已被控制器缓存、只是 ok 没到，自动重发可能让动作执行两次，交给人工决定
+                retry_safe = not (pipelined and classify(e) == "ack_timeout")
+                incident = self.fault_policy.decide(command, e, allow_retry=retry_safe)
+                if incident.decision == FaultAction.ABORT:
+                    e.fault_incident = incident
+                    raise
+                remaining = commands[index:] if incident.decision == FaultAction.RETRY else commands[index + 1:]
+                self.connection.reconnect()
+                for rest in remaining:
+                    self._execute_scenario(rest, rest + "_finish")
+                return
+        while in_flight:
+            self._drain_one(in_flight)
+
+    def _drain_one(self, in_flight):
+        """Wait for the oldest in-flight command of a macro, consulting the fault policy on failure"""
+        pending = in_flight.popleft()
+        try:
+            self._wait_finish(pending)
+        except deadline.DeadlineExceeded:
+            raise
+        except Exception as e:
+            if getattr(e, "fault_incident", None) is not None:
+                raise
+            # 后面的指令已在执行时不能重发这一条，否则动作顺序会乱
+            incident = self.fault_policy.decide(pending.cmd_full, e, allow_retry=not in_flight)
+            if incident.decision == FaultAction.ABORT:
+                e.fault_incident = incident
+                raise
+            if incident.decision == FaultAction.RETRY:
+                self._execute_scenario(pending.cmd_full, pending.cmd_full + "_finish")
 
 
 
@@ -88,44 +237,26 @@ class RobotController:
         return self._execute_scenario(command, "Sample loading ready")
 
     def transfer_to_collect(self,position_id,sample_id):
-        command = f"task_flask_move_py({position_id},1)"
-        self._execute_scenario(command, f"task_flask_move_py({position_id},1)_finish")
-        command = f"task_flask_move_py(17,0)"
-        self._execute_scenario(command, "task_flask_move_py(17,0)_finish")
+        self.run_macro([f"task_flask_move_py({position_id},1)", "task_flask_move_py(17,0)"])
 
         # command = f"task_scara_sample_py({sample_id},1)"
         # self._execute_scenario(command, f"task_scara_sample_py({sample_id},1)_finish")
 
     def collect_to_start(self,position_id):
-        command = f"task_flask_move_py(17,1)"
-        self._execute_scenario(command, "task_flask_move_py(17,1)_finish")
-        command = f"task_flask_move_py({position_id},0)"
-        self._execute_scenario(command, f"task_flask_move_py({position_id},0)_finish")
+        self.run_macro(["task_flask_move_py(17,1)", f"task_flask_move_py({position_id},0)"])
 
     def into_smaple(self,sample_id):
-        command = f"task_scara_get_tool()"
-        self._execute_scenario(command, "task_scara_get_tool()_finish")
-        command = f"task_scara_sample_py({sample_id},1)"
-        self._execute_scenario(command, f"task_scara_sample_py({sample_id},1)_finish")
+        self.run_macro(["task_scara_get_tool()", f"task_scara_sample_py({sample_id},1)"])
 
     def to_clean_needle(self):
-        command = f"sample_ok"
-        self._execute_scenario(command, "sample_ok_finish")
-        command = f"task_scara_clean_py(1)"
-        self._execute_scenario(command, "Sample loading ready")
+        self.run_macro(["sample_ok", "task_scara_clean_py(1)"])
 
     def task_scara_put_tool(self):
-        command = f"clean_ok"
-        self._execute_scenario(command, "clean_ok_finish")
-        command = f"task_scara_put_tool(1)"
-        self._execute_scenario(command, "task_scara_put_tool(1)_finish")
+        self.run_macro(["clean_ok", "task_scara_put_tool(1)"])
 
 
     def collect_to_xuanzheng(self,bottle_id):
-        command = f"task_flask_move_py(17,1)"
-        self._execute_scenario(command, "task_flask_move_py(17,1)_finish")
-        command = f"task_Rotary_Evaporator_put_py()"
-        self._execute_scenario(command, "task_Rotary_Evaporator_put_py()_finish")
+        self.run_macro(["task_flask_move_py(17,1)", "task_Rotary_Evaporator_put_py()"])
 
     def robot_to_home(self):
         command = f"Vacuum_ok"
@@ -166,10 +297,7 @@ class RobotController:
 
 
     def clean_to_xuanzheng(self):
-        command = f"task_flask_move_py(16,1)"
-        self._execute_scenario(command, "task_flask_move_py(16,1)_finish")
-        command = f"task_Rotary_Evaporator_put_py()"
-        self._execute_scenario(command, "task_Rotary_Evaporator_put_py()_finish")
+        self.run_macro(["task_flask_move_py(16,1)", "task_Rotary_Evaporator_put_py()"])
         pass
 
     def xuanzheng_to_warehouse(self, position_id):
@@ -185,20 +313,14 @@ class RobotController:
         self._execute_scenario(command, "task_Rotary_Evaporator_get_py()_finish")
 
     def get_big_bottle(self, position_id):
-        command = f"task_flask_move_py(15,1)"
-        self._execute_scenario(command, "task_flask_move_py(15,1)_finish")
-        command = f"task_flask_move_py({position_id},0)"
-        self._execute_scenario(command, "task_flask_move_py(7,0)_finish")
+        self.run_macro(["task_flask_move_py(15,1)", f"task_flask_move_py({position_id},0)"])
 
 
     def small_big_to_clean(self,position_id):
         if position_id > 6:
             input("输入位置不正确，请将小瓶放到 6 号位置，输入enter继续")
             position_id = 6
-        command = f"task_flask_move_py({position_id},1)"
-        self._execute_scenario(command, f"task_flask_move_py({position_id},1)_finish")
-        command = f"task_flask_move_py(16,0)"
-        self._execute_scenario(command, "task_flask_move_py(16,0)_finish")
+        self.run_macro([f"task_flask_move_py({position_id},1)", "task_flask_move_py(16,0)"])
 
     def small_put_clean(self):
         command = f"task_flask_move_py(16,0)"
@@ -206,10 +328,7 @@ class RobotController:
 
 
     def clean_to_collect(self):
-        command = f"task_flask_move_py(15,1)"
-        self._execute_scenario(command, "task_flask_move_py(15,1)_finish")
-        command = f"task_flask_move_py(17,0)"
-        self._execute_scenario(command, "task_flask_move_py(17,0)_finish")
+        self.run_macro(["task_flask_move_py(15,1)", "task_flask_move_py(17,0)"])
 
 
 
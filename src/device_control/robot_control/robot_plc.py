@@ -1,13 +1,71 @@
-from src.com_control.PLC_com import PLCConnection
+from src.com_control import plc_registry
+import functools
+import os
 import threading
 import time
 import json
+from dataclasses import dataclass
+from typing import Dict
 from src.uilt.logs_control.setup import device_control_logger
 
+FUNCTION_MAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "robot_fun.json")
+
+
+@dataclass(frozen=True)
+class FunctionPlan:
+    name: str
+    num: int
+    params: Dict[str, int]
+
+    @property
+    def size(self):
+        """Registers written: function number plus the highest parameter slot"""
+        return 1 + max(self.params.values(), default=0)
+
+    def encode(self, fun_params: dict):
+        """Register block starting at FUN_NAME_ADDRESS: [num, param 1, param 2, ...]"""
+        values = [self.num] + [0] * (self.size - 1)
+        for param_name, param_index in self.params.items():
+            if param_name in fun_params:
+                values[param_index] = int(fun_params[param_name])
+            else:
+                print(f"警告: 缺少参数 {param_name}，写入 0")
+        unknown = set(fun_params) - set(self.params)
+        if unknown:
+            print(f"警告: 功能 {self.name} 没有参数 {sorted(unknown)}，已忽略")
+        return values
+
+
+@functools.lru_cache(maxsize=None)
+def compile_function_map(file_path=FUNCTION_MAP_PATH):
+    """Load robot_fun.json once and turn every entry into a FunctionPlan"""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"加载 JSON 文件失败: {e}")
+        return {}
+    plans = {}
+    for name, fun_data in data.items():
+        params = dict(fun_data.get("params", {}))
+        indexes = list(params.values())
+        if any(i < 1 for i in indexes) or len(set(indexes)) != len(indexes):
+            raise ValueError(f"Invalid parameter slots for robot function {name}: {params}")
+        plans[name] = FunctionPlan(name, fun_data["num"], params)
+    return plans
+
+
 class RobotPLC:
-    def __init__(self, mock=False):
+    def __init__(self, mock=False, function_map_path=FUNCTION_MAP_PATH):
+        """
+        通过 PLC 启动机器人功能
+        :param mock: 是否启用 Mock 模式
+        :param function_map_path: 功能表 robot_fun.json，默认与本文件同目录
+        状态由 robot_plc 的扫描周期统一读取：线圈 1002~1101 一次块读取，忙标志寄存器 1111 一次读取
+        """
         self.mock = mock
-        self.plc = PLCConnection(mock=mock)
+        self.plc = plc_registry.get("robot_plc", mock=mock)
+        self.scanner = plc_registry.scanner("robot_plc", mock=mock)
         self.robot_error = False
         self.busy_flag = 0
         self.start_flag = False
@@ -18,48 +76,66 @@ class RobotPLC:
         self.FINISH_FLAG_ADDRESS = 1101  # bool
         self.START_FLAG_ADDRESS = 1002  # bool
         self.ROBOT_ERROR_ADDRESS = 1004  # bool
-
-        # 读取 JSON 文件
-        self.json_path = r"D:\back\rotary_evaporator\src\device_control\robot_control\robot_fun.json"
-        # 读取 JSON 文件
-        self.function_map = self.load_function_map(self.json_path)
-
+        # 一次读取覆盖全部状态线圈
+        self.STATUS_COIL_START = min(self.START_FLAG_ADDRESS, self.ROBOT_ERROR_ADDRESS, self.FINISH_FLAG_ADDRESS)
+        self.STATUS_COIL_COUNT = max(self.START_FLAG_ADDRESS, self.ROBOT_ERROR_ADDRESS,
+                                     self.FINISH_FLAG_ADDRESS) - self.STATUS_COIL_START + 1
+
+        self.json_path = function_map_path
+        # 功能表只编译一次
+        self.function_map = compile_function_map(self.json_path)
+
+        # 每次刷新状态后通知等待者
+        self.status_cond = threading.Condition()
+        self.status_time = 0.0
+        self.status_job = None
         if self.mock is False:
-            # 启动轮询线程
-            self.polling_thread = threading.Thread(target=self.poll_plc_status, daemon=True)
-            self.polling_thread.start()
-
+            self.status_job = self.scanner.every(self.scanner.interval, self.poll_plc_status, name="robot_plc_status")
 
     def poll_plc_status(self):
         """
-        轮询 PLC 的状态信号:
+        读取一次 PLC 状态信号并唤醒等待者:
         - robot_error (ROBOT_ERROR_ADDRESS)
         - busy_flag (BUSY_FLAG_ADDRESS)
         - finish_flag (FINISH_FLAG_ADDRESS)
         """
-        while True:
-            try:
-                self.robot_error = self.plc.read_coils(self.ROBOT_ERROR_ADDRESS)
-                self.busy_flag = self.plc.read_holding_registers(self.BUSY_FLAG_ADDRESS,1)
-                self.finish_flag = self.plc.read_coils(self.FINISH_FLAG_ADDRESS)
-            except Exception as e:
-                print(f"轮询 PLC 状态失败: {e}")
+        bits = self.plc.read_coils(self.STATUS_COIL_START, self.STATUS_COIL_COUNT)
+        busy = self.plc.read_holding_registers(self.BUSY_FLAG_ADDRESS, 1)
+        with self.status_cond:
+            if bits is None or busy is None:
+                print("轮询 PLC 状态失败")
                 self.robot_error = False
                 self.busy_flag = -1
                 self.finish_flag = False
-            time.sleep(1)  # 轮询间隔 1 秒
-
-
+            else:
+                self.start_flag = bool(bits[self.START_FLAG_ADDRESS - self.STATUS_COIL_START])
+                self.robot_error = bool(bits[self.ROBOT_ERROR_ADDRESS - self.STATUS_COIL_START])
+                self.finish_flag = bool(bits[self.FINISH_FLAG_ADDRESS - self.STATUS_COIL_START])
+                self.busy_flag = busy[0]
+            self.status_time = time.monotonic()
+            self.status_cond.notify_all()
+
+    def _wait_status(self, predicate, waiting_msg, timeout=None):
+        """Block until a status refreshed after this call satisfies `predicate`"""
+        if self.mock:
+            return True
+        since = time.monotonic()
+        last_log = 0.0
+        deadline = None if timeout is None else since + timeout
+        with self.status_cond:
+            while not (self.status_time > since and predicate()):
+                if self.status_time > since and time.monotonic() - last_log >= 5:
+                    print(waiting_msg)
+                    last_log = time.monotonic()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Robot PLC wait timed out after {timeout}s: {waiting_msg}")
+                self.status_cond.wait(1 if remaining is None else min(remaining, 1))
+        return True
 
     def load_function_map(self, file_path):
-        """加载 JSON 文件"""
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"加载 JSON 文件失败: {e}")
-            return {}
-
+        """加载并编译功能表"""
+        return compile_function_map(file_path)
 
     def reset_start_flag(self):
         """重置启动标志位"""
@@ -71,85 +147,57 @@ class RobotPLC:
         - fun_name: 需要执行的功能名（如 "run_A_to_B"）
         - fun_params: 该功能需要的参数（如 {"p_A":20, "p_B":90}）
         """
-        if fun_name not in self.function_map:
+        plan = self.function_map.get(fun_name)
+        if plan is None:
             print(f"错误: 未找到功能 {fun_name}")
             return False
 
-        fun_data = self.function_map[fun_name]
-        num = fun_data["num"]  # 获取功能编号
-        param_map = fun_data["params"]  # 获取参数映射
-
-        # 写入功能编号
-        self.plc.write_single_register(self.FUN_NAME_ADDRESS, num)
-
-        # 写入参数
-        param_values = []
-        for param_name, param_index in param_map.items():
-            if param_name in fun_params:
-                param_value = fun_params[param_name]
-                param_address = self.FUN_PARAMS_ADDRESS + (param_index - 1)  # 计算参数存储地址
-                self.plc.write_registers(param_address, param_value)
-                param_values.append((param_address, param_value))
-            else:
-                print(f"警告: 缺少参数 {param_name}")
+        # 功能编号和参数一次写入
+        values = plan.encode(fun_params)
+        if not self.plc.write_registers(self.FUN_NAME_ADDRESS, values):
+            device_control_logger.error(f"Failed to write robot function {fun_name}: {values}")
+            return False
 
         # 启动机器人
         self.plc.write_coil(self.START_FLAG_ADDRESS, True)
 
-        print(f"已启动功能 {fun_name} (编号 {num})，参数: {param_values}")
+        print(f"已启动功能 {fun_name} (编号 {plan.num})，参数: {values[1:]}")
 
         self.function_running()
-        print(f"正在运行 {fun_name} (编号 {num})，参数: {param_values}")
+        print(f"正在运行 {fun_name} (编号 {plan.num})，参数: {values[1:]}")
 
         self.plc.write_coil(self.START_FLAG_ADDRESS, False)
 
         self.function_finish()
-        print(f"运行结束 {fun_name} (编号 {num})，参数: {param_values}")
+        print(f"运行结束 {fun_name} (编号 {plan.num})，参数: {values[1:]}")
 
         self.plc.write_coil(self.FINISH_FLAG_ADDRESS, False)
-
+        with self.status_cond:
+            self.finish_flag = False
 
         return True
 
     def execute_function(self, fun_name: str, fun_params: dict):
         """
-        执行机器人功能前检查BUSY_FLAG_ADDRESS是否为0
-        - 如果BUSY_FLAG_ADDRESS不为0，则返回错误
-        - 如果为0，则执行run_fun
+        执行机器人功能前等待BUSY_FLAG_ADDRESS变为0，再执行run_fun
         """
-        while True:
-            if self.busy_flag != 0:
-                print(f"错误: 机器人正忙 (BUSY_FLAG_ADDRESS={self.busy_flag})，无法执行 {fun_name}")
-            else:
-                return self.run_fun(fun_name, fun_params)
-            time.sleep(1)
+        self._wait_status(lambda: self.busy_flag == 0,
+                          f"错误: 机器人正忙 (BUSY_FLAG_ADDRESS!=0)，暂时无法执行 {fun_name}")
+        return self.run_fun(fun_name, fun_params)
 
+    def function_running(self, timeout=None):
+        """等待BUSY_FLAG_ADDRESS变为1（机器人开始运行），短功能在一个扫描周期内已结束时以完成标志为准"""
+        self._wait_status(lambda: self.busy_flag == 1 or self.finish_flag is True, "机器人还没有开始运行........", timeout)
+        print(f"机器人开始运行.........")
 
-    def function_running(self):
-        """
-        执行机器人功能前检查BUSY_FLAG_ADDRESS是否为0
-        - 如果BUSY_FLAG_ADDRESS不为0，则返回错误
-        - 如果为0，则执行run_fun
-        """
-        while True:
-            if self.busy_flag == 1:
-                print(f"机器人开始运行.........")
-                return
-            print("机器人还没有开始运行........")
-            time.sleep(1)
-
-    def function_finish(self):
-        """
-        执行机器人功能前检查BUSY_FLAG_ADDRESS是否为0
-        - 如果BUSY_FLAG_ADDRESS不为0，则返回错误
-        - 如果为0，则执行run_fun
-        """
-        while True:
-            if self.finish_flag is True:
-                print("机器人运行结束........")
-                return
-            print("机器人正在运行........")
-            time.sleep(1)
+    def function_finish(self, timeout=None):
+        """等待FINISH_FLAG_ADDRESS置位（机器人运行结束）"""
+        self._wait_status(lambda: self.finish_flag is True, "机器人正在运行........", timeout)
+        print("机器人运行结束........")
+
+    def close(self):
+        if self.status_job:
+            self.status_job.cancel()
 
 
 if __name__ == '__main__':
@@ -161,5 +209,3 @@ if __name__ == '__main__':
         "p_C":60
     }
     robot_plc.execute_function(fun_name,fun_params)
-
-
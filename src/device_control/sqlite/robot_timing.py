@@ -0,0 +1,116 @@
+import math
+import os
+import re
+
+from src.device_control.sqlite.SQLiteDB import SQLiteDB
+
+_COMMAND_PATTERN = re.compile(r"^(\w+)(?:\((.*)\))?$")
+
+
+def split_command(cmd_full):
+    """'task_flask_move_py(15,1)' -> ('task_flask_move_py', '15,1')"""
+    match = _COMMAND_PATTERN.match(cmd_full.strip())
+    if not match:
+        return cmd_full, ""
+    return match.group(1), (match.group(2) or "").replace(" ", "")
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile of a sorted list, q in [0, 100]"""
+    if not values:
+        return None
+    pos = (len(values) - 1) * q / 100
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+class RobotTimingDB(SQLiteDB):
+    """Inherit from SQLiteDB, stores send->ok and ok->finish durations of every robot command"""
+
+    PHASES = {"send_ok": "send_ok_s", "ok_finish": "ok_finish_s", "total": "send_ok_s + ok_finish_s"}
+
+    def __init__(self, db_name=None):
+        super().__init__()
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.db_name = db_name or os.path.join(base_dir, "RobotTiming.sqlite")
+        self.table_name = "robot_timing"
+        self.init_table()
+
+    def init_table(self):
+        """Ensure robot_timing table exists"""
+        self.create_table(
+            self.table_name,
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, command TEXT NOT NULL, params TEXT NOT NULL, "
+            "send_ok_s REAL, ok_finish_s REAL, status TEXT NOT NULL, "
+            "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP"
+        )
+        self.execute_query(
+            f"CREATE INDEX IF NOT EXISTS idx_{self.table_name}_command ON {self.table_name} (command, params)"
+        )
+
+    def record(self, cmd_full, send_ok_s, ok_finish_s, status="ok"):
+        """
+        Store one command execution
+        :param cmd_full: Command as sent, e.g. task_flask_move_py(15,1)
+        :param send_ok_s: Seconds from send to `ok`, None if it never came
+        :param ok_finish_s: Seconds from `ok` to `_finish`, None if it never came
+        :param status: "ok", "ack_timeout", "finish_timeout", or "pipelined" for a command sent while another was
+                       still running; only "ok" samples, taken with the robot idle, feed the statistics
+        """
+        command, params = split_command(cmd_full)
+        self.execute_query(
+            f"INSERT INTO {self.table_name} (command, params, send_ok_s, ok_finish_s, status) VALUES (?, ?, ?, ?, ?)",
+            (command, params, send_ok_s, ok_finish_s, status),
+        )
+
+    def durations(self, command, params=None, phase="total"):
+        """Sorted durations of successful executions sent while idle; `params=None` pools every parameter set"""
+        if phase not in self.PHASES:
+            raise ValueError(f"Unknown phase {phase}, expected one of {list(self.PHASES)}")
+        command, parsed = split_command(command)
+        params = parsed if params is None and parsed else params
+        where = "command = ? AND status = 'ok'"
+        args = [command]
+        if params is not None:
+            where += " AND params = ?"
+            args.append(str(params).replace(" ", ""))
+        rows = self.query_data(self.table_name, self.PHASES[phase], where, tuple(args))
+        return sorted(r[0] for r in rows if r[0] is not None)
+
+    def percentiles(self, command, params=None, phase="total", qs=(50, 90, 95, 99)):
+        """{q: seconds} for the requested percentiles, empty when nothing has been recorded"""
+        values = self.durations(command, params, phase)
+        if not values:
+            return {}
+        return {q: percentile(values, q) for q in qs}
+
+    def histogram(self, command, params=None, phase="total", bins=10):
+        """[(low, high, count), ...] over `bins` equal-width buckets"""
+        values = self.durations(command, params, phase)
+        if not values:
+            return []
+        low, high = values[0], values[-1]
+        width = (high - low) / bins or 1.0
+        counts = [0] * bins
+        for v in values:
+            counts[min(int((v - low) / width), bins - 1)] += 1
+        return [(low + i * width, low + (i + 1) * width, c) for i, c in enumerate(counts)]
+
+    def expected_duration(self, command, params=None, phase="total", q=50, default=None):
+        """Typical duration for planning, `default` when there is no data"""
+        result = self.percentiles(command, params, phase, (q,))
+        return result.get(q, default)
+
+    def suggest_timeout(self, command, phase, default, q=99, margin=1.5, min_samples=10):
+        """Timeout derived from the q-th percentile times `margin`, `default` until enough samples exist"""
+        values = self.durations(command, None, phase)
+        if len(values) < min_samples:
+            return default
+        return max(percentile(values, q) * margin, 1.0)
+
+    def summary(self):
+        """[(command, params, count, mean total seconds)] for every command seen"""
+        return self.execute_query(
+            f"SELECT command, params, COUNT(*), AVG(send_ok_s + ok_finish_s) FROM {self.table_name} "
+            f"WHERE status = 'ok' GROUP BY command, params ORDER BY command, params"
+        )
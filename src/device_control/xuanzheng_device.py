@@ -1,9 +1,9 @@
 import time
 
 from src.com_control.xuanzheng_com import ConnectionController
-from src.com_control import plc
+from src.com_control import plc_registry
+from src.uilt.deadline_control import setup as deadline
 import json
-import signal
 import os
 import threading
 from datetime import datetime
@@ -13,19 +13,12 @@ from contextlib import contextmanager
 
 @contextmanager
 def timeout(seconds):
-    """Timeout context manager"""
-
-    def timeout_handler(signum, frame):
-        raise TimeoutError(f"Operation timed out ({seconds}s)")
-
-    old_handler = signal.signal(signal.SIGABRT, timeout_handler)
-    signal.alarm(seconds)
-
-    try:
-        yield
-    finally:
-        signal.alarm(0)
-        signal.signal(signal.SIGABRT, old_handler)
+    """
+    Timeout context manager, usable in any thread
+    Blocking device waits inside the block raise DeadlineExceeded (a TimeoutError) once `seconds` have passed.
+    """
+    with deadline.Deadline(seconds, name=f"Operation ({seconds}s)") as d:
+        yield d
 
 
 
@@ -34,8 +27,7 @@ def timeout(seconds):
 class XuanZHengController:
     def __init__(self,mock=False):
         self.connection = ConnectionController(mock)
-        self.plc = plc
-        self.plc.mock = mock
+        self.plc = plc_registry.get("plc_com", mock=mock)
         self.HEIGHT_ADDRESS = 502
         self.AUTO_SET = 500
         self.AUTO_FINISH = 501
@@ -70,7 +62,7 @@ class XuanZHengController:
                     buffer.append(f"[{ts}] {data}")
                 except Exception as e:
                     print(f"Collection error: {e}")
-                time.sleep(interval)
+                deadline.sleep(interval)
         except KeyboardInterrupt:
             print("End signal received, saving...")
         finally:
@@ -138,7 +130,7 @@ class XuanZHengController:
                     fig.canvas.flush_events()
                 except Exception as e:
                     print(f"Collection/plotting error: {e}")
-                time.sleep(interval)
+                deadline.sleep(interval)
         except KeyboardInterrupt:
             print("End signal received, saving...")
         finally:
@@ -154,8 +146,11 @@ class XuanZHengController:
             print(f"Collection stopped, {len(buffer)} records, data: {txt_path}, image: {png_path}")
             return txt_path, png_path
 
-    def xuanzheng_sync(self, timeout_min=2):
-        """Poll to get rotary evaporator current state, wait for it to run before ending"""
+    def xuanzheng_sync(self, timeout_min=2, on_progress=None):
+        """
+        Poll to get rotary evaporator current state, wait for it to run before ending
+        :param on_progress: Called as on_progress(running=bool) after every poll, e.g. RobotLookahead.watch
+        """
 
         has_started = False
         timeout = timeout_min * 60
@@ -182,6 +177,8 @@ class XuanZHengController:
                     break
 
                 is_running = result.get("globalStatus", {}).get("running", False)
+                if on_progress:
+                    on_progress(running=is_running)
 
                 if is_running:
                     print("Device is running...")
@@ -192,8 +189,10 @@ class XuanZHengController:
                 else:
                     print("Not yet started, continuing to wait...")
 
-                time.sleep(2)
+                deadline.sleep(2)
 
+        except deadline.DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"Exception during xuanzheng_sync poll: {e}")
         finally:
@@ -275,14 +274,14 @@ class XuanZHengController:
             )
         elif volume == 0:
             self.plc.write_single_register(self.HEIGHT_ADDRESS, 0)
-        time.sleep(1)
+        deadline.sleep(1)
 
         self.plc.write_coil(self.AUTO_SET,True)
 
 
-        time.sleep(3)
+        deadline.sleep(3)
         self.height_finish_async()
-        time.sleep(1)
+        deadline.sleep(1)
         self.plc.write_coil(self.AUTO_SET,False)
 
 
@@ -293,16 +292,16 @@ class XuanZHengController:
     def height_finish_async(self):
         while True:
             print("-----------height_finish_async----------")
-            done = self.plc.read_coils(self.AUTO_FINISH,1)[0]
-            time.sleep(2)
+            done = self.plc.read_coil(self.AUTO_FINISH)
+            deadline.sleep(2)
             if done:
                 return True
     def start_waste_liquid(self):
         print("start waste_liquid")
         self.plc.write_coil(self.WASTE_LIQUID, True)
-        time.sleep(1)
+        deadline.sleep(1)
         self.plc.write_coil(self.WASTE_LIQUID, False)
-        time.sleep(2)
+        deadline.sleep(2)
         print("-----stop--------------waste_liquid---------------------------")
         # self.waste_finish_async()
 
@@ -324,11 +323,11 @@ class XuanZHengController:
 
     def waste_finish_async(self):
         while True:
-            done = self.plc.read_coils(self.WASTE_LIQUID_FINISH)[0]
+            done = self.plc.read_coil(self.WASTE_LIQUID_FINISH)
             # print(done)
             if done:
                 return True
-            time.sleep(1)
+            deadline.sleep(1)
 
 
         # pass
@@ -373,7 +372,7 @@ class XuanZHengController:
         response = self.change_device_parameters(heating=None, cooling=None, vacuum=None,
                                                                   rotation=None,
                                                                  lift=None, running=running)
-        time.sleep(10)
+        deadline.sleep(10)
 
         print("PUT请求响应：", response)
 
@@ -396,11 +395,12 @@ class XuanZHengController:
                                                                  rotation=None,
                                                                  lift=None, running=None)
         print("PUT请求响应：", response)
-        time.sleep(5)
+        deadline.sleep(5)
 
-    def vacuum_until_below_threshold(self, threshold=400):
+    def vacuum_until_below_threshold(self, threshold=400, on_progress=None):
         """
         启动抽真空，直到 vacuum.act 小于阈值（默认400）后停止。
+        :param on_progress: 每次读取后调用 on_progress(value=act, target=threshold)，用于预测剩余时间
         """
         if self.mock:
             print(f"✅ 真空值已低于 {threshold}，停止抽真空")
@@ -415,13 +415,15 @@ class XuanZHengController:
 
             act = result.get("vacuum", {}).get("act", 9999)
             print(f"当前真空值: {act:.1f} mbar")
+            if on_progress:
+                on_progress(value=act, target=threshold)
 
             if act < threshold:
                 print(f"✅ 真空值已低于 {threshold}，停止抽真空")
                 self.stop_vacuum()
                 break
 
-            time.sleep(1)
+            deadline.sleep(1)
 
     def drain_until_above_threshold(self, threshold=900):
         """
@@ -452,10 +454,10 @@ class XuanZHengController:
 
             if act > threshold:
                 print(f"✅ 真空值已高于 {threshold}，等待 5 秒")
-                time.sleep(5)
+                deadline.sleep(5)
                 break
 
-            time.sleep(1)
+            deadline.sleep(1)
 
     def test_1(self):
         print("test_1 start")
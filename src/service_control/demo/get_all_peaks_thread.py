@@ -13,6 +13,7 @@ from src.device_control import (
 )
 
 from src.service_control.sepu.sepu_service import SepuService
+from src.service_control.liquid_handling.liquid_service import LiquidHandlingService, LiquidStep
 
 params_1 = {
     "start_ratio": 100.0,
@@ -80,14 +81,12 @@ class TaskController:
             self._pause.set()
 
 
+liquid_service = LiquidHandlingService(pump_device, pump_sample)
+
+
 def wash_needle():
-    pump_device.start_waste_liquid()
-    time.sleep(3)
-    pump_device.start_washing_liquid()
-    response = pump_sample.send_command('A10000M2000A0M2000A10000M2000A0')
-    pump_sample.sync()
-    pump_device.start_waste_liquid()
-    robot_controller.task_scara_put_tool()
+    put_tool = LiquidStep("put_tool", robot_controller.task_scara_put_tool, ("robot",))
+    return liquid_service.wash_needle('A10000M2000A0M2000A10000M2000A0', settle_s=3, then=[put_tool])
 
 
 def start_experiment(task_ctrl: TaskController, params_1: dict, big_bottle_volume, small_bottle_volume, column_id,
@@ -131,14 +130,13 @@ def start_experiment(task_ctrl: TaskController, params_1: dict, big_bottle_volum
     print(f"Inject Response: {response}")
     pump_sample.sync()
 
-    wash_needle_thread = threading.Thread(target=wash_needle)
-    wash_needle_thread.start()
+    wash_needle_job = wash_needle()
 
     print(f"{datetime.datetime.now()}🧪 5. 开始色谱实验")
     sepu_api.set_start_tube(1, 1)
     sepu_api.start_column(experiment_time_min)
     sepu_api.update_line_pause()
-    wash_needle_thread.join()
+    wash_needle_job.wait()
 
 def small_to_xuanzhegn(task_ctrl: TaskController, params_1: dict, big_bottle_volume, small_bottle_volume, column_id,
                        wash_time_min, experiment_time_min, sample_id, penlin_time_s, peak_number, small_position_id,
@@ -13,7 +13,10 @@ from src.device_control import (
     inject_height
 )
 
+from src.device_control.robot_control.lookahead import RobotLookahead
+from src.device_control.robot_control.motion_planner import MotionPlanner
 from src.service_control.sepu.sepu_service import SepuService
+from src.service_control.liquid_handling.liquid_service import LiquidHandlingService, LiquidStep
 
 params_1 = {
     "start_ratio": 100.0,
@@ -82,14 +85,16 @@ class TaskController:
             self._pause.set()
 
 
+liquid_service = LiquidHandlingService(pump_device, pump_sample)
+# 按 motion_transitions.json 合并相邻的机械臂动作
+motion_planner = MotionPlanner(robot_controller)
+# 设备快结束时机械臂提前到下一工位附近（配置 robot.lookahead）
+robot_lookahead = RobotLookahead(robot_controller)
+
+
 def wash_needle():
-    pump_device.start_waste_liquid()
-    time.sleep(3)
-    pump_device.start_washing_liquid()
-    response = pump_sample.send_command('A10000M2000A0M2000A10000M2000A0')
-    pump_sample.sync()
-    pump_device.start_waste_liquid()
-    robot_controller.task_scara_put_tool()
+    put_tool = LiquidStep("put_tool", robot_controller.task_scara_put_tool, ("robot",))
+    return liquid_service.wash_needle('A10000M2000A0M2000A10000M2000A0', settle_s=3, then=[put_tool])
 
 
 
@@ -144,9 +149,8 @@ def start_experiment(task_ctrl: TaskController, params_1: dict, big_bottle_volum
     print(f"Inject Response: {response}")
     pump_sample.sync()
 
-    wash_needle_thread = threading.Thread(target=wash_needle)
-    wash_needle_thread.start()
-    wash_needle_thread.join()
+    wash_needle_job = wash_needle()
+    wash_needle_job.wait()
 
 
 
@@ -174,12 +178,14 @@ def small_to_xuanzhegn(task_ctrl: TaskController, params_1: dict, big_bottle_vol
     robot_controller.clean_to_xuanzheng()
 
     print(f"{datetime.datetime.now()}💨 13. 再次旋蒸")
-    xuanzheng_controller.vacuum_until_below_threshold()
+    with robot_lookahead.watch("xuanzheng_vacuum") as progress:
+        xuanzheng_controller.vacuum_until_below_threshold(on_progress=progress)
     robot_controller.robot_to_home()
 
     xuanzheng_controller.set_height(small_bottle_volume)
     xuanzheng_controller.run_evaporation()
-    xuanzheng_controller.xuanzheng_sync(xuanzheng_timeout_min)
+    with robot_lookahead.watch("xuanzheng", expected_s=xuanzheng_timeout_min * 60) as progress:
+        xuanzheng_controller.xuanzheng_sync(xuanzheng_timeout_min, on_progress=progress)
     xuanzheng_controller.set_height(0)
 
     print(f"{datetime.datetime.now()}📦 14. 入库操作")
@@ -187,8 +193,7 @@ def small_to_xuanzhegn(task_ctrl: TaskController, params_1: dict, big_bottle_vol
     xuanzheng_controller.drain_until_above_threshold()
     xuanzheng_controller.start_waste_liquid()
 
-    robot_controller.robot_to_home()
-    robot_controller.xuanzheng_to_warehouse(warehouse_id)
+    motion_planner.execute([("robot_to_home",), ("xuanzheng_to_warehouse", warehouse_id)])
     global global_warehouse_id
     global_warehouse_id = global_warehouse_id +1
 
@@ -200,7 +205,8 @@ def big_to_xuanzheng(task_ctrl: TaskController, params_1: dict, big_bottle_volum
     robot_controller.collect_to_xuanzheng(bottle_id)
 
     print(f"{datetime.datetime.now()}💨 8. 旋蒸开始")
-    xuanzheng_controller.vacuum_until_below_threshold()
+    with robot_lookahead.watch("xuanzheng_vacuum") as progress:
+        xuanzheng_controller.vacuum_until_below_threshold(on_progress=progress)
     robot_controller.robot_to_home()
     xuanzheng_controller.set_height(big_bottle_volume)
     xuanzheng_controller.run_evaporation()
@@ -210,7 +216,8 @@ def big_to_xuanzheng(task_ctrl: TaskController, params_1: dict, big_bottle_volum
     clean_thread = threading.Thread(target=robot_controller.small_big_to_clean, args=(small_position_id,))
     clean_thread.start()
 
-    xuanzheng_controller.xuanzheng_sync(xuanzheng_timeout_min)
+    with robot_lookahead.watch("xuanzheng", expected_s=xuanzheng_timeout_min * 60) as progress:
+        xuanzheng_controller.xuanzheng_sync(xuanzheng_timeout_min, on_progress=progress)
     xuanzheng_controller.set_height(0)
 
     print(f"{datetime.datetime.now()}🤖 9. 旋蒸结束取瓶,并且排出废液")
@@ -231,29 +238,24 @@ def clean_and_transfer(task_ctrl: TaskController, params_1: dict, big_bottle_vol
 
     gear_pump.start_pump(penlin_time_s)
 
-    robot_controller.abb_clean_ok()
-    robot_controller.clean_to_home()
-    robot_controller.task_shake_the_flask_py()
-    robot_controller.transfer_to_clean()
+    motion_planner.execute([("abb_clean_ok",), ("clean_to_home",), ("task_shake_the_flask_py",),
+                            ("transfer_to_clean",)])
 
     if small_bottle_volume == 50:
         print(f"🧽 50ml瓶已装满，先进行旋蒸")
         robot_controller.get_transfer_needle()
         pump_device.start_pump()
-        robot_controller.transfer_finish_flag()
-
-        robot_controller.scara_to_home()
-        robot_controller.clean_to_xuanzheng()
-        xuanzheng_controller.vacuum_until_below_threshold()
+        motion_planner.execute([("transfer_finish_flag",), ("scara_to_home",), ("clean_to_xuanzheng",)])
+        with robot_lookahead.watch("xuanzheng_vacuum") as progress:
+            xuanzheng_controller.vacuum_until_below_threshold(on_progress=progress)
         robot_controller.robot_to_home()
         xuanzheng_controller.set_height(small_bottle_volume)
         xuanzheng_controller.run_evaporation()
-        xuanzheng_controller.xuanzheng_sync(xuanzheng_timeout_min)
+        with robot_lookahead.watch("xuanzheng", expected_s=xuanzheng_timeout_min * 60) as progress:
+            xuanzheng_controller.xuanzheng_sync(xuanzheng_timeout_min, on_progress=progress)
         xuanzheng_controller.set_height(0)
         xuanzheng_controller.start_waste_liquid()
-        robot_controller.get_xuanzheng()
-        robot_controller.robot_to_home()
-        robot_controller.small_put_clean()
+        motion_planner.execute([("get_xuanzheng",), ("robot_to_home",), ("small_put_clean",)])
 
     for i in range(2):
         print(f"🧽 11-{i + 1}. 清洗轮次")
@@ -268,8 +270,7 @@ def clean_and_transfer(task_ctrl: TaskController, params_1: dict, big_bottle_vol
 
     robot_controller.get_transfer_needle()
     pump_device.start_pump()
-    robot_controller.transfer_finish_flag()
-    robot_controller.scara_to_home()
+    motion_planner.execute([("transfer_finish_flag",), ("scara_to_home",)])
 
 
 
@@ -283,7 +284,8 @@ def collect(task_ctrl: TaskController, params_1: dict, big_bottle_volume, small_
         inject_height.down_height()
 
 
-        code = sepu_api.select_retain_tubes(peak_number)
+        with robot_lookahead.watch("collect") as progress:
+            code = sepu_api.select_retain_tubes(peak_number, on_progress=progress)
         if code == 600:
             print("无峰出现，清空试管")
             save_experiment_data_thread = threading.Thread(target=sepu_api.save_experiment_data)
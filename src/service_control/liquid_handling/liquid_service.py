@@ -0,0 +1,145 @@
+import itertools
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, List, Tuple
+
+from src.com_control import plc_registry
+from src.uilt.deadline_control import setup as deadline
+from src.uilt.logs_control.setup import service_control_logger
+
+
+@dataclass
+class LiquidStep:
+    name: str
+    action: Callable[[], Any]
+    resources: Tuple[str, ...] = ()
+
+
+class LiquidJob:
+    def __init__(self, job_id, name, steps: List[LiquidStep]):
+        """
+        Ordered group of liquid-handling steps
+        :param job_id: Sequence number assigned by the service
+        :param name: Job name reported in completion events
+        :param steps: Steps run one after another
+        """
+        self.id = job_id
+        self.name = name
+        self.steps = steps
+        self.future = Future()
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def wait(self, timeout=None):
+        """Block until the job is finished, re-raising its error"""
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+    def __repr__(self):
+        return f"LiquidJob({self.id}, {self.name})"
+
+
+class LiquidHandlingService:
+    WASTE_VALVE = "waste_valve"
+    WASHING_VALVE = "washing_valve"
+    SYRINGE_PUMP = "syringe_pump"
+
+    WASH_NEEDLE_PROGRAM = "A10000M2000A0M2000A10000M2000A0"
+
+    def __init__(self, peristaltic_pump, syringe_pump, scheduler=None):
+        """
+        Queued wash/waste routing over the peristaltic pump valves and the syringe pump
+        :param peristaltic_pump: PeristalticPump driving the washing and waste valves
+        :param syringe_pump: PumpSample used for needle washing programs
+        :param scheduler: PLCScanner whose worker threads run the jobs, defaults to the plc_com connection
+        """
+        self.peristaltic_pump = peristaltic_pump
+        self.syringe_pump = syringe_pump
+        self.scheduler = scheduler or plc_registry.scanner("plc_com", mock=peristaltic_pump.mock)
+        self.resource_locks = defaultdict(threading.Lock)
+        self.listeners: List[Callable[[LiquidJob], None]] = []
+        self.ids = itertools.count(1)
+
+    def add_listener(self, callback: Callable[[LiquidJob], None]):
+        """Call `callback(job)` whenever a job finishes, successfully or not"""
+        self.listeners.append(callback)
+
+    def submit(self, name, steps: List[LiquidStep]) -> LiquidJob:
+        """Queue a job on the PLC scheduler and return immediately"""
+        job = LiquidJob(next(self.ids), name, steps)
+        service_control_logger.info(f"Liquid job {job.id} '{name}' queued: {[s.name for s in steps]}")
+        self.scheduler.submit(self._run, job)
+        return job
+
+    def _run(self, job: LiquidJob):
+        if not job.future.set_running_or_notify_cancel():
+            return
+        job.started_at = time.time()
+        try:
+            for step in job.steps:
+                # 按名称顺序加锁，避免两个作业互相等待
+                locks = [self.resource_locks[r] for r in sorted(step.resources)]
+                for lock in locks:
+                    lock.acquire()
+                try:
+                    step.action()
+                finally:
+                    for lock in reversed(locks):
+                        lock.release()
+            job.finished_at = time.time()
+            job.future.set_result(job.finished_at - job.started_at)
+            service_control_logger.info(f"Liquid job {job.id} '{job.name}' finished in "
+                                        f"{job.finished_at - job.started_at:.1f}s")
+        except Exception as e:
+            job.finished_at = time.time()
+            service_control_logger.error(f"Liquid job {job.id} '{job.name}' failed: {e}")
+            job.future.set_exception(e)
+        for callback in self.listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                service_control_logger.error(f"Liquid job listener failed: {e}")
+
+    def waste_step(self):
+        return LiquidStep("waste", self.peristaltic_pump.start_waste_liquid, (self.WASTE_VALVE,))
+
+    def washing_step(self):
+        return LiquidStep("washing", self.peristaltic_pump.start_washing_liquid, (self.WASHING_VALVE,))
+
+    def syringe_step(self, program):
+        def run():
+            self.syringe_pump.send_command(program)
+            self.syringe_pump.sync()
+        return LiquidStep(f"syringe {program}", run, (self.SYRINGE_PUMP,))
+
+    def waste(self) -> LiquidJob:
+        return self.submit("waste", [self.waste_step()])
+
+    def wash(self) -> LiquidJob:
+        return self.submit("wash", [self.washing_step()])
+
+    def syringe(self, program) -> LiquidJob:
+        return self.submit("syringe", [self.syringe_step(program)])
+
+    def wash_needle(self, program=WASH_NEEDLE_PROGRAM, settle_s=3, then: List[LiquidStep] = ()) -> LiquidJob:
+        """
+        Waste, settle, washing liquid, syringe wash program, waste again
+        :param program: Syringe pump program run with washing liquid
+        :param settle_s: Wait between the first waste pulse and the washing liquid
+        :param then: Extra steps appended to the job, e.g. returning the tool with the robot
+        """
+        steps = [
+            self.waste_step(),
+            LiquidStep("settle", lambda: deadline.sleep(settle_s)),
+            self.washing_step(),
+            self.syringe_step(program),
+            self.waste_step(),
+            *then,
+        ]
+        return self.submit("wash_needle", steps)
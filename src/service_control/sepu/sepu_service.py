@@ -9,6 +9,7 @@ import threading
 
 from PIL.ImagePalette import sepia
 
+from src.uilt.deadline_control import setup as deadline
 from src.uilt.logs_control.setup import service_control_logger
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtWidgets import (
@@ -113,7 +114,10 @@ class SepuService:
 
         service_control_logger.info('结束执行 get_experiment_data 函数')
 
-    def select_retain_tubes(self,peak_id):
+    def select_retain_tubes(self,peak_id, on_progress=None):
+        """
+        :param on_progress: 等待收集完成时每次查询后调用 on_progress(done=bool)
+        """
         service_control_logger.info('开始执行 select_retain_tubes 函数')
 
         """ 打开 PlotWithInputs 窗口，获取 tube_entries """
@@ -184,14 +188,16 @@ class SepuService:
             result = self.sepu_api.get_tube(task_list)
             print("获取试管结果:")
             print(json.dumps(result, indent=2))
-            time.sleep(10)
+            deadline.sleep(10)
 
         while True:
             result = self.sepu_api.get_tube_status()
             print(f"收集液体:",result)
+            if on_progress:
+                on_progress(done=result["status"] == True)
             if result["status"] == True:
                 return 0
-            time.sleep(2)
+            deadline.sleep(2)
 
     def select_retain_tubes_by_id(self, peak_id):
         service_control_logger.info('开始执行 select_retain_tubes 函数')
@@ -243,14 +249,14 @@ class SepuService:
             result = self.sepu_api.get_tube(task_list)
             print("获取试管结果:")
             print(json.dumps(result, indent=2))
-            time.sleep(10)
+            deadline.sleep(10)
 
         while True:
             result = self.sepu_api.get_tube_status()
             print(f"收集液体:", result)
             if result["status"] == True:
                 return 0
-            time.sleep(2)
+            deadline.sleep(2)
 
     def get_peaks_num(self):
         peak = self.sepu_api.get_peaks_num()
@@ -312,7 +318,7 @@ class SepuService:
             result = self.sepu_api.get_tube(task_list)
             print("获取试管结果:")
             print(json.dumps(result, indent=2))
-            time.sleep(1)
+            deadline.sleep(1)
 
         print("-------- 清洗的 tubes --------", self.clean_tube_list)
 
@@ -358,7 +364,7 @@ class SepuService:
         self.sepu_api.column_equilibration(wash_time_min)
         wash_time = wash_time_min * 60 + 5
 
-        time.sleep(wash_time)
+        deadline.sleep(wash_time)
 
         service_control_logger.info('结束执行 wash_column 函数')
         return result
@@ -375,7 +381,7 @@ class SepuService:
         service_control_logger.info('开始执行 update_line_start 函数')
 
         self.sepu_api.update_line_start()
-        time.sleep(2)
+        deadline.sleep(2)
 
         service_control_logger.info('结束执行 update_line_start 函数')
 
@@ -383,7 +389,7 @@ class SepuService:
         service_control_logger.info('开始执行 update_line_terminate 函数')
 
         self.sepu_api.update_line_terminate()
-        time.sleep(5)
+        deadline.sleep(5)
 
         service_control_logger.info('结束执行 update_line_terminate 函数')
 
@@ -393,7 +399,7 @@ class SepuService:
         # #
         # # self.sepu_api.set_sample_valve()
         # # self.update_line_start()
-        time.sleep(experiment_time_min*60)
+        deadline.sleep(experiment_time_min*60)
         # self.waiting_exeperiment_terminating()
 
         service_control_logger.info('结束执行 start_column 函数')
@@ -450,14 +456,14 @@ class SepuService:
             result = self.sepu_api.get_tube(task_list)
             print("获取试管结果:")
             print(json.dumps(result, indent=2))
-            time.sleep(10)
+            deadline.sleep(10)
 
         while True:
             result = self.sepu_api.get_tube_status()
             print(f"收集液体:", result)
             if result["status"] == True:
                 return
-            time.sleep(2)
+            deadline.sleep(2)
 
             # threading_cut = threading.Thread(target=execute_task)
             # threading_cut.start()
@@ -490,7 +496,7 @@ class SepuService:
         等待实验终止
         """
         while not self.is_terminated():
-            time.sleep(5)
+            deadline.sleep(5)
         print("实验已终止")
 
 if __name__ == '__main__':
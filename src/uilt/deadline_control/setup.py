@@ -0,0 +1,152 @@
+import functools
+import threading
+import time
+from concurrent.futures import Future, FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait
+
+# 每个线程当前生效的截止时间栈
+_local = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The active deadline ran out or was cancelled"""
+
+
+class Deadline:
+    def __init__(self, seconds=None, name="deadline", parent=None):
+        """
+        Thread-safe time budget for a group of blocking device calls
+        Entering it (`with Deadline(30):`) makes it current for the thread; waits in the robot, PLC, HTTP and pump
+        code bound themselves by it. Nested deadlines never extend the enclosing one.
+        :param seconds: Budget from now, None for no time limit (cancellation only)
+        :param name: Shown in DeadlineExceeded messages
+        :param parent: Enclosing deadline, defaults to the current one of this thread
+        """
+        self.name = name
+        self.parent = parent if parent is not None else current()
+        self.at = None if seconds is None else time.monotonic() + seconds
+        if self.parent is not None and self.parent.at is not None:
+            self.at = self.parent.at if self.at is None else min(self.at, self.parent.at)
+        self.reason = None
+        # cancel() 时完成，用来唤醒所有正在等待的调用
+        self._cancelled = Future()
+        if self.parent is not None:
+            self.parent._cancelled.add_done_callback(lambda _: self.cancel(f"{self.parent.name} cancelled"))
+
+    def remaining(self):
+        """Seconds left, None without a time limit"""
+        if self.at is None:
+            return None
+        return max(self.at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return self.cancelled or (self.at is not None and time.monotonic() >= self.at)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.done()
+
+    def cancel(self, reason="cancelled"):
+        """Stop every wait bound by this deadline, from any thread"""
+        if not self._cancelled.done():
+            self.reason = reason
+            try:
+                self._cancelled.set_result(reason)
+            except Exception:
+                pass
+
+    def check(self):
+        """Raise DeadlineExceeded once the deadline has run out or was cancelled"""
+        if self.cancelled:
+            raise DeadlineExceeded(f"{self.name} cancelled: {self.reason}")
+        if self.at is not None and time.monotonic() >= self.at:
+            raise DeadlineExceeded(f"{self.name} exceeded")
+
+    def bound(self, timeout=None):
+        """`timeout` shortened to the time left, raising when nothing is left"""
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def sleep(self, seconds):
+        """time.sleep that wakes up early and raises when the deadline ends"""
+        timeout = self.bound(seconds)
+        wait([self._cancelled], timeout=timeout)
+        if self.cancelled or timeout < seconds:
+            self.check()
+
+    def wait_future(self, future: Future, timeout=None):
+        """
+        future.result(timeout) bounded by the deadline
+        Raises DeadlineExceeded when the deadline ends first, FutureTimeoutError when only `timeout` ran out.
+        """
+        done, _ = wait([future, self._cancelled], timeout=self.bound(timeout), return_when=FIRST_COMPLETED)
+        if future in done:
+            return future.result()
+        if self.expired():
+            self.check()
+        raise FutureTimeoutError()
+
+    def wrap(self, func):
+        """Callable running `func` with this deadline current, for threads and executors"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.stack.remove(self)
+        return False
+
+    def __repr__(self):
+        return f"Deadline({self.name}, remaining={self.remaining()}, cancelled={self.cancelled})"
+
+
+def current():
+    """Innermost deadline entered by this thread, None outside any"""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def bounded(timeout=None):
+    """`timeout` limited by the current deadline; unchanged when there is none"""
+    deadline = current()
+    return timeout if deadline is None else deadline.bound(timeout)
+
+
+def check():
+    deadline = current()
+    if deadline is not None:
+        deadline.check()
+
+
+def sleep(seconds):
+    """Deadline-aware time.sleep"""
+    deadline = current()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.sleep(seconds)
+
+
+def wait_future(future: Future, timeout=None):
+    """Deadline-aware future.result(timeout)"""
+    deadline = current()
+    if deadline is None:
+        return future.result(timeout)
+    return deadline.wait_future(future, timeout)
+
+
+def propagate(func):
+    """Bind `func` to the caller's current deadline, if any, before handing it to another thread"""
+    deadline = current()
+    return func if deadline is None else deadline.wrap(func)
@@ -0,0 +1,49 @@
+import threading
+
+from src.device_control.robot_control.lookahead import RobotLookahead
+
+
+class _Connection:
+    mock = False
+
+    def is_connected(self):
+        return True
+
+
+class _FaultPolicy:
+    held = {}
+
+
+class _Controller:
+    timing = None
+
+    def __init__(self):
+        self.connection = _Connection()
+        self.fault_policy = _FaultPolicy()
+        self.command_lock = threading.RLock()
+        self.ready = True
+        self.last_finish_at = 0.0
+        self.sent = []
+
+    def _execute_scenario(self, cmd_full, expected_response):
+        with self.command_lock:
+            self.sent.append(cmd_full)
+
+
+SETTINGS = {"enabled": True, "margin_s": 1, "stations": {"xuanzheng": {"staging": "task_stage_py()", "travel_s": 5}}}
+
+
+def test_staging_waits_while_another_thread_holds_the_robot():
+    controller = _Controller()
+    lookahead = RobotLookahead(controller, SETTINGS)
+    with lookahead.watch("xuanzheng") as progress:
+        # 并行线程正在执行指令：预动作不能插进来
+        controller.command_lock.acquire()
+        progress(remaining_s=3)
+        progress.thread.join()
+        assert controller.sent == []
+        assert progress.blocked_by == "robot_idle"
+        controller.command_lock.release()
+        progress(remaining_s=2)
+    assert controller.sent == ["task_stage_py()"]
+
@@ -0,0 +1,59 @@
+import inspect
+
+import pytest
+
+from src.device_control.robot_control.motion_planner import COMMAND_TABLE, MotionPlanner
+from src.device_control.robot_control.robot_device_new import RobotController
+
+
+class _Recorder:
+    """Collects the commands a RobotController method sends"""
+
+    def __init__(self):
+        self.commands = []
+
+    def _execute_scenario(self, cmd_full, expected_response):
+        self.commands.append(cmd_full)
+
+    def run_macro(self, commands, depth=None):
+        self.commands.extend(commands)
+
+
+class _Controller(_Recorder):
+    timing = None
+    min_command_gap_s = 0.2
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def xuanzheng_to_warehouse(self, position_id):
+        self.calls.append(("xuanzheng_to_warehouse", position_id))
+
+
+@pytest.mark.parametrize("method", sorted(COMMAND_TABLE))
+def test_command_table_matches_controller(method):
+    args = [3] * (len(inspect.signature(getattr(RobotController, method)).parameters) - 1)
+    recorder = _Recorder()
+    getattr(RobotController, method)(recorder, *args)
+    assert MotionPlanner.commands_for(method, *args) == recorder.commands
+
+
+def test_out_of_range_step_runs_through_the_controller():
+    """A call whose real method would prompt the operator is not planned, and plan() never prompts"""
+    controller = _Controller()
+    planner = MotionPlanner(controller)
+    plan = planner.plan([("robot_to_home",), ("xuanzheng_to_warehouse", 20)])
+    assert plan.unplanned == ["xuanzheng_to_warehouse"]
+    assert plan.merges == 0
+    planner.run(plan)
+    assert controller.commands == ["Vacuum_ok"]
+    assert controller.calls == [("xuanzheng_to_warehouse", 20)]
+
+
+def test_put_and_pick_of_a_flask_are_kept():
+    controller = _Controller()
+    plan = MotionPlanner(controller).plan([("robot_to_home",), ("transfer_to_clean",), ("clean_to_home",)])
+    assert plan.removed == []
+    assert [command for move in plan.moves for command in move.commands] == [
+        "Vacuum_ok", "task_flask_move_py(15,0)", "task_flask_move_py(15,1)"]
@@ -0,0 +1,36 @@
+import threading
+
+from src.com_control.plc_capture import FC_MARK, PLCRecorder, load_capture, summarize
+
+
+class _Bits:
+    bits = [True, False, True]
+
+
+def test_chinese_step_labels_round_trip(tmp_path):
+    path = str(tmp_path / "capture.bin")
+    recorder = PLCRecorder(path)
+    recorder.mark("旋蒸开始")
+    recorder.record("read_coils", (316, 3), _Bits(), 0, 1.0, 0.01)
+    recorder.mark("step 2")
+    recorder.close()
+    records = load_capture(path)
+    assert [r.label for r in records if r.function_code == FC_MARK] == ["旋蒸开始", "step 2"]
+    assert summarize(records)["旋蒸开始"]["transactions"] == 1
+
+
+def test_writes_after_close_are_dropped(tmp_path):
+    path = str(tmp_path / "capture.bin")
+    recorder = PLCRecorder(path)
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            recorder.record("write_coil", (306, True), None, 0, 1.0, 0.01)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    recorder.close()
+    stop.set()
+    thread.join()
+    assert len(load_capture(path)) == recorder.count
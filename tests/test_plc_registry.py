@@ -0,0 +1,49 @@
+import pytest
+
+from src.com_control.plc_registry import PLCScanner
+
+
+class FakePLC:
+    host = "fake"
+
+    def __init__(self):
+        self.coils = {}
+        self.online = True
+
+    def read_coils(self, start, count):
+        if not self.online:
+            return None
+        return [self.coils.get(address, False) for address in range(start, start + count)]
+
+
+def test_failed_read_does_not_resolve_from_stale_snapshot():
+    plc = FakePLC()
+    scanner = PLCScanner(plc)
+    plc.coils[316] = True
+    first = scanner.watch_coil(316, True)
+    scanner.scan()
+    assert first.done()
+    # 线圈已复位但本次读取失败，不能按上一轮的 True 完成新的等待
+    plc.coils[316] = False
+    plc.online = False
+    second = scanner.watch_coil(316, True)
+    scanner.scan()
+    assert not second.done()
+    assert 316 not in scanner.snapshot
+    plc.online = True
+    scanner.scan()
+    assert not second.done()
+    scanner.close()
+
+
+def test_close_stops_threads_and_fails_waiters():
+    scanner = PLCScanner(FakePLC(), interval=0.05)
+    job = scanner.every(0.05, lambda: None)
+    future = scanner.watch_coil(316, True)
+    scanner.close()
+    assert not scanner.thread.is_alive()
+    assert job.cancelled
+    with pytest.raises(ConnectionError):
+        future.result(0)
+    with pytest.raises(RuntimeError):
+        scanner.submit(lambda: None)
@@ -0,0 +1,34 @@
+import time
+
+from src.com_control.plc_simulator import PLCSimulator
+
+
+def _run_gear_pump(simulator, time_ms):
+    """Client writes in GearPump._start_timer order: start coil, then the run time"""
+    simulator.coils.setValues(simulator.GEAR_START, [True])
+    simulator.registers.setValues(simulator.GEAR_TIME_MS, simulator.codec.pack("int32", [time_ms]))
+
+
+def _gear_finished(simulator):
+    return bool(simulator.coils.getValues(simulator.GEAR_FINISH, 1)[0])
+
+
+def test_gear_pump_runs_twice():
+    """The second run must wait for its own timer instead of seeing the first run's finish bit"""
+    simulator = PLCSimulator()
+    for _ in range(2):
+        _run_gear_pump(simulator, 200)
+        assert not _gear_finished(simulator)
+        time.sleep(0.1)
+        assert not _gear_finished(simulator)
+        time.sleep(0.3)
+        assert _gear_finished(simulator)
+        assert not simulator.coils.getValues(simulator.GEAR_START, 1)[0]
+
+
+def test_gear_start_resets_finish_without_rising_edge():
+    simulator = PLCSimulator()
+    simulator.coils.set_internal(simulator.GEAR_START, [True])
+    simulator.coils.set_internal(simulator.GEAR_FINISH, [True])
+    simulator.coils.setValues(simulator.GEAR_START, [True])
+    assert not _gear_finished(simulator)
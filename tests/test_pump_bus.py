@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from src.com_control.pump_bus import AsyncPumpBusRegistry, PumpBus
+from src.com_control.pump_simulator import PumpSimulator
+from src.device_control import pump_sample_async
+
+
+@pytest.fixture
+def simulator():
+    simulator = PumpSimulator(port=0, addresses=(1,), reply_delay_s=0, initialized=True)
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+class _Socket:
+    """Records the payload of every sendall around a real socket"""
+
+    def __init__(self, sock, payloads):
+        self.sock = sock
+        self.payloads = payloads
+
+    def sendall(self, data):
+        self.payloads.append((time.monotonic(), data))
+        self.sock.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def _transact(bus, commands):
+    bus.connect()
+    payloads = []
+    bus.sock = _Socket(bus.sock, payloads)
+    replies = bus.transact(1, commands)
+    bus.close()
+    return replies, payloads
+
+
+def test_one_frame_in_flight_by_default(simulator):
+    bus = PumpBus(simulator.host, simulator.port, turnaround_s=0.05)
+    bus.attach(1)
+    assert not bus.pipelined
+    replies, payloads = _transact(bus, ["Q", "?", "?6"])
+    assert [reply.data for reply in replies] == ["", "0", "I"]
+    assert [data for _, data in payloads] == [b"/1QR\r\n", b"/1?R\r\n", b"/1?6R\r\n"]
+    # 每帧之间至少间隔 turnaround_s
+    gaps = [later - earlier for (earlier, _), (later, _) in zip(payloads, payloads[1:])]
+    assert min(gaps) >= 0.05
+
+
+def test_pipeline_is_opt_in(simulator):
+    bus = PumpBus(simulator.host, simulator.port, pipeline=True)
+    bus.attach(1)
+    replies, payloads = _transact(bus, ["Q", "?"])
+    assert len(replies) == 2
+    assert len(payloads) == 1
+    bus.attach(2)
+    assert not bus.pipelined
+
+
+def test_async_pumps_on_one_gateway_share_a_bus(simulator, monkeypatch):
+    registry = AsyncPumpBusRegistry(settings={})
+    monkeypatch.setattr(pump_sample_async, "async_pump_buses", registry)
+    first = pump_sample_async.AsyncPumpSample(host=simulator.host, port=simulator.port, address=1)
+    second = pump_sample_async.AsyncPumpSample(host=simulator.host, port=simulator.port, address=2)
+    assert first.bus is second.bus
+    assert first.bus.addresses == {"1", "2"}
+    assert not first.bus.pipelined
+    asyncio.run(registry.close())
+    assert registry.buses == {}
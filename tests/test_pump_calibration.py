@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from src.device_control.pump_calibration import PumpCalibration, PumpNotCalibrated
+
+
+def _table(tmp_path, points):
+    path = tmp_path / "pump_calibration.json"
+    path.write_text(json.dumps({"pump": {"points": points, "overhead_s": 2.0}}), encoding="utf-8")
+    return str(path)
+
+
+def test_record_writes_measurements_not_the_table(tmp_path):
+    path = _table(tmp_path, [[0, 0], [10, 20]])
+    measurements = str(tmp_path / "measurements.json")
+    calibration = PumpCalibration("pump", path, measurements)
+    assert calibration.run_time(5) == 10
+    calibration.record(5, 10, 12, 14)
+    with open(path, encoding="utf-8") as f:
+        assert "history" not in json.load(f)["pump"]
+    reloaded = PumpCalibration("pump", path, measurements)
+    assert reloaded.overhead_s == calibration.overhead_s != 2.0
+    assert len(reloaded.history) == 1
+
+
+@pytest.mark.parametrize("points", [[[10, 20]], [[0, 0], [10, 20], [10, 30]], [[10, 20], [0, 0]]])
+def test_invalid_table_is_rejected_on_load(tmp_path, points):
+    with pytest.raises(ValueError):
+        PumpCalibration("pump", _table(tmp_path, points), str(tmp_path / "measurements.json"))
+
+
+def test_pump_without_points_refuses_to_dose(tmp_path):
+    calibration = PumpCalibration("pump", _table(tmp_path, []), str(tmp_path / "measurements.json"))
+    assert not calibration.calibrated
+    with pytest.raises(PumpNotCalibrated):
+        calibration.run_time(5)
+    missing = PumpCalibration("other", _table(tmp_path, [[0, 0], [10, 20]]), str(tmp_path / "measurements.json"))
+    with pytest.raises(PumpNotCalibrated):
+        missing.expected_duration(5)
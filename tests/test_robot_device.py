@@ -0,0 +1,101 @@
+import pytest
+
+from src.com_control import robot_com
+from src.com_control.robot_fault_policy import FaultAction, FaultRule
+from src.com_control.robot_simulator import RobotSimulator
+from src.device_control.robot_control.robot_device_new import RobotController
+from src.device_control.sqlite.robot_timing import RobotTimingDB
+from src.uilt.deadline_control import setup as deadline
+
+
+@pytest.fixture
+def simulator():
+    simulator = RobotSimulator(port=0, durations={"task_test_py": 0.3}, ack_delay_s=0.01)
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def controller(simulator, monkeypatch, tmp_path):
+    # 链路检测挂到 Mock PLC 的扫描周期上，测试不需要真实 PLC
+    scanner = robot_com.plc_registry.scanner
+    monkeypatch.setattr(robot_com.plc_registry, "scanner", lambda name, mock=False: scanner(name, mock=True))
+    controller = RobotController(mock=False, fallback_delay_s=0, min_command_gap_s=0,
+                                 ip=simulator.host, port=simulator.port,
+                                 timing=RobotTimingDB(str(tmp_path / "timing.sqlite")))
+    controller.fault_policy.rules = [
+        FaultRule(failure="ack_timeout", action=FaultAction.RETRY, max_retries=1, retry_delay_s=0),
+        FaultRule(failure="*", action=FaultAction.ABORT),
+    ]
+    timeouts = {"send_ok": 0.5, "ok_finish": 3}
+    controller._timeout = lambda cmd_full, phase, default: timeouts[phase]
+    yield controller
+    controller.connection.close()
+
+
+def test_ack_timeout_is_retried(simulator, controller):
+    """A command lost on the wire is resent once, and the retry gets its own ok and _finish"""
+    simulator.faults["task_test_py(1)"] = "drop_command"
+    controller._execute_scenario("task_test_py(1)", "task_test_py(1)_finish")
+    assert [cmd for _, cmd, _, _ in simulator.history] == ["task_test_py(1)"]
+    assert controller.ready
+    # 失败那次发送的等待者已移除，不会占着 pending 让 ping 停用
+    assert controller.connection.pending == {}
+    assert [incident.failure for incident in controller.fault_policy.incidents] == ["ack_timeout"]
+
+
+def test_late_finish_does_not_complete_retry(simulator, controller):
+    """The _finish of an attempt whose ok was lost arrives before the retry and must not be taken for the retry's"""
+    simulator.durations["task_test_py"] = 0.7
+    simulator.faults["task_test_py(2)"] = "drop_ack"
+    controller.fault_policy.rules[0].retry_delay_s = 1
+    controller._execute_scenario("task_test_py(2)", "task_test_py(2)_finish")
+    # 返回时重试的那次也已执行完
+    assert [cmd for _, cmd, _, _ in simulator.history] == ["task_test_py(2)", "task_test_py(2)"]
+    assert not controller.connection.messages
+
+
+def test_pipelined_ack_timeout_is_not_resent(simulator, controller):
+    """An ok lost while the previous command runs escalates to HOLD instead of resending the command"""
+    simulator.faults["task_test_py(4)"] = "drop_ack"
+    controller.fault_policy.hold_timeout_s = 0.2
+    with pytest.raises(TimeoutError):
+        controller.run_macro(["task_test_py(3)", "task_test_py(4)"], depth=2)
+    assert [cmd for _, cmd, _, _ in simulator.history] == ["task_test_py(3)", "task_test_py(4)"]
+    incident = controller.fault_policy.incidents[0]
+    assert (incident.failure, incident.action) == ("ack_timeout", FaultAction.HOLD)
+
+
+def test_pipelined_timings_stay_out_of_statistics(simulator, controller):
+    """Only the command sent while the robot was idle feeds the duration statistics"""
+    controller.run_macro(["task_test_py(5)", "task_test_py(5)"], depth=2)
+    statuses = [row[0] for row in controller.timing.execute_query("SELECT status FROM robot_timing ORDER BY id")]
+    assert statuses == ["ok", "pipelined"]
+    assert len(controller.timing.durations("task_test_py(5)", phase="ok_finish")) == 1
+
+
+def test_macros_wait_for_each_finish_by_default(simulator, controller):
+    """Without pipelining enabled the put of a flask is only sent once the pick reported _finish"""
+    simulator.durations["task_flask_move_py"] = 0.3
+    sent = []
+    send_and_ack = controller._send_and_ack
+
+    def spy(cmd_full, ahead=()):
+        sent.append((cmd_full, len(ahead), len(simulator.history)))
+        return send_and_ack(cmd_full, ahead)
+
+    controller._send_and_ack = spy
+    controller.transfer_to_collect(3, 1)
+    assert controller.pipeline_depth == 1
+    assert sent == [("task_flask_move_py(3,1)", 0, 0), ("task_flask_move_py(17,0)", 0, 1)]
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_deadline_in_macro_is_not_a_fault(simulator, controller, depth):
+    """The caller's deadline ends the macro without a link_down incident or an operator hold"""
+    simulator.durations["task_test_py"] = 2
+    with pytest.raises(deadline.DeadlineExceeded):
+        with deadline.Deadline(0.5):
+            controller.run_macro(["task_test_py(6)", "task_test_py(7)"], depth=depth)
+    assert controller.fault_policy.incidents == []